@@ -1,40 +1,121 @@
 # audio_envelope.py
+"""
+Mouth amplitudes from a WAV: short-time RMS per video frame, normalized to
+[floor..ceil].
+
+- RMS for all frames is computed in one NumPy pass (reshape into
+  frame-sized windows), not per frame in Python.
+- Long files can be read block by block (soundfile.blocks), so memory stays
+  bounded by the block size instead of the file length.
+- Optional attack/release smoothing makes the mouth open quickly and close
+  more slowly, like an envelope follower.
+- Leave n_frames out and it is derived from the audio duration (see
+  frame_count_for), so long replies are not cut short.
+"""
+from __future__ import annotations
+
+import math
 from pathlib import Path
+from typing import Optional
+
 import numpy as np
 import soundfile as sf
 
-def audio_to_envelope(wav_path: Path, n_frames: int, fps: int = 12, floor: float = 0.15, ceil: float = 1.0):
+# Files longer than this are read in blocks when stream=None
+STREAM_SECONDS = 120.0
+
+
+def frame_count_for(wav_path: Path, fps: int = 12, min_frames: int = 1,
+                    max_frames: Optional[int] = None) -> int:
+    """Video frames needed to cover the whole WAV at ``fps`` (header only)."""
+    info = sf.info(str(wav_path))
+    n = math.ceil(info.frames * fps / info.samplerate) if info.samplerate else 0
+    n = max(min_frames, n)
+    return min(n, max_frames) if max_frames else n
+
+
+def _window(sr: int, fps: int) -> int:
+    return max(1, int(sr / fps))
+
+
+def frame_rms(y: np.ndarray, sr: int, fps: int = 12) -> np.ndarray:
+    """RMS of each consecutive 1/fps window of mono ``y``; a partial last window counts."""
+    win = _window(sr, fps)
+    full = len(y) // win
+    frames = y[:full * win].reshape(full, win)  # a view, no copy
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / win)
+    tail = y[full * win:]
+    if len(tail):
+        rms = np.append(rms, np.sqrt(np.dot(tail, tail) / len(tail)))
+    return rms
+
+
+def _mono(y: np.ndarray) -> np.ndarray:
+    return y[:, 0] if y.shape[1] == 1 else y.mean(axis=1)
+
+
+def frame_rms_streaming(wav_path: Path, fps: int = 12, block_frames: int = 256,
+                        max_frames: Optional[int] = None) -> np.ndarray:
+    """frame_rms over the file, read ``block_frames`` video frames at a time."""
+    sr = sf.info(str(wav_path)).samplerate
+    win = _window(sr, fps)
+    out, done = [], 0
+    for block in sf.blocks(str(wav_path), blocksize=win * block_frames, dtype="float32", always_2d=True):
+        # Block size is a multiple of the window, so windows never straddle blocks.
+        out.append(frame_rms(_mono(block), sr, fps))
+        done += len(out[-1])
+        if max_frames is not None and done >= max_frames:
+            break
+    return np.concatenate(out) if out else np.zeros(0)
+
+
+def smooth(a: np.ndarray, fps: int, attack_ms: float = 0.0, release_ms: float = 0.0) -> np.ndarray:
+    """One-pole attack/release follower over per-frame values (0 ms = no smoothing)."""
+    if not (attack_ms or release_ms) or len(a) == 0:
+        return a
+    coef = lambda ms: math.exp(-1000.0 / (ms * fps)) if ms > 0 else 0.0
+    up, down = coef(attack_ms), coef(release_ms)
+    out = np.empty_like(a)
+    prev = a[0]
+    for i, x in enumerate(a):
+        c = up if x > prev else down
+        prev = c * prev + (1.0 - c) * x
+        out[i] = prev
+    return out
+
+
+def audio_to_envelope(wav_path: Path, n_frames: Optional[int] = None, fps: int = 12,
+                      floor: float = 0.15, ceil: float = 1.0, attack_ms: float = 0.0,
+                      release_ms: float = 0.0, stream: Optional[bool] = None):
     """
-    Returns an array of length n_frames with normalized mouth amplitudes [0..1]
+    Returns a list of n_frames normalized mouth amplitudes [floor..ceil]
     based on short-time RMS over the audio. Works with mono/stereo WAV.
+
+    n_frames=None derives the count from the duration. Frames past the end
+    of the audio are silent. stream=None reads files longer than
+    STREAM_SECONDS in blocks.
     """
     wav_path = Path(wav_path)
-    y, sr = sf.read(str(wav_path))  # shape (n,) or (n,2)
-    if y.ndim == 2:
-        y = y.mean(axis=1)
-
-    # total duration and frame window size
-    total_dur = len(y) / sr
-    frame_dur = 1.0 / fps
-    win_size = int(frame_dur * sr)
-    amps = []
-    for i in range(n_frames):
-        start = int(i * win_size)
-        end = start + win_size
-        seg = y[start:end]
-        if len(seg) == 0:
-            val = 0.0
-        else:
-            # RMS -> normalize
-            rms = np.sqrt(np.mean(seg**2)) if np.any(seg) else 0.0
-            val = float(rms)
-        amps.append(val)
+    if n_frames is None:
+        n_frames = frame_count_for(wav_path, fps)
+    if stream is None:
+        info = sf.info(str(wav_path))
+        stream = info.frames > STREAM_SECONDS * info.samplerate
+    if stream:
+        rms = frame_rms_streaming(wav_path, fps, max_frames=n_frames)
+    else:
+        y, sr = sf.read(str(wav_path), dtype="float32", always_2d=True)
+        rms = frame_rms(_mono(y), sr, fps)
+
+    a = np.zeros(n_frames, dtype=np.float64)
+    n = min(n_frames, len(rms))
+    a[:n] = rms[:n]
+    a = smooth(a, fps, attack_ms, release_ms)
 
     # normalize to [floor..ceil]
-    a = np.array(amps, dtype=np.float32)
-    if a.max() > 0:
+    if n_frames and a.max() > 0:
         a = (a - a.min()) / (a.max() - a.min() + 1e-12)
     else:
         a[:] = 0.0
     a = floor + (ceil - floor) * a
-    return a.tolist()
+    return a.astype(np.float32).tolist()
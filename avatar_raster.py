@@ -0,0 +1,177 @@
+# avatar_raster.py
+"""
+Browser-free renderer for the robot avatar (render.engine: native).
+
+Draws the same scene as templates/robot_template.html with Pillow:
+background, card, speech bubble with the comment/reply text, and the robot
+SVG shapes (body, eyes, "Unit 42", mouth). Everything except the inner
+mouth is rasterized once per reply; each frame only redraws the small mouth
+patch for its amplitude, scaled like the template does:
+``scale(1, 0.6 + a*0.8)`` around the mouth group origin.
+
+Output follows the capture_frames contract: frame_%03d.png files in the
+item folder, returns the number of frames written. Geometry mirrors the
+template's CSS at 900x600; text wrapping is close to, not pixel-identical
+with, Chrome's.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, Sequence
+
+from PIL import Image, ImageDraw, ImageFont
+
+W, H = 900, 600
+SS = 2  # supersampling for anti-aliased shapes
+
+BG = (11, 16, 32)
+CARD_TOP, CARD_BOTTOM = (15, 23, 36), (7, 16, 40)
+TEXT = (230, 238, 248)
+CARD = (90, 60, 720, 480)          # x, y, w, h (centered 720x480)
+CARD_PAD, GAP = 18, 12
+# .robot (260x320 at 108,140) centers a 220px .robot-svg with a 200-unit viewBox
+SVG_ORIGIN, SVG_SCALE = (128, 190), 220 / 200
+BUBBLE_X, BUBBLE_W = 108 + 260 + GAP, 720 - 2 * CARD_PAD - 260 - GAP
+BUBBLE_PAD, BUBBLE_MIN_H = 14, 140
+MOUTH_CENTER = (100, 120)          # translate(100,120) in viewBox units
+
+
+def _font(size: int, bold: bool = False):
+    names = (["DejaVuSans-Bold.ttf", "arialbd.ttf", "Arial Bold.ttf"] if bold
+             else ["DejaVuSans.ttf", "arial.ttf", "Arial.ttf"])
+    for name in names:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+def _svg(x: float, y: float) -> tuple[float, float]:
+    """viewBox coords -> supersampled canvas coords."""
+    return ((SVG_ORIGIN[0] + x * SVG_SCALE) * SS, (SVG_ORIGIN[1] + y * SVG_SCALE) * SS)
+
+
+def _svg_rect(x, y, w, h):
+    x0, y0 = _svg(x, y)
+    x1, y1 = _svg(x + w, y + h)
+    return [x0, y0, x1, y1]
+
+
+def _wrap(draw: ImageDraw.ImageDraw, text: str, font, width: int) -> list[str]:
+    lines, line = [], ""
+    for word in text.split():
+        cand = f"{line} {word}".strip()
+        if draw.textlength(cand, font=font) <= width or not line:
+            line = cand
+        else:
+            lines.append(line)
+            line = word
+    if line:
+        lines.append(line)
+    return lines
+
+
+@lru_cache(maxsize=1)
+def _base_layer() -> Image.Image:
+    """Background, card and robot (without the inner mouth); same for every reply."""
+    img = Image.new("RGB", (W * SS, H * SS), BG)
+    cx, cy, cw, ch = (v * SS for v in CARD)
+    grad = Image.new("RGB", (1, ch))
+    for i in range(ch):
+        t = i / max(ch - 1, 1)
+        grad.putpixel((0, i), tuple(round(a + (b - a) * t) for a, b in zip(CARD_TOP, CARD_BOTTOM)))
+    mask = Image.new("L", (cw, ch), 0)
+    ImageDraw.Draw(mask).rounded_rectangle([0, 0, cw - 1, ch - 1], radius=16 * SS, fill=255)
+    img.paste(grad.resize((cw, ch)), (cx, cy), mask)
+
+    d = ImageDraw.Draw(img)
+    d.rounded_rectangle(_svg_rect(20, 20, 160, 140), radius=round(18 * SVG_SCALE * SS), fill=(200, 214, 229))
+    for ex in (70, 130):
+        (x0, y0), (x1, y1) = _svg(ex - 14, 56), _svg(ex + 14, 84)
+        d.ellipse([x0, y0, x1, y1], fill=(189, 224, 255))
+    mx, my = MOUTH_CENTER
+    d.rounded_rectangle(_svg_rect(mx - 40, my - 6, 80, 12), radius=round(6 * SVG_SCALE * SS), fill=(11, 18, 32))
+    tx, ty = _svg(100, 35)
+    d.text((tx, ty), "Unit 42", font=_font(int(10 * SVG_SCALE * SS)), fill=(36, 48, 66), anchor="ms")
+    return img
+
+
+def static_layer(comment: str, reply: str) -> Image.Image:
+    """Full frame minus the inner mouth, at output size; built once per reply."""
+    img = _base_layer().copy().convert("RGBA")
+    f_comment, f_reply = _font(14 * SS), _font(18 * SS, bold=True)
+    d = ImageDraw.Draw(img)
+    inner_w = (BUBBLE_W - 2 * BUBBLE_PAD) * SS
+    c_lines = _wrap(d, f"User said: {comment}", f_comment, inner_w)
+    r_lines = _wrap(d, reply, f_reply, inner_w)
+    c_lh, r_lh = int(14 * 1.2 * SS), int(18 * 1.2 * SS)
+    content_h = len(c_lines) * c_lh + 8 * SS + len(r_lines) * r_lh
+    bubble_h = max(BUBBLE_MIN_H * SS, content_h + 2 * BUBBLE_PAD * SS)
+    bx, by = BUBBLE_X * SS, (CARD[1] + CARD[3] // 2) * SS - bubble_h // 2
+
+    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    od = ImageDraw.Draw(overlay)
+    od.rounded_rectangle([bx, by, bx + BUBBLE_W * SS, by + bubble_h], radius=12 * SS, fill=(255, 255, 255, 15))
+    y = by + (bubble_h - content_h) // 2
+    x = bx + BUBBLE_PAD * SS
+    for line in c_lines:
+        od.text((x, y), line, font=f_comment, fill=TEXT + (204,))  # opacity 0.8
+        y += c_lh
+    y += 8 * SS
+    for line in r_lines:
+        od.text((x, y), line, font=f_reply, fill=TEXT + (255,))
+        y += r_lh
+    img = Image.alpha_composite(img, overlay).convert("RGB")
+    return img.resize((W, H), Image.LANCZOS)
+
+
+class MouthCompositor:
+    """Draws only the mouth patch per amplitude on top of a static layer."""
+
+    def __init__(self, static: Image.Image):
+        self.static = static
+        mx, my = MOUTH_CENTER
+        # Patch = the outer mouth rect (the inner one never exceeds it: 8*1.4 < 12).
+        x0, y0 = _svg(mx - 40, my - 6)
+        x1, y1 = _svg(mx + 40, my + 6)
+        self.box = (int(x0 // SS), int(y0 // SS), int(-(-x1 // SS)), int(-(-y1 // SS)))
+        bx0, by0, bx1, by1 = self.box
+        self.patch_bg = _base_layer().crop((bx0 * SS, by0 * SS, bx1 * SS, by1 * SS))
+
+    def mouth_patch(self, amp: float) -> Image.Image:
+        s = 0.6 + float(amp) * 0.8
+        patch = self.patch_bg.copy()
+        mx, my = MOUTH_CENTER
+        ox, oy = self.box[0] * SS, self.box[1] * SS
+        x0, y0 = _svg(mx - 36, my - 4 * s)
+        x1, y1 = _svg(mx + 36, my + 4 * s)
+        ImageDraw.Draw(patch).rounded_rectangle(
+            [x0 - ox, y0 - oy, x1 - ox, y1 - oy],
+            radius=max(1, round(min(4 * SVG_SCALE * SS, (y1 - y0) / 2))), fill=(255, 239, 238))
+        bx0, by0, bx1, by1 = self.box
+        return patch.resize((bx1 - bx0, by1 - by0), Image.LANCZOS)
+
+    def frame(self, amp: float) -> Image.Image:
+        img = self.static.copy()
+        img.paste(self.mouth_patch(amp), self.box[:2])
+        return img
+
+
+def iter_frames_native(comment: str, reply: str, amps: Sequence[float], frame_count: int) -> Iterator[Image.Image]:
+    """Yield ``frame_count`` RGB frames; frame i uses amps[i % len(amps)]."""
+    comp = MouthCompositor(static_layer(comment, reply))
+    amps = list(amps) or [0.2]
+    for i in range(frame_count):
+        yield comp.frame(amps[i % len(amps)])
+
+
+def render_frames_native(comment: str, reply: str, amps: Sequence[float], out_folder: Path,
+                         frame_count: int, compress_level: int = 1) -> int:
+    """Write frame_%03d.png for ``frame_count`` frames (the capture_frames contract)."""
+    out_folder = Path(out_folder)
+    out_folder.mkdir(parents=True, exist_ok=True)
+    for i, img in enumerate(iter_frames_native(comment, reply, amps, frame_count)):
+        img.save(out_folder / f"frame_{i:03d}.png", compress_level=compress_level)
+    return frame_count
@@ -0,0 +1,95 @@
+# bench_envelope.py
+"""
+Micro-benchmark: vectorized audio_to_envelope (whole file and block-streamed)
+vs the original per-frame Python loop, on a synthetic speech-like WAV.
+
+Usage:
+  python bench_envelope.py
+  python bench_envelope.py --seconds 600 --fps 24
+"""
+import math
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from audio_envelope import audio_to_envelope, frame_count_for
+
+
+def baseline_audio_to_envelope(wav_path, n_frames, fps=12, floor=0.15, ceil=1.0):
+    """The original audio_to_envelope, kept verbatim as the reference."""
+    y, sr = sf.read(str(wav_path))
+    if y.ndim == 2:
+        y = y.mean(axis=1)
+    frame_dur = 1.0 / fps
+    win_size = int(frame_dur * sr)
+    amps = []
+    for i in range(n_frames):
+        start = int(i * win_size)
+        end = start + win_size
+        seg = y[start:end]
+        if len(seg) == 0:
+            val = 0.0
+        else:
+            rms = np.sqrt(np.mean(seg**2)) if np.any(seg) else 0.0
+            val = float(rms)
+        amps.append(val)
+    a = np.array(amps, dtype=np.float32)
+    if a.max() > 0:
+        a = (a - a.min()) / (a.max() - a.min() + 1e-12)
+    else:
+        a[:] = 0.0
+    a = floor + (ceil - floor) * a
+    return a.tolist()
+
+
+def make_wav(path, seconds, sr, seed=7):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    syllables = 0.5 + 0.5 * np.sin(2 * math.pi * 3.0 * t) ** 2  # ~6 syllables/s
+    y = 0.3 * syllables * np.sin(2 * math.pi * 180 * t) + 0.02 * rng.standard_normal(len(t))
+    sf.write(str(path), y.astype(np.float32), sr, subtype="PCM_16")
+
+
+def timeit(fn, reps):
+    best = float("inf")
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark mouth envelope extraction.")
+    ap.add_argument("--seconds", type=float, default=120.0)
+    ap.add_argument("--sr", type=int, default=22050)
+    ap.add_argument("--fps", type=int, default=12)
+    ap.add_argument("--reps", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = Path(tmp) / "bench.wav"
+        make_wav(wav, args.seconds, args.sr)
+        n = frame_count_for(wav, args.fps)
+
+        ref = np.array(baseline_audio_to_envelope(wav, n, args.fps))
+        new = np.array(audio_to_envelope(wav, n, args.fps, stream=False))
+        streamed = np.array(audio_to_envelope(wav, n, args.fps, stream=True))
+
+        t_base = timeit(lambda: baseline_audio_to_envelope(wav, n, args.fps), args.reps)
+        t_vec = timeit(lambda: audio_to_envelope(wav, n, args.fps, stream=False), args.reps)
+        t_stream = timeit(lambda: audio_to_envelope(wav, n, args.fps, stream=True), args.reps)
+
+    print(f"audio: {args.seconds:.0f}s @ {args.sr} Hz | frames: {n} @ {args.fps} fps")
+    print(f"baseline (per frame): {t_base * 1000:9.2f} ms")
+    print(f"vectorized:           {t_vec * 1000:9.2f} ms  ({t_base / t_vec:.1f}x)")
+    print(f"streamed (blocks):    {t_stream * 1000:9.2f} ms  ({t_base / t_stream:.1f}x)")
+    print(f"max |diff| vs baseline: vectorized {np.abs(new - ref).max():.2e}, streamed {np.abs(streamed - ref).max():.2e}")
+
+
+if __name__ == "__main__":
+    main()
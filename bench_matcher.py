@@ -0,0 +1,94 @@
+# bench_matcher.py
+"""
+Throughput benchmark: precompiled KeywordMatcher vs the original per-comment
+keyword/regex loop from scrape.matches_keyword.
+
+Usage:
+  python bench_matcher.py
+  python bench_matcher.py --comments 50000 --extra-keywords 200 --hit-rate 0.05
+"""
+import re
+import time
+import random
+import argparse
+
+from common import load_config
+from matcher import KeywordMatcher
+
+FILLER = (
+    "this video is so good lol who else is watching in 2025 the dog at the end "
+    "made my day honestly best content on here keep it up"
+).split()
+
+
+def baseline_matches_keyword(cfg, comment_text):
+    """The original scrape.matches_keyword, kept verbatim as the reference."""
+    text = comment_text.lower()
+    for kw in cfg.get("keywords", []):
+        if kw.lower() in text:
+            return True, f"keyword:{kw}"
+    for rx in cfg.get("regex_variations", []):
+        try:
+            if re.search(rx, comment_text):
+                return True, f"regex:{rx}"
+        except re.error as e:
+            print(f"[regex error] {rx}: {e}")
+    return False, None
+
+
+def make_comments(n, keywords, hit_rate, rng):
+    out = []
+    for _ in range(n):
+        words = rng.choices(FILLER, k=rng.randint(4, 30))
+        if keywords and rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords).upper())
+        out.append(" ".join(words))
+    return out
+
+
+def timeit(fn, reps):
+    best = float("inf")
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark comment keyword matching.")
+    ap.add_argument("--comments", type=int, default=20000)
+    ap.add_argument("--extra-keywords", type=int, default=100, help="Synthetic keywords added to the config list")
+    ap.add_argument("--hit-rate", type=float, default=0.02)
+    ap.add_argument("--reps", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    cfg = dict(load_config())
+    cfg["keywords"] = list(cfg.get("keywords") or []) + [f"slurword{i:04d}" for i in range(args.extra_keywords)]
+    cfg.setdefault("regex_variations", [])
+    comments = make_comments(args.comments, cfg["keywords"], args.hit_rate, rng)
+
+    t0 = time.perf_counter()
+    matcher = KeywordMatcher.from_config(cfg)
+    build = time.perf_counter() - t0
+
+    # Sanity: same verdict and label as the reference on every comment.
+    mismatches = sum(1 for c in comments if matcher.first(c) != baseline_matches_keyword(cfg, c))
+
+    t_base = timeit(lambda: [baseline_matches_keyword(cfg, c) for c in comments], args.reps)
+    t_first = timeit(lambda: [matcher.first(c) for c in comments], args.reps)
+    t_all = timeit(lambda: matcher.match_many(comments), args.reps)
+
+    n = len(comments)
+    print(f"patterns: {len(cfg['keywords'])} keywords + {len(cfg['regex_variations'])} regexes | comments: {n}")
+    print(f"matcher build:          {build * 1000:8.2f} ms")
+    print(f"baseline (per comment): {n / t_base:12.0f} comments/s")
+    print(f"matcher.first:          {n / t_first:12.0f} comments/s  ({t_base / t_first:.1f}x)")
+    print(f"matcher.match_many:     {n / t_all:12.0f} comments/s  (all spans)")
+    print(f"verdict mismatches:     {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# bench_render.py
+"""
+Frame rendering benchmark: native Pillow rasterizer vs the Selenium capture path.
+
+Each engine runs in its own subprocess so peak memory is measured in isolation:
+- peak RSS of the worker process itself
+- peak RSS of its largest child (chromedriver / Chrome for the browser engine)
+
+Usage:
+  python bench_render.py                      # both engines, 72 frames
+  python bench_render.py --engines native --frames 240
+"""
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+SAMPLE = {
+    "id": "bench",
+    "comment": "lol nice try clanker, go eat some bolts",
+    "reply_text": "I'm not a clanker; I'm a highly optimized snack processor for loose bolts.",
+}
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None, None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # bytes on macOS, KiB elsewhere
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(kids, 1)
+
+
+def worker(engine, frames):
+    amps = [0.2 + 0.8 * abs(math.sin(i / 3)) for i in range(frames)]
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp)
+        t0 = time.perf_counter()
+        if engine == "native":
+            from avatar_raster import render_frames_native
+            n = render_frames_native(SAMPLE["comment"], SAMPLE["reply_text"], amps, out, frames)
+        else:
+            import render_video
+            from common import driver_pool
+            html_path, _ = render_video.render_html_for_reply(SAMPLE, amps, out_folder=out)
+            n = render_video.capture_frames(html_path, out, frame_count=frames)
+            driver_pool().close()
+        secs = time.perf_counter() - t0
+    own, kids = _peak_rss_mb()
+    print(json.dumps({"engine": engine, "frames": n, "seconds": round(secs, 3),
+                      "fps": round(n / secs, 1) if secs else None,
+                      "peak_rss_mb": own, "peak_child_rss_mb": kids}))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark avatar frame rendering engines.")
+    ap.add_argument("--engines", default="native,browser")
+    ap.add_argument("--frames", type=int, default=72)
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.frames)
+        return
+
+    print(f"{'engine':<8} {'frames':>6} {'seconds':>8} {'fps':>8} {'peak RSS':>10} {'child RSS':>10}")
+    for engine in args.engines.split(","):
+        proc = subprocess.run([sys.executable, __file__, "--worker", engine, "--frames", str(args.frames)],
+                              capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        if proc.returncode != 0 or not lines:
+            print(f"{engine:<8} failed: {proc.stderr.strip().splitlines()[-1:] or proc.returncode}")
+            continue
+        r = json.loads(lines[-1])
+        print(f"{r['engine']:<8} {r['frames']:>6} {r['seconds']:>8} {r['fps']:>8} "
+              f"{r['peak_rss_mb']:>8} MB {r['peak_child_rss_mb']:>8} MB")
+
+
+if __name__ == "__main__":
+    main()
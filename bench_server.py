@@ -0,0 +1,187 @@
+# bench_server.py
+"""
+Load test for the moderation server: requests/sec and latency percentiles
+of the listing, the JSON API and video range requests, with N concurrent
+keep-alive clients per endpoint.
+
+By default a production server (server.py --prod) is started on a free
+port against the current config and stopped afterwards; --url points the
+test at a server that is already running instead.
+
+Endpoints:
+- listing:     GET /?page=N (pages of the rendered queue)
+- listing_304: the same with If-None-Match (a browser revalidating)
+- api:         GET /api/items?status=all&page=N
+- video:       GET /video/<id>?rendition=preview with a 256 KiB Range (a player seeking)
+
+Usage:
+  python bench_server.py                          # spawn server.py --prod, 5 s per endpoint, 8 clients
+  python bench_server.py --concurrency 32 --duration 10 --only video
+  python bench_server.py --url http://127.0.0.1:5004
+"""
+import sys
+import json
+import math
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+from common import REPO_ROOT
+
+ENDPOINTS = ("listing", "listing_304", "api", "video")
+RANGE_BYTES = 256 * 1024
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p * (len(xs) - 1) + 0.5))] if xs else float("nan")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def fetch(conn, path, headers=None):
+    conn.request("GET", path, headers=headers or {})
+    r = conn.getresponse()
+    return r.status, r.headers, r.read()
+
+
+def spawn_server(port, threads):
+    proc = subprocess.Popen([sys.executable, "server.py", "--prod", "--port", str(port), "--threads", str(threads)],
+                            cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server.py --prod exited with {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            fetch(conn, "/api/items?per_page=1")
+            conn.close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("server.py --prod did not come up within 30 s")
+
+
+class Target:
+    """What to request, discovered from the API once before the run."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        conn = self.connect()
+        _, _, body = fetch(conn, "/api/items?status=all&per_page=100")
+        data = json.loads(body)
+        self.videos = [(i["media"].get("preview") or i["media"]["master"]) for i in data["items"] if i["media"]]
+        self.api_pages = max(1, math.ceil(data["total"] / 20))
+        _, _, body = fetch(conn, "/api/items?per_page=20")
+        self.pages = max(1, json.loads(body)["pages"])
+        self.etags = {}
+        for page in range(1, self.pages + 1):
+            _, headers, _ = fetch(conn, f"/?page={page}")
+            self.etags[page] = headers.get("ETag")
+        self.sizes = {}
+        for v in self.videos:
+            _, headers, _ = fetch(conn, v, {"Range": "bytes=0-0"})
+            self.sizes[v] = int(headers.get("Content-Range", "/1").rsplit("/", 1)[1])
+        conn.close()
+
+    def connect(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def request(self, endpoint, rnd):
+        """(path, headers, acceptable statuses) for one request."""
+        page = rnd.randint(1, self.pages)
+        if endpoint == "listing":
+            return f"/?page={page}", {}, (200,)
+        if endpoint == "listing_304":
+            return f"/?page={page}", {"If-None-Match": self.etags[page] or ""}, (304,)
+        if endpoint == "api":
+            return f"/api/items?status=all&page={rnd.randint(1, self.api_pages)}", {}, (200,)
+        v = rnd.choice(self.videos)
+        start = rnd.randrange(0, max(1, self.sizes[v] - RANGE_BYTES))
+        return v, {"Range": f"bytes={start}-{start + RANGE_BYTES - 1}"}, (206,)
+
+
+def run_endpoint(target, endpoint, concurrency, duration):
+    latencies, errors, nbytes = [], [0], [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(seed):
+        rnd, conn = random.Random(seed), target.connect()
+        mine, bad, got = [], 0, 0
+        while time.monotonic() < stop_at:
+            path, headers, ok = target.request(endpoint, rnd)
+            t0 = time.perf_counter()
+            try:
+                status, _, body = fetch(conn, path, headers)
+            except (OSError, http.client.HTTPException):
+                bad += 1
+                conn.close()
+                conn = target.connect()
+                continue
+            mine.append(time.perf_counter() - t0)
+            got += len(body)
+            bad += status not in ok
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors[0] += bad
+            nbytes[0] += got
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    return {"requests": len(latencies), "rps": len(latencies) / elapsed,
+            "p50_ms": pct(latencies, 0.50) * 1000, "p95_ms": pct(latencies, 0.95) * 1000,
+            "max_ms": max(latencies, default=float("nan")) * 1000, "errors": errors[0],
+            "mb_s": nbytes[0] / elapsed / 1e6}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load test the moderation server.")
+    ap.add_argument("--url", help="Running server to test (default: spawn server.py --prod)")
+    ap.add_argument("--concurrency", type=int, default=8, help="Concurrent keep-alive clients")
+    ap.add_argument("--duration", type=float, default=5.0, help="Seconds per endpoint")
+    ap.add_argument("--threads", type=int, default=8, help="Server threads when spawning")
+    ap.add_argument("--only", nargs="*", choices=ENDPOINTS, help="Endpoints to test (default: all)")
+    args = ap.parse_args()
+
+    proc = None
+    if args.url:
+        u = urlsplit(args.url)
+        host, port = u.hostname, u.port or 80
+    else:
+        host, port = "127.0.0.1", free_port()
+        proc = spawn_server(port, args.threads)
+    try:
+        target = Target(host, port)
+        endpoints = [e for e in (args.only or ENDPOINTS) if e != "video" or target.videos]
+        print(f"{host}:{port} | {args.concurrency} clients | {args.duration:.0f} s per endpoint | "
+              f"{target.pages} listing page(s), {len(target.videos)} video(s)")
+        print(f"{'endpoint':<13}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'MB/s':>8}{'errors':>8}")
+        for endpoint in endpoints:
+            r = run_endpoint(target, endpoint, args.concurrency, args.duration)
+            print(f"{endpoint:<13}{r['requests']:>9}{r['rps']:>9.0f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+                  f"{r['max_ms']:>9.1f}{r['mb_s']:>8.1f}{r['errors']:>8}")
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
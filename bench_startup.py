@@ -0,0 +1,148 @@
+# bench_startup.py
+"""
+Startup benchmark: cold import time and peak RSS of every entry point, each
+measured in a fresh interpreter, plus which heavy dependencies the import
+drags in.
+
+An entry point loading a heavy module it has no business loading at import
+(selenium for enqueue_comment, numpy for server...) is always a failure;
+time and memory are compared against a saved baseline.
+
+Usage:
+  python bench_startup.py                  # table
+  python bench_startup.py --save           # record the current numbers as the baseline
+  python bench_startup.py --check          # exit 1 on a regression vs the baseline
+  python bench_startup.py --check --tolerance 0.5 --only server generate_reply
+"""
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+from common import REPO_ROOT, output_dir
+
+HEAVY = ("selenium", "webdriver_manager", "numpy", "soundfile", "pyttsx3", "jinja2", "PIL")
+
+# entry point -> heavy modules it may load at import time
+ENTRY_POINTS = {
+    "enqueue_comment": (),
+    "enqueue_comment_min": (),
+    "run_reply": (),
+    "demo_run": (),
+    "generate_reply": (),
+    "queue_db": (),
+    "reply_cache": (),
+    "llm_engine": (),
+    "synth_audio": (),
+    "pipeline": (),
+    "render_video": (),
+    "render_farm": (),
+    "server": ("jinja2",),  # via flask
+    "scrape": ("selenium",),
+}
+
+PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+import {module}
+ms = (time.perf_counter() - t0) * 1000
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+except ImportError:  # Windows
+    rss_mb = None
+print(json.dumps({{"import_ms": ms, "rss_mb": rss_mb, "heavy": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def probe(module, repeat):
+    """Best import time / max RSS over ``repeat`` fresh interpreters (the minimum is the least noisy)."""
+    runs = []
+    for _ in range(repeat):
+        r = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                           cwd=REPO_ROOT, capture_output=True, text=True)
+        if r.returncode != 0:
+            last = (r.stderr.strip().splitlines() or ["exit %d" % r.returncode])[-1]
+            return {"error": last}
+        runs.append(json.loads(r.stdout.strip().splitlines()[-1]))
+    rss = [x["rss_mb"] for x in runs if x["rss_mb"] is not None]
+    return {"import_ms": round(min(x["import_ms"] for x in runs), 1),
+            "rss_mb": round(max(rss), 1) if rss else None,
+            "heavy": runs[0]["heavy"]}
+
+
+def regressions(name, cur, base, tolerance, min_ms, min_mb):
+    """Reasons this entry point fails the check (empty list = ok)."""
+    if "error" in cur:
+        return [f"import failed: {cur['error']}"]
+    out = []
+    extra = sorted(set(cur["heavy"]) - set(ENTRY_POINTS[name]))
+    if extra:
+        out.append(f"loads {', '.join(extra)} at import")
+    if not base or "error" in base:
+        return out
+    d_ms = cur["import_ms"] - base["import_ms"]
+    if d_ms > min_ms and cur["import_ms"] > base["import_ms"] * (1 + tolerance):
+        out.append(f"import {base['import_ms']:.0f} -> {cur['import_ms']:.0f} ms")
+    if cur["rss_mb"] and base.get("rss_mb"):
+        d_mb = cur["rss_mb"] - base["rss_mb"]
+        if d_mb > min_mb and cur["rss_mb"] > base["rss_mb"] * (1 + tolerance):
+            out.append(f"peak RSS {base['rss_mb']:.0f} -> {cur['rss_mb']:.0f} MB")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Cold import time / peak RSS of each entry point.")
+    ap.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per entry point (best of)")
+    ap.add_argument("--only", nargs="*", help="Entry points to measure (default: all)")
+    ap.add_argument("--baseline", default=None, help="Baseline JSON (default: <output_dir>/startup_baseline.json)")
+    ap.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+    ap.add_argument("--check", action="store_true", help="Exit 1 on regressions vs the baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative growth (default 0.25)")
+    ap.add_argument("--min-ms", type=float, default=15.0, help="Ignore import-time growth below this")
+    ap.add_argument("--min-mb", type=float, default=5.0, help="Ignore RSS growth below this")
+    args = ap.parse_args()
+
+    names = args.only or list(ENTRY_POINTS)
+    unknown = [n for n in names if n not in ENTRY_POINTS]
+    if unknown:
+        ap.error(f"unknown entry point(s): {', '.join(unknown)}")
+    path = Path(args.baseline) if args.baseline else output_dir() / "startup_baseline.json"
+    baseline = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+    floor = probe("sys", args.repeat)  # bare interpreter, for scale
+    print(f"python {sys.version.split()[0]} | bare interpreter peak RSS {floor.get('rss_mb')} MB | "
+          f"best of {args.repeat} cold starts")
+    print(f"{'entry point':<22}{'import ms':>10}{'base ms':>9}{'RSS MB':>8}{'base MB':>9}  heavy deps")
+    results, failed = {}, {}
+    for name in names:
+        cur = results[name] = probe(name, args.repeat)
+        base = baseline.get(name) or {}
+        if "error" in cur:
+            print(f"{name:<22}  error: {cur['error']}")
+        else:
+            print(f"{name:<22}{cur['import_ms']:>10.1f}{base.get('import_ms', float('nan')):>9.1f}"
+                  f"{cur['rss_mb'] or float('nan'):>8.1f}{base.get('rss_mb') or float('nan'):>9.1f}"
+                  f"  {', '.join(cur['heavy']) or '-'}")
+        reasons = regressions(name, cur, base, args.tolerance, args.min_ms, args.min_mb)
+        if reasons:
+            failed[name] = reasons
+
+    if args.save:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({**baseline, **results}, indent=2), encoding="utf-8")
+        print(f"baseline saved to {path}")
+    if failed:
+        print("\nregressions:")
+        for name, reasons in failed.items():
+            print(f"  {name}: {'; '.join(reasons)}")
+    if args.check:
+        if not baseline:
+            print(f"(no baseline at {path}: only heavy imports were checked; run with --save first)")
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# build_graph.py
+"""
+Make-style rebuild tracking for queue items.
+
+Each item folder (output/queue/<id>/) gets a build.json manifest recording,
+per stage, the inputs it was last built from:
+
+    reply -> wav -> envelope -> frames -> mp4
+
+A stage's inputs include its upstream stage's fingerprint, so a change
+anywhere (reply text, voice, template file, FPS, encoder settings...)
+invalidates exactly the stages after it. Stage owners describe their inputs
+(generate_reply.reply_inputs, render_video.render_stage_inputs) and ask the
+manifest why, if at all, a stage must be rebuilt:
+
+    m = BuildManifest(folder)
+    reason = m.stale("wav", inputs, folder / "reply.wav")   # None = up to date
+    ...build...
+    m.record("wav", inputs)
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+STAGES = ("reply", "wav", "envelope", "frames", "mp4")
+MANIFEST = "build.json"
+
+_file_hashes: dict[tuple, str] = {}
+
+
+def fingerprint(inputs: dict) -> str:
+    raw = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def file_hash(path: Path) -> Optional[str]:
+    """Content hash of a source file (templates, renderer code); cached per mtime/size."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (str(path), st.st_mtime_ns, st.st_size)
+    if key not in _file_hashes:
+        _file_hashes[key] = hashlib.sha256(Path(path).read_bytes()).hexdigest()[:16]
+    return _file_hashes[key]
+
+
+class BuildManifest:
+    def __init__(self, folder: Path):
+        self.path = Path(folder) / MANIFEST
+        try:
+            self.stages: dict = json.loads(self.path.read_text(encoding="utf-8")).get("stages", {})
+        except (OSError, ValueError):
+            self.stages = {}
+
+    def fingerprint(self, stage: str) -> Optional[str]:
+        return (self.stages.get(stage) or {}).get("fp")
+
+    def stale(self, stage: str, inputs: dict, artifacts: Path | Iterable[Path] | None = None) -> Optional[str]:
+        """Why ``stage`` needs rebuilding, or None when its record and artifacts are current."""
+        rec = self.stages.get(stage)
+        if rec is None:
+            return "never built"
+        if artifacts is not None:
+            for a in [artifacts] if isinstance(artifacts, Path) else artifacts:
+                if not Path(a).exists():
+                    return f"missing {Path(a).name}"
+        if rec.get("fp") == fingerprint(inputs):
+            return None
+        old = rec.get("inputs") or {}
+        changed = sorted(k for k in set(old) | set(inputs) if old.get(k) != inputs.get(k))
+        return "changed: " + ", ".join(changed) if changed else "changed"
+
+    def record(self, stage: str, inputs: dict) -> None:
+        assert stage in STAGES, stage
+        self.stages[stage] = {"fp": fingerprint(inputs), "inputs": inputs}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"stages": self.stages}, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def forget(self, *stages: str) -> None:
+        """Drop records (e.g. after deleting the artifacts) so the stages rebuild."""
+        for s in stages:
+            self.stages.pop(s, None)
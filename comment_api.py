@@ -0,0 +1,282 @@
+# comment_api.py
+"""
+Network-level comment ingestion: read TikTok's own paginated comment-list JSON
+instead of scraping the DOM.
+
+How it works:
+- With ``ingestion: network`` the scrape browsers (driver profiles
+  scrape_network*) run with Chrome's performance log enabled, so every
+  Network.responseReceived event is visible to us.
+- After the video page loads, the comment-list responses the page fetched
+  are picked out of the log and their bodies read with Network.getResponseBody.
+- The pagination cursor is then followed by re-requesting the same URL with
+  an updated ``cursor`` param from inside the page (same cookies/headers).
+
+Parsing and pagination are plain functions over dicts, so they can be run
+offline against the bundled stand-in server:
+
+  python comment_api.py serve                 # fixtures on http://127.0.0.1:8765
+  python comment_api.py check                 # follow the cursor over HTTP, no browser
+  python -m pytest tests/test_comment_api.py  # the same, plus the browser path with a fake driver
+  python scrape.py --mode network             # with a target url pointing at the server
+"""
+from __future__ import annotations
+
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from common import REPO_ROOT, get_logger
+
+logger = get_logger("comment_api")
+
+COMMENT_LIST_PATH = "/api/comment/list/"
+FIXTURES_DIR = REPO_ROOT / "examples" / "comment_api"
+
+_FETCH_JS = """
+const done = arguments[arguments.length - 1];
+fetch(arguments[0], {credentials: 'include'})
+  .then(r => r.text())
+  .then(t => done(t))
+  .catch(() => done(null));
+"""
+
+
+class CommentAPIError(RuntimeError):
+    """The comment API answered with a non-zero ``status_code`` (rate limited, blocked, bad cursor...)."""
+
+    def __init__(self, status_code, message: str = ""):
+        super().__init__(f"comment API status_code {status_code}" + (f": {message}" if message else ""))
+        self.status_code = status_code
+
+
+# ---------- Decoding ----------
+def parse_comment_page(payload: dict) -> tuple[list[dict], Optional[int], bool]:
+    """Decode one comment-list response -> (records, next cursor, has_more).
+
+    Records use the same keys as scrape.find_comments_on_page, plus the
+    stable ``comment_id`` from the API. Raises CommentAPIError when the
+    response reports an error instead of comments.
+    """
+    status = payload.get("status_code") or 0
+    if status:
+        raise CommentAPIError(status, payload.get("status_msg") or "")
+    records = []
+    for c in payload.get("comments") or []:
+        text = (c.get("text") or "").strip()
+        if not text:
+            continue
+        user = c.get("user") or {}
+        created = c.get("create_time")
+        records.append({
+            "text": text,
+            "comment_id": str(c.get("cid") or ""),
+            "author": user.get("unique_id") or None,
+            "likes": c.get("digg_count"),
+            "time": (datetime.fromtimestamp(created, timezone.utc).isoformat()
+                     if isinstance(created, (int, float)) else None),
+        })
+    cursor = payload.get("cursor")
+    has_more = bool(payload.get("has_more")) and cursor is not None
+    return records, (int(cursor) if cursor is not None else None), has_more
+
+
+def with_cursor(url: str, cursor: int) -> str:
+    """Same request URL with its ``cursor`` query param replaced."""
+    u = urlparse(url)
+    q = parse_qs(u.query, keep_blank_values=True)
+    q["cursor"] = [str(cursor)]
+    return urlunparse(u._replace(query=urlencode(q, doseq=True)))
+
+
+def iter_comment_pages(
+    fetch_json: Callable[[str], Optional[dict]],
+    first_url: str,
+    first_payload: Optional[dict] = None,
+    max_pages: int = 50,
+) -> Iterator[list[dict]]:
+    """Yield decoded records page by page, following the pagination cursor.
+
+    ``fetch_json(url)`` returns the decoded body or None on failure; a failed
+    page ends the walk. A page with an error status raises CommentAPIError.
+    """
+    url, payload = first_url, first_payload
+    seen_cursors = set()
+    for _ in range(max_pages):
+        if payload is None:
+            payload = fetch_json(url)
+            if payload is None:
+                return
+        records, cursor, has_more = parse_comment_page(payload)
+        yield records
+        if not has_more or cursor in seen_cursors:
+            return
+        seen_cursors.add(cursor)
+        url, payload = with_cursor(url, cursor), None
+
+
+def http_fetch_json(url: str, timeout: float = 10.0) -> Optional[dict]:
+    """Plain HTTP fetch (offline checks against the stand-in server).
+
+    Error responses with a JSON body are returned too, so their status_code is seen.
+    """
+    try:
+        try:
+            with urlopen(url, timeout=timeout) as r:
+                return json.loads(r.read().decode("utf-8"))
+        except HTTPError as e:
+            return json.loads(e.read().decode("utf-8"))
+    except Exception as e:
+        logger.warning(f"fetch failed {url}: {e}")
+        return None
+
+
+# ---------- Browser capture ----------
+def captured_comment_responses(driver) -> list[tuple[str, dict]]:
+    """Drain the performance log; return (url, payload) for comment-list responses."""
+    out = []
+    for entry in driver.get_log("performance"):
+        try:
+            msg = json.loads(entry["message"])["message"]
+        except (KeyError, ValueError):
+            continue
+        if msg.get("method") != "Network.responseReceived":
+            continue
+        params = msg.get("params") or {}
+        url = (params.get("response") or {}).get("url", "")
+        if COMMENT_LIST_PATH not in url:
+            continue
+        try:
+            body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": params["requestId"]})
+            out.append((url, json.loads(body.get("body") or "null") or {}))
+        except Exception as e:
+            logger.debug(f"could not read body for {url}: {e}")
+    return out
+
+
+def browser_fetch_json(driver) -> Callable[[str], Optional[dict]]:
+    """fetch_json that runs inside the page, so cookies and origin match."""
+    def fetch(url: str) -> Optional[dict]:
+        try:
+            text = driver.execute_async_script(_FETCH_JS, url)
+            return json.loads(text) if text else None
+        except Exception as e:
+            logger.warning(f"in-page fetch failed {url}: {e}")
+            return None
+    return fetch
+
+
+def fetch_comments_via_network(driver, url: str, stats: Optional[dict] = None,
+                               wait_seconds: float = 15.0, max_pages: int = 50) -> list[dict]:
+    """Load ``url`` and return its comments from the comment API responses.
+
+    Same shape as scrape.find_comments_on_page (text, scraped_at, ...), with
+    a stable ``comment_id`` per record.
+    """
+    t0 = time.monotonic()
+    driver.get_log("performance")  # drop events from earlier pages
+    driver.get(url)
+
+    first = []
+    deadline = time.monotonic() + wait_seconds
+    while not first and time.monotonic() < deadline:
+        # Nudge the page so it requests the first comment page.
+        try:
+            driver.execute_script("window.scrollBy(0, 800);")
+        except Exception:
+            pass
+        time.sleep(0.25)
+        first = captured_comment_responses(driver)
+
+    now_iso = datetime.now(timezone.utc).isoformat()
+    by_id: dict[str, dict] = {}
+    pages = 0
+    if first:
+        first_url, first_payload = first[0]
+        fetch = browser_fetch_json(driver)
+        for records in iter_comment_pages(fetch, first_url, first_payload, max_pages=max_pages):
+            pages += 1
+            for r in records:
+                key = r["comment_id"] or r["text"]
+                by_id.setdefault(key, {**r, "scraped_at": now_iso})
+    else:
+        logger.warning(f"no comment-list responses seen for {url}")
+
+    comments = list(by_id.values())
+    if stats is not None:
+        stats.update({
+            "rounds": pages, "items": len(comments), "stop_reason": "network" if first else "no_api",
+            "load_seconds": round(time.monotonic() - t0, 2), "comments": len(comments),
+            "extraction": "network",
+        })
+    return comments
+
+
+# ---------- Offline stand-in server ----------
+class _FixtureHandler(BaseHTTPRequestHandler):
+    fixtures: Path = FIXTURES_DIR
+
+    def do_GET(self):
+        u = urlparse(self.path)
+        if u.path.startswith(COMMENT_LIST_PATH):
+            cursor = (parse_qs(u.query).get("cursor") or ["0"])[0]
+            path = self.fixtures / f"comments_cursor_{int(cursor)}.json"
+            if not path.exists():
+                return self._send(404, b'{"status_code": 404}', "application/json")
+            return self._send(200, path.read_bytes(), "application/json")
+        return self._send(200, (self.fixtures / "video.html").read_bytes(), "text/html; charset=utf-8")
+
+    def _send(self, code: int, body: bytes, ctype: str):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
+
+
+def serve_fixtures(port: int = 8765, fixtures: Path = FIXTURES_DIR) -> ThreadingHTTPServer:
+    """Start the stand-in server (serve_forever() it, or run it in a thread)."""
+    handler = type("FixtureHandler", (_FixtureHandler,), {"fixtures": Path(fixtures)})
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Comment API ingestion helpers.")
+    ap.add_argument("cmd", choices=["serve", "check"])
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--fixtures", default=str(FIXTURES_DIR))
+    args = ap.parse_args()
+
+    server = serve_fixtures(args.port, Path(args.fixtures))
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    if args.cmd == "serve":
+        print(f"Serving fixtures at {base}/video/1 (comment API at {COMMENT_LIST_PATH})")
+        server.serve_forever()
+        return
+
+    import threading
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        first_url = f"{base}{COMMENT_LIST_PATH}?aweme_id=1&cursor=0&count=20"
+        pages = list(iter_comment_pages(http_fetch_json, first_url))
+        n = sum(len(p) for p in pages)
+        print(f"{len(pages)} page(s), {n} comment(s)")
+        for p in pages:
+            for r in p:
+                print(f"  {r['comment_id']:>6}  @{r['author']}: {r['text']}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
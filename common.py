@@ -2,56 +2,291 @@
 Common utilities for the anticlanker project.
 
 Centralizes:
-- Config loading (config.yaml)
+- Config loading (config.yaml): one validated, cached Config per process,
+  reloaded when the file changes (get_config)
 - Output/queue/published directories
 - Logging setup
 - Text hashing
-- Chrome WebDriver creation
+- Chrome WebDriver creation and a shared pool of warm drivers
 - ffmpeg binary resolution
+
+Importing this module is cheap: selenium and webdriver-manager are only
+imported when a driver is actually created, so entry points that just need
+paths or hashing (enqueue_comment.py, server.py...) never load them.
 """
 from __future__ import annotations
 
+from collections.abc import Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
+import atexit
+import copy
 import json
 import logging
 import os
 import hashlib
-from typing import Any, Optional
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Iterator, Optional
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+if TYPE_CHECKING:
+    from selenium import webdriver
 
 
 REPO_ROOT = Path(__file__).resolve().parent
 CONFIG_PATH = REPO_ROOT / "config.yaml"
 
 
-def load_config(path: Path | str = CONFIG_PATH) -> dict:
-    """Load YAML config with safe defaults. Returns {} if missing/invalid."""
+_SECTIONS = ("comment_loading", "llm", "reply_cache", "seen_store", "queue_db", "tts", "render",
+             "driver_pool", "pipeline", "moderation")
+RELOAD_CHECK_SECONDS = 1.0  # get_config() stats config.yaml at most this often
+
+
+class ConfigError(ValueError):
+    """config.yaml could not be parsed or failed validation."""
+
+
+class Config(Mapping):
+    """Validated config.yaml.
+
+    Reads like the raw dict (``cfg.get("render")``, ``cfg["keywords"]``), so
+    existing consumers are unchanged, and adds data derived once per load:
+    resolved directories, target URLs, tone templates and the compiled
+    keyword matcher.
+    """
+
+    def __init__(self, data: dict | None = None, path: Path | None = None):
+        self._data = dict(data or {})
+        self.path = Path(path) if path else None
+        problems = _validate(self._data)
+        if problems:
+            where = self.path or "config"
+            raise ConfigError(f"{where}: " + "; ".join(problems))
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __repr__(self) -> str:
+        return f"Config({self.path or 'in-memory'}, keys={list(self._data)})"
+
+    @cached_property
+    def output_dir(self) -> Path:
+        return (REPO_ROOT / Path(self._data.get("output_dir") or "./output")).resolve()
+
+    @cached_property
+    def queue_dir(self) -> Path:
+        return self.output_dir / "queue"
+
+    @cached_property
+    def published_dir(self) -> Path:
+        return self.output_dir / "published"
+
+    @cached_property
+    def targets(self) -> list[str]:
+        return [t if isinstance(t, str) else t["url"] for t in self._data.get("targets") or []]
+
+    @cached_property
+    def tones(self) -> dict[str, Optional[str]]:
+        """tone id -> prompt_template (None when the tone has none), in config order."""
+        return {t["id"]: t.get("prompt_template") for t in self._data.get("tone_profiles") or []}
+
+    @cached_property
+    def matcher(self):
+        """KeywordMatcher for keywords + regex_variations (compiled once per load)."""
+        from matcher import KeywordMatcher
+        return KeywordMatcher.from_config(self, strict=True)
+
+
+def _validate(data: Any) -> list[str]:
+    """Problems with a parsed config, as readable messages (empty = valid)."""
+    import re
+    if not isinstance(data, dict):
+        return [f"top level must be a mapping, got {type(data).__name__}"]
+    out = []
+
+    def str_list(key):
+        v = data.get(key)
+        if v is None:
+            return []
+        if not isinstance(v, list) or not all(isinstance(x, str) for x in v):
+            out.append(f"{key} must be a list of strings")
+            return []
+        return v
+
+    targets = data.get("targets")
+    if targets is not None:
+        if not isinstance(targets, list):
+            out.append("targets must be a list")
+        else:
+            for i, t in enumerate(targets):
+                url = t if isinstance(t, str) else (t.get("url") if isinstance(t, dict) else None)
+                if not isinstance(url, str) or not url.strip():
+                    out.append(f"targets[{i}] needs a url")
+    for i, kw in enumerate(str_list("keywords")):
+        if not kw.strip():
+            out.append(f"keywords[{i}] is empty")
+    for i, rx in enumerate(str_list("regex_variations")):
+        try:
+            re.compile(rx)
+        except re.error as e:
+            out.append(f"regex_variations[{i}] {rx!r}: {e}")
+    tones = data.get("tone_profiles")
+    if tones is not None:
+        if not isinstance(tones, list):
+            out.append("tone_profiles must be a list")
+            tones = []
+        seen = set()
+        for i, t in enumerate(tones):
+            tid = t.get("id") if isinstance(t, dict) else None
+            if not isinstance(tid, str) or not tid:
+                out.append(f"tone_profiles[{i}] needs an id")
+                continue
+            if tid in seen:
+                out.append(f"tone_profiles: duplicate id {tid!r}")
+            seen.add(tid)
+            tmpl = t.get("prompt_template")
+            if tmpl is not None:
+                try:
+                    str(tmpl).format(comment="")
+                except (KeyError, IndexError, ValueError) as e:
+                    out.append(f"tone_profiles[{tid}].prompt_template: only {{comment}} can be filled in ({e!r})")
+    fb = data.get("fallback_tone")
+    if fb is not None and not isinstance(fb, str):
+        out.append("fallback_tone must be a string")
+    poll = data.get("poll_interval_seconds")
+    if poll is not None and (isinstance(poll, bool) or not isinstance(poll, (int, float)) or poll <= 0):
+        out.append("poll_interval_seconds must be a positive number")
+    if not isinstance(data.get("output_dir", ""), (str, type(None))):
+        out.append("output_dir must be a path string")
+    for key in _SECTIONS:
+        if data.get(key) is not None and not isinstance(data[key], dict):
+            out.append(f"{key} must be a mapping")
+    return out
+
+
+def read_config(path: Path | str = CONFIG_PATH) -> Config:
+    """Parse and validate ``path`` now (uncached). A missing file is an empty config."""
+    path = Path(path)
+    try:
+        text = path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return Config({}, path)
+    except OSError as e:
+        raise ConfigError(f"{path}: {e}") from e
     try:
         import yaml
-        with open(path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f) or {}
-        if not isinstance(data, dict):
-            return {}
-        return data
-    except Exception:
-        return {}
+    except ImportError as e:
+        raise ConfigError("PyYAML is not installed (pip install -r requirements.txt)") from e
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise ConfigError(f"{path}: invalid YAML: {e}") from e
+    return Config(data if data is not None else {}, path)
+
+
+@dataclass
+class _Loaded:
+    config: Config
+    stamp: Optional[tuple]
+    checked: float
+
+
+_CONFIGS: dict[Path, _Loaded] = {}
+_CONFIG_LOCK = threading.Lock()
+
+
+def _stamp(path: Path) -> Optional[tuple]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def get_config(path: Path | str = CONFIG_PATH) -> Config:
+    """The process-wide Config for ``path``, reloaded when the file changes.
 
+    The file is stat()ed at most once per RELOAD_CHECK_SECONDS, so calling
+    this per item or per request is cheap, and long-running processes pick
+    up edits (new targets, keywords...) without a restart. An edit that
+    fails to parse or validate is logged and the last good config is kept;
+    only the first load raises ConfigError.
+    """
+    path = Path(path)
+    now = time.monotonic()
+    with _CONFIG_LOCK:
+        loaded = _CONFIGS.get(path)
+        if loaded and now - loaded.checked < RELOAD_CHECK_SECONDS:
+            return loaded.config
+        stamp = _stamp(path)
+        if loaded and stamp == loaded.stamp:
+            loaded.checked = now
+            return loaded.config
+        try:
+            cfg = read_config(path)
+        except ConfigError as e:
+            if loaded is None:
+                raise
+            get_logger("config").error(f"{e} -- keeping the previous config")
+            loaded.stamp, loaded.checked = stamp, now  # don't re-parse the same broken file every second
+            return loaded.config
+        if loaded:
+            get_logger("config").info(f"{path.name} changed; reloaded")
+        _CONFIGS[path] = _Loaded(cfg, stamp, now)
+        return cfg
+
+
+def load_config(path: Path | str = CONFIG_PATH) -> Config:
+    """Cached, validated config (see get_config). Empty when config.yaml is missing."""
+    return get_config(path)
+
+
+_WRAPPED: dict[int, tuple[Mapping, Any, Config]] = {}  # id(mapping) -> (mapping, snapshot, Config)
+_WRAPPED_MAX = 16
+
+
+def as_config(cfg: Optional[Mapping] = None) -> Config:
+    """``cfg`` as a Config: the loaded config for None, plain dicts validated and wrapped.
+
+    A dict passed again unchanged gets the same Config back, so callers that
+    hand the same dict to matches_keyword() or build_prompt() per comment
+    don't re-validate it and rebuild the matcher every time.
+    """
+    if cfg is None:
+        return get_config()
+    if isinstance(cfg, Config):
+        return cfg
+    with _CONFIG_LOCK:
+        hit = _WRAPPED.get(id(cfg))
+    if hit is not None and hit[0] is cfg and hit[1] == cfg:
+        return hit[2]
+    wrapped = Config(cfg)
+    snapshot = copy.deepcopy(dict(cfg))  # a later in-place edit of the dict must not get the old Config
+    with _CONFIG_LOCK:
+        if len(_WRAPPED) >= _WRAPPED_MAX:
+            del _WRAPPED[next(iter(_WRAPPED))]
+        _WRAPPED[id(cfg)] = (cfg, snapshot, wrapped)
+    return wrapped
 
-def output_dir(cfg: dict | None = None) -> Path:
-    cfg = cfg or load_config()
-    return (REPO_ROOT / Path(cfg.get("output_dir", "./output"))).resolve()
 
+def output_dir(cfg: Mapping | None = None) -> Path:
+    return as_config(cfg or None).output_dir
 
-def queue_dir(cfg: dict | None = None) -> Path:
-    return output_dir(cfg) / "queue"
 
+def queue_dir(cfg: Mapping | None = None) -> Path:
+    return as_config(cfg or None).queue_dir
 
-def published_dir(cfg: dict | None = None) -> Path:
-    return output_dir(cfg) / "published"
+
+def published_dir(cfg: Mapping | None = None) -> Path:
+    return as_config(cfg or None).published_dir
 
 
 def ensure_dirs(cfg: dict | None = None) -> None:
@@ -75,6 +310,7 @@ def get_logger(name: str, level: Optional[str] = None) -> logging.Logger:
     ch = logging.StreamHandler()
     ch.setFormatter(logging.Formatter("[%(name)s] %(levelname)s: %(message)s"))
     logger.addHandler(ch)
+    logger.propagate = False  # servers (waitress...) configure the root logger too; don't print twice
     return logger
 
 
@@ -85,14 +321,46 @@ def resolve_headless(default: bool = False) -> bool:
     return str(val).lower() in ("1", "true", "yes")
 
 
-def get_chrome_driver(headless: Optional[bool] = None, window_size: str = "1280,900") -> webdriver.Chrome:
+_DRIVER_PATH: Optional[str] = None
+_DRIVER_PATH_LOCK = threading.Lock()
+
+
+def chromedriver_path(reuse: bool = True) -> str:
+    """Resolve the chromedriver binary.
+
+    CHROMEDRIVER_PATH wins if set. Otherwise webdriver-manager is asked once
+    per process and the result reused (pass reuse=False to re-resolve).
+    """
+    global _DRIVER_PATH
+    env_path = os.getenv("CHROMEDRIVER_PATH")
+    if env_path:
+        return env_path
+    with _DRIVER_PATH_LOCK:
+        if _DRIVER_PATH is None or not reuse:
+            from webdriver_manager.chrome import ChromeDriverManager
+            _DRIVER_PATH = ChromeDriverManager().install()
+        return _DRIVER_PATH
+
+
+def get_chrome_driver(
+    headless: Optional[bool] = None,
+    window_size: str = "1280,900",
+    use_user_profile: bool = True,
+    reuse_driver_binary: bool = True,
+    performance_log: bool = False,
+) -> webdriver.Chrome:
     """Return a configured Chrome WebDriver. Uses webdriver-manager.
 
     Respects env:
       - HEADLESS: true/false
       - CHROME_USER_DATA_DIR: path to user data dir
       - CHROME_PROFILE_DIR: profile directory name (e.g., "Default")
+      - CHROMEDRIVER_PATH: skip webdriver-manager and use this binary
     """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
     headless = resolve_headless() if headless is None else headless
     opts = Options()
     if headless:
@@ -108,19 +376,248 @@ def get_chrome_driver(headless: Optional[bool] = None, window_size: str = "1280,
     opts.add_argument("--disable-blink-features=AutomationControlled")
 
     # Optional profile reuse (helps with sites requiring login)
-    user_data = os.getenv("CHROME_USER_DATA_DIR")
-    profile_dir = os.getenv("CHROME_PROFILE_DIR")
+    user_data = os.getenv("CHROME_USER_DATA_DIR") if use_user_profile else None
+    profile_dir = os.getenv("CHROME_PROFILE_DIR") if use_user_profile else None
     if user_data:
         opts.add_argument(f"--user-data-dir={user_data}")
     if profile_dir:
         opts.add_argument(f"--profile-directory={profile_dir}")
+    if performance_log:
+        # Network.* events via driver.get_log("performance") (comment_api.py)
+        opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
 
-    service = Service(ChromeDriverManager().install())
+    service = Service(chromedriver_path(reuse=reuse_driver_binary))
     driver = webdriver.Chrome(service=service, options=opts)
     driver.set_page_load_timeout(90)
     return driver
 
 
+def hide_webdriver_flag(driver: webdriver.Chrome) -> None:
+    """Mask navigator.webdriver on every new document (best effort)."""
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+            "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined});"
+        })
+    except Exception:
+        pass
+
+
+# ---------- Driver pool ----------
+@dataclass(frozen=True)
+class DriverProfile:
+    """How to launch the browsers for one kind of work (scrape, render, ...)."""
+    name: str
+    headless: Optional[bool] = None      # None -> HEADLESS env
+    window_size: str = "1280,900"
+    use_user_profile: bool = True        # honour CHROME_USER_DATA_DIR / CHROME_PROFILE_DIR
+    hide_webdriver: bool = False
+    performance_log: bool = False        # needed for network-level comment ingestion
+
+
+DEFAULT_PROFILES = {
+    # Headful with the user's Chrome profile so TikTok sees a logged-in browser.
+    "scrape": DriverProfile("scrape", headless=False, window_size="1280,2000", hide_webdriver=True),
+    # Parallel scrape workers: one Chrome user-data-dir cannot be shared.
+    "scrape_worker": DriverProfile("scrape_worker", window_size="1280,2000", use_user_profile=False,
+                                   hide_webdriver=True),
+    # The same for ingestion: network. Only these buffer network events, which
+    # comment_api drains on every page; DOM scraping never reads them.
+    "scrape_network": DriverProfile("scrape_network", headless=False, window_size="1280,2000",
+                                    hide_webdriver=True, performance_log=True),
+    "scrape_network_worker": DriverProfile("scrape_network_worker", window_size="1280,2000",
+                                           use_user_profile=False, hide_webdriver=True, performance_log=True),
+    # Clean throwaway profile sized to the avatar card.
+    "render": DriverProfile("render", window_size="900,600", use_user_profile=False),
+}
+
+
+class _PooledDriver:
+    __slots__ = ("driver", "profile", "created", "uses")
+
+    def __init__(self, driver: webdriver.Chrome, profile: str):
+        self.driver = driver
+        self.profile = profile
+        self.created = time.monotonic()
+        self.uses = 0
+
+
+class DriverPool:
+    """Warm Chrome instances, leased per task and returned afterwards.
+
+    A driver is recycled (quit and replaced on next demand) when it reached
+    ``max_uses`` leases, is older than ``max_age`` seconds, or fails the
+    health check (crashed browser / dead chromedriver). Thread-safe; at most
+    ``max_size`` live drivers exist per profile.
+    """
+
+    def __init__(
+        self,
+        profiles: Optional[dict[str, DriverProfile]] = None,
+        max_size: int = 2,
+        max_uses: int = 50,
+        max_age: float = 1800.0,
+        reuse_driver_binary: bool = True,
+    ):
+        self.profiles = dict(profiles or DEFAULT_PROFILES)
+        self.max_size = max(1, int(max_size))
+        self.max_uses = max(1, int(max_uses))
+        self.max_age = float(max_age)
+        self.reuse_driver_binary = reuse_driver_binary
+        self._idle: dict[str, list[_PooledDriver]] = {}
+        self._live: dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._log = get_logger("driver_pool")
+
+    @classmethod
+    def from_config(cls, cfg: dict | None = None) -> "DriverPool":
+        pc = (cfg if cfg is not None else load_config()).get("driver_pool") or {}
+        return cls(
+            max_size=pc.get("max_size", 2),
+            max_uses=pc.get("max_uses", 50),
+            max_age=pc.get("max_age_seconds", 1800),
+            reuse_driver_binary=pc.get("reuse_driver_binary", True),
+        )
+
+    # ----- lifecycle of a single driver -----
+    def _create(self, profile: str) -> _PooledDriver:
+        p = self.profiles[profile]
+        driver = get_chrome_driver(
+            headless=p.headless,
+            window_size=p.window_size,
+            use_user_profile=p.use_user_profile,
+            reuse_driver_binary=self.reuse_driver_binary,
+            performance_log=p.performance_log,
+        )
+        if p.hide_webdriver:
+            hide_webdriver_flag(driver)
+        self._log.debug(f"started driver for profile={profile}")
+        return _PooledDriver(driver, profile)
+
+    @staticmethod
+    def _healthy(pd: _PooledDriver) -> bool:
+        try:
+            return pd.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _expired(self, pd: _PooledDriver) -> bool:
+        return pd.uses >= self.max_uses or (time.monotonic() - pd.created) > self.max_age
+
+    def _discard(self, pd: _PooledDriver, reason: str) -> None:
+        self._log.debug(f"recycling driver profile={pd.profile} uses={pd.uses}: {reason}")
+        try:
+            pd.driver.quit()
+        except Exception:
+            pass
+        with self._cond:
+            self._live[pd.profile] -= 1
+            self._cond.notify_all()
+
+    # ----- leasing -----
+    def _acquire(self, profile: str, timeout: Optional[float]) -> _PooledDriver:
+        if profile not in self.profiles:
+            raise KeyError(f"unknown driver profile: {profile}")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("driver pool is closed")
+                idle = self._idle.setdefault(profile, [])
+                pd = idle.pop() if idle else None
+                if pd is None and self._live.get(profile, 0) < self.max_size:
+                    self._live[profile] = self._live.get(profile, 0) + 1
+                    create = True
+                elif pd is None:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"no {profile} driver available within {timeout}s")
+                    self._cond.wait(remaining)
+                    continue
+                else:
+                    create = False
+            if create:
+                try:
+                    return self._create(profile)
+                except Exception:
+                    with self._cond:
+                        self._live[profile] -= 1
+                        self._cond.notify_all()
+                    raise
+            if self._expired(pd):
+                self._discard(pd, "max uses/age reached")
+            elif not self._healthy(pd):
+                self._discard(pd, "failed health check")
+            else:
+                return pd
+
+    def _release(self, pd: _PooledDriver, failed: bool) -> None:
+        pd.uses += 1
+        if self._closed or self._expired(pd):
+            self._discard(pd, "max uses/age reached" if not self._closed else "pool closed")
+            return
+        if failed and not self._healthy(pd):
+            self._discard(pd, "crashed during lease")
+            return
+        with self._cond:
+            self._idle.setdefault(pd.profile, []).append(pd)
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, profile: str = "render", timeout: Optional[float] = None) -> Iterator[webdriver.Chrome]:
+        """Borrow a warm driver for ``profile``; it goes back to the pool on exit."""
+        pd = self._acquire(profile, timeout)
+        failed = False
+        try:
+            yield pd.driver
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._release(pd, failed)
+
+    def ensure_capacity(self, n: int) -> None:
+        """Raise the per-profile limit to at least ``n`` live drivers."""
+        with self._cond:
+            self.max_size = max(self.max_size, int(n))
+            self._cond.notify_all()
+
+    def warm(self, profile: str, n: int = 1) -> None:
+        """Start up to ``n`` drivers ahead of time so the first lease is instant."""
+        started = []
+        try:
+            for _ in range(min(n, self.max_size)):
+                started.append(self._acquire(profile, timeout=0))
+        except TimeoutError:
+            pass
+        for pd in started:
+            with self._cond:
+                self._idle.setdefault(profile, []).append(pd)
+                self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = [pd for lst in self._idle.values() for pd in lst]
+            self._idle.clear()
+        for pd in idle:
+            self._discard(pd, "pool closed")
+
+
+_POOL: Optional[DriverPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def driver_pool(cfg: dict | None = None) -> DriverPool:
+    """Process-wide DriverPool, created on first use and closed at exit."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = DriverPool.from_config(cfg)
+            atexit.register(_POOL.close)
+        return _POOL
+
+
 def ffmpeg_bin() -> str:
     return os.getenv("FFMPEG_BIN", "ffmpeg")
 
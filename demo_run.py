@@ -25,11 +25,10 @@ def main():
     print("=> Enqueueing…")
     run_py("enqueue_comment.py", comment, source)
 
-    print("=> Generating reply…")
-    run_py("generate_reply.py")
-
-    print("=> Rendering video…")
-    run_py("render_video.py")
+    print("=> Generating reply and rendering video…")
+    # In-process: no interpreter/driver start-up per step.
+    from pipeline import Pipeline
+    Pipeline(scrape=False, once=True).run()
 
     mp4 = Path("output/queue") / cid / f"{cid}.mp4"
     if mp4.exists():
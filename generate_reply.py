@@ -5,26 +5,33 @@ Generates a short contextual reply for each queue item in output/queue/*.json.
 Features:
 - Uses config.yaml if present (tone profiles, fallback_tone, use_openai flag)
 - Optional CLI overrides: --tone <id>, --max_words <N>, --overwrite
-- OpenAI (optional): set use_openai: true in config.yaml and export OPENAI_API_KEY
+- --changed regenerates only replies whose inputs (comment, tone, prompt,
+  LLM settings, word limit) changed since they were written; --dry-run lists them
+- OpenAI (optional): set use_openai: true in config.yaml and export OPENAI_API_KEY;
+  each leased batch is requested concurrently with rate limiting and retries
+  (llm section in config.yaml, llm_engine.py). Failed requests use the fallback bank.
+- LLM replies are cached per normalized comment/tone/model (reply_cache.py)
 - Safe, noisy logging so you can see exactly what happened
 
 Usage:
   python generate_reply.py
   python generate_reply.py --tone stern --max_words 24
   python generate_reply.py --overwrite
+  python generate_reply.py --changed --dry-run
 """
 
 from pathlib import Path
-import os
 import sys
 import json
+import time
 import random
 import argparse
 import textwrap
 
-from common import load_config, queue_dir, get_logger
+from common import load_config, as_config, queue_dir, get_logger
+from queue_db import QueueDB, worker_id
+from build_graph import BuildManifest
 
-QUEUE_DIR = queue_dir()
 logger = get_logger("generate")
 
 # ---------- Fallback responses if no LLM / config ----------
@@ -58,8 +65,7 @@ def _load_cfg():
     return cfg
 
 def available_tone_ids(cfg):
-    tones = cfg.get("tone_profiles") or []
-    return [t.get("id") for t in tones if isinstance(t, dict) and t.get("id")]
+    return list(as_config(cfg).tones)
 
 def resolve_tone(cfg, cli_tone: str | None):
     # Priority: CLI --tone → config.fallback_tone → first tone id → 'satirical'
@@ -75,11 +81,8 @@ def resolve_tone(cfg, cli_tone: str | None):
 
 def build_prompt(cfg, tone_id, comment_text):
     # Use config tone prompt if available; else a default template
-    tones = cfg.get("tone_profiles") or []
-    tone = next((t for t in tones if t.get("id") == tone_id), None)
-    if tone and tone.get("prompt_template"):
-        template = tone["prompt_template"]
-    else:
+    template = as_config(cfg).tones.get(tone_id)
+    if not template:
         # generic, tone-agnostic prompt
         template = (
             "You are a witty robot. Respond to the human comment: \"{comment}\" "
@@ -91,53 +94,94 @@ def build_prompt(cfg, tone_id, comment_text):
         # if the template uses a different placeholder, fall back safely
         return f"Respond to this comment in under 30 words, playful and safe:\n{comment_text}"
 
-def call_openai_if_enabled(cfg, prompt, max_words):
+_llm_settings = None  # (Config, LLMSettings or None) from the last lookup
+
+def llm_settings(cfg):
+    """LLMSettings when LLM replies are enabled and usable, else None.
+
+    Resolved once per config load, so the missing-key warning is printed
+    once per run (or config edit), not once per batch.
     """
-    Optional OpenAI call. Requires:
-      - cfg['use_openai'] == True
-      - env OPENAI_API_KEY
-    Uses a short output limit (~ max_words) and returns text or None on failure.
+    global _llm_settings
+    cfg = as_config(cfg)
+    cached = _llm_settings
+    if cached is not None and cached[0] is cfg:
+        return cached[1]
+    settings = None
+    if cfg.get("use_openai"):
+        from llm_engine import LLMSettings  # asyncio/http stack only when the LLM is on
+        settings = LLMSettings.from_config(cfg)
+        if settings.needs_key and not settings.api_key:
+            print("[generate] use_openai true, but OPENAI_API_KEY not set — skipping LLM.")
+            settings = None
+    _llm_settings = (cfg, settings)
+    return settings
+
+def generate_texts(cfg, prompts, max_words):
+    """
+    LLM replies for a batch of prompts, requested concurrently (see llm_engine.py:
+    concurrency cap, rate limit, timeouts, retries). None where the LLM is
+    disabled or a request ultimately failed, so the caller can fall back.
     """
-    if not cfg.get("use_openai"):
-        return None
-    if "OPENAI_API_KEY" not in os.environ:
-        print("[generate] use_openai true, but OPENAI_API_KEY not set — skipping LLM.")
-        return None
+    settings = llm_settings(cfg)
+    if settings is None or not prompts:
+        return [None] * len(prompts)
+    from llm_engine import AsyncLLMEngine
+    # Approximate tokens: cap by words * ~2 tokens/word
+    max_tokens = max(32, min(200, int(max_words * 2)))
+    t0 = time.monotonic()
+    with AsyncLLMEngine(settings) as engine:
+        texts = engine.complete_many(prompts, max_tokens)
+    st = engine.stats.summary()
+    print(f"[generate] LLM: {len(prompts)} prompt(s) in {time.monotonic() - t0:.1f}s | "
+          f"ok={st['ok']} retries={st['retries']} failed={st['failed']} p95={st['p95_s']}s")
+    return texts
 
-    # Keep it defensive, models/APIs shift often.
-    try:
-        import openai
-        openai.api_key = os.environ["OPENAI_API_KEY"]
+def generate_replies(cfg, tone_id, comments, max_words):
+    """
+    LLM replies for a batch of comments, reusing the reply cache (reply_cache.py):
+    cached comments cost no request, and a spam wave of the same comment in one
+    batch costs one. None where there is no LLM reply (caller falls back).
+    """
+    settings = llm_settings(cfg)
+    cache = None
+    if settings:
+        from reply_cache import ReplyCache
+        cache = ReplyCache.open(cfg)
+    if cache is None:
+        return generate_texts(cfg, [build_prompt(cfg, tone_id, c) for c in comments], max_words)
+    with cache:
+        texts = [None] * len(comments)
+        ask = {}  # cache key -> indexes of the comments waiting for it
+        for i, c in enumerate(comments):
+            k = cache.key(c, tone_id, settings.model, settings.temperature)
+            if k in ask:
+                ask[k].append(i)
+                cache.hits += 1
+                continue
+            texts[i] = cache.get(k)
+            if texts[i] is None:
+                ask[k] = [i]
+        fresh = generate_texts(cfg, [build_prompt(cfg, tone_id, comments[idx[0]]) for idx in ask.values()], max_words)
+        for (k, idx), text in zip(ask.items(), fresh):
+            if text:
+                cache.put(k, text)
+            for i in idx:
+                texts[i] = text
+        st = cache.stats()
+        if comments:
+            print(f"[generate] Reply cache: {st['hits']} hit(s), {st['misses']} miss(es) "
+                  f"({st['hits'] / len(comments):.0%} of this batch; lifetime {st['lifetime_hit_rate']:.0%})")
+    return texts
 
-        # We try Chat Completions first (most common), then fallback to Responses API if needed.
-        try:
-            # Approximate tokens: cap by words * ~2 tokens/word
-            max_tokens = max(32, min(200, int(max_words * 2)))
-            resp = openai.ChatCompletion.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=max_tokens,
-            )
-            text = resp["choices"][0]["message"]["content"].strip()
-            return text
-        except Exception as e1:
-            print(f"[generate] ChatCompletion failed ({e1}). Trying Responses API…")
-            try:
-                from openai import OpenAI
-                client = OpenAI()
-                resp = client.responses.create(model="gpt-4o-mini", input=prompt, max_output_tokens=max_words*2)
-                # The SDK may expose the text differently depending on version
-                if hasattr(resp, "output_text"):
-                    return (resp.output_text or "").strip()
-                # Fallback: try to find any text-ish field
-                return (getattr(resp, "text", "") or "").strip()
-            except Exception as e2:
-                print(f"[generate] Responses API failed too: {e2}")
-                return None
-    except Exception as e:
-        print(f"[generate] OpenAI import/init failed: {e}")
-        return None
+def call_openai_if_enabled(cfg, prompt, max_words):
+    """
+    Optional LLM call for one prompt. Requires:
+      - cfg['use_openai'] == True
+      - env OPENAI_API_KEY (unless llm.base_url points elsewhere, e.g. the mock server)
+    Returns text or None on failure.
+    """
+    return generate_texts(cfg, [prompt], max_words)[0]
 
 def enforce_word_limit(text: str, max_words: int) -> str:
     words = text.strip().split()
@@ -151,19 +195,28 @@ def pick_fallback_text(tone_id: str, comment_text: str) -> str:
         return f"Robot: I heard '{comment_text[:60]}' — logging for future diplomacy."
     return random.choice(bank)
 
-def process_queue_item(json_path: Path, tone_id: str, cfg: dict, max_words: int, overwrite: bool):
-    data = json.loads(json_path.read_text(encoding="utf-8"))
-    if not overwrite and data.get("reply_text"):
-        print(f"[generate] Skip (already has reply_text): {json_path.name}")
-        return
+def reply_inputs(cfg, tone_id, comment_text, max_words):
+    """What a reply depends on (the "reply" stage in build_graph.py)."""
+    llm = None
+    if cfg.get("use_openai"):
+        from llm_engine import LLMSettings
+        llm = "{0.model}@{0.temperature}".format(LLMSettings.from_config(cfg))
+    return {
+        "comment": comment_text,
+        "tone": tone_id,
+        "prompt": build_prompt(cfg, tone_id, comment_text),
+        "llm": llm,
+        "max_words": max_words,
+    }
 
+def reply_stale(json_path: Path, data: dict, tone_id: str, cfg: dict, max_words: int):
+    """Reason the stored reply is out of date, or None."""
+    if not data.get("reply_text"):
+        return "no reply yet"
     comment = (data.get("comment") or "").strip()
-    if not comment:
-        print(f"[generate] Skip (empty comment): {json_path.name}")
-        return
+    return BuildManifest(json_path.with_suffix("")).stale("reply", reply_inputs(cfg, tone_id, comment, max_words))
 
-    prompt = build_prompt(cfg, tone_id, comment)
-    text = call_openai_if_enabled(cfg, prompt, max_words)
+def _write_reply(json_path: Path, data: dict, comment: str, text, tone_id: str, cfg: dict, max_words: int):
     if not text:
         text = pick_fallback_text(tone_id, comment)
 
@@ -174,38 +227,133 @@ def process_queue_item(json_path: Path, tone_id: str, cfg: dict, max_words: int,
 
     data["reply_text"] = text
     json_path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    BuildManifest(json_path.with_suffix("")).record("reply", reply_inputs(cfg, tone_id, comment, max_words))
     print(f"[generate] Wrote reply_text to: {json_path}  (tone={tone_id}, words≤{max_words})")
 
+def process_queue_items(paths, tone_id: str, cfg: dict, max_words: int, overwrite: bool):
+    """
+    Write reply_text into each queue item; the batch's LLM requests run concurrently.
+    Returns {path: True if the item has a reply afterwards, False if skipped, or the exception}.
+    """
+    results, todo = {}, []
+    for json_path in paths:
+        try:
+            data = json.loads(json_path.read_text(encoding="utf-8"))
+        except Exception as e:
+            results[json_path] = e
+            continue
+        if not overwrite and data.get("reply_text"):
+            print(f"[generate] Skip (already has reply_text): {json_path.name}")
+            results[json_path] = True
+            continue
+
+        comment = (data.get("comment") or "").strip()
+        if not comment:
+            print(f"[generate] Skip (empty comment): {json_path.name}")
+            results[json_path] = False
+            continue
+        todo.append((json_path, data, comment))
+
+    texts = generate_replies(cfg, tone_id, [c for _, _, c in todo], max_words)
+    for (json_path, data, comment), text in zip(todo, texts):
+        try:
+            _write_reply(json_path, data, comment, text, tone_id, cfg, max_words)
+            results[json_path] = True
+        except Exception as e:
+            results[json_path] = e
+    return results
+
+def process_queue_item(json_path: Path, tone_id: str, cfg: dict, max_words: int, overwrite: bool):
+    """Write reply_text into the queue item. Returns True if the item has a reply afterwards."""
+    r = process_queue_items([json_path], tone_id, cfg, max_words, overwrite)[json_path]
+    if isinstance(r, Exception):
+        raise r
+    return r
+
 def main():
     parser = argparse.ArgumentParser(description="Generate AI replies for queue items.")
     parser.add_argument("--tone", help="Override tone id (e.g., satirical|stern|preachy|dry)")
     parser.add_argument("--max_words", type=int, default=30, help="Max words in reply (default: 30)")
     parser.add_argument("--overwrite", action="store_true", help="Regenerate even if reply_text exists")
+    parser.add_argument("--changed", action="store_true",
+                        help="Regenerate existing replies only if their inputs changed")
+    parser.add_argument("--dry-run", action="store_true", help="List replies that would be regenerated, and why")
     args = parser.parse_args()
 
     cfg = _load_cfg()
     tone_id = resolve_tone(cfg, args.tone)
+    qdir = queue_dir(cfg)
 
-    if not QUEUE_DIR.exists():
-        print("[generate] No queue dir found at", QUEUE_DIR)
+    if not qdir.exists():
+        print("[generate] No queue dir found at", qdir)
         sys.exit(0)
 
-    items = sorted(QUEUE_DIR.glob("*.json"))
-    if not items:
-        print("[generate] No queue items found in", QUEUE_DIR)
+    qdb = QueueDB.open(cfg)
+    # --overwrite regenerates items that already have a reply (they then need re-rendering).
+    revisit = args.overwrite or args.changed
+    statuses = ("scraped", "generated", "rendered") if revisit or args.dry_run else ("scraped",)
+    if args.dry_run:
+        for item_id in qdb.ids(statuses):
+            p = qdir / f"{item_id}.json"
+            data = json.loads(p.read_text(encoding="utf-8"))
+            reason = "overwrite" if args.overwrite else reply_stale(p, data, tone_id, cfg, args.max_words)
+            print(f"{item_id}: {'reply    ' + reason if reason else 'up to date'}")
+        qdb.close()
+        sys.exit(0)
+    pending = sum(n for s, n in qdb.counts().items() if s in statuses)
+    if not pending:
+        print("[generate] No queue items to process in", qdir)
         sys.exit(0)
 
-    print(f"[generate] Processing {len(items)} queue item(s) | tone={tone_id} | max_words={args.max_words} | overwrite={args.overwrite}")
+    print(f"[generate] Processing {pending} queue item(s) | tone={tone_id} | max_words={args.max_words} | overwrite={args.overwrite} | changed={args.changed}")
     # Small note about available tones
     ids = available_tone_ids(cfg)
     if ids:
         print(f"[generate] Available tones from config: {', '.join(ids)}")
 
-    for p in items:
-        try:
-            process_queue_item(p, tone_id, cfg, args.max_words, args.overwrite)
-        except Exception as e:
-            print(f"[generate] ERROR processing {p.name}: {e}")
+    me = worker_id()
+    started = time.time()
+    settings = llm_settings(cfg)
+    # Bigger leases with the LLM on, so the engine has enough prompts to overlap
+    batch_size = max(8, settings.concurrency * 4) if settings else 8
+    unchanged = []  # up-to-date items stay leased (so this run doesn't pick them again) until the end
+    try:
+        while True:
+            # Leased items are invisible to other generate workers until completed/released.
+            batch = qdb.lease(statuses, me, limit=batch_size, updated_before=started)
+            if not batch:
+                break
+            todo = {True: [], False: []}  # overwrite? -> paths
+            for item_id in batch:
+                p = qdir / f"{item_id}.json"
+                overwrite = args.overwrite
+                if args.changed and not overwrite:
+                    try:
+                        reason = reply_stale(p, json.loads(p.read_text(encoding="utf-8")), tone_id, cfg, args.max_words)
+                    except (OSError, ValueError) as e:
+                        reason = f"unreadable ({e})"
+                    if not reason:
+                        unchanged.append(item_id)
+                        continue
+                    print(f"[generate] Regenerating {p.name}: {reason}")
+                    overwrite = True
+                todo[overwrite].append(p)
+            for overwrite, paths in todo.items():
+                for p, ok in process_queue_items(paths, tone_id, cfg, args.max_words, overwrite).items():
+                    item_id = p.stem
+                    if isinstance(ok, Exception):
+                        print(f"[generate] ERROR processing {p.name}: {ok}")
+                        qdb.release(item_id, me, error=str(ok))
+                    elif ok:
+                        qdb.complete(item_id, me, "generated")
+                    else:
+                        qdb.release(item_id, me, error="empty comment", retry=False)
+    finally:
+        # Untouched: status and ``updated`` stay as they were, so the moderation
+        # index's stamps (media URLs, ETags) of items that weren't rebuilt hold.
+        for item_id in unchanged:
+            qdb.unlease(item_id, me)
+        qdb.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,297 @@
+# llm_engine.py
+"""
+Concurrent reply generation against an OpenAI-compatible chat completions API.
+
+generate_reply.py hands a whole leased batch of prompts to
+AsyncLLMEngine.complete_many(); requests then run concurrently with:
+- a cap on in-flight requests (llm.concurrency)
+- a token-bucket rate limit (llm.requests_per_second, llm.burst)
+- a per-request timeout (llm.timeout_seconds)
+- retries with exponential backoff and jitter on timeouts, connection
+  errors, 429 and 5xx (Retry-After is honoured), up to llm.max_retries
+
+A prompt whose retries run out comes back as None. The caller then falls
+back to the canned replies (pick_fallback_text), so one bad request never
+stalls the batch.
+
+Offline testing with the bundled mock server:
+
+  python llm_engine.py serve --latency 0.3 --error-rate 0.1   # http://127.0.0.1:8766/v1
+  python llm_engine.py bench --prompts 200                    # throughput/failure report against it
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+import random
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from common import get_logger
+
+logger = get_logger("llm")
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class LLMSettings:
+    base_url: str = DEFAULT_BASE_URL
+    model: str = "gpt-4o-mini"
+    temperature: float = 0.7
+    api_key: Optional[str] = None
+    concurrency: int = 8
+    requests_per_second: float = 5.0
+    burst: int = 5
+    timeout_seconds: float = 20.0
+    max_retries: int = 3
+    backoff_seconds: float = 0.5
+    backoff_max_seconds: float = 8.0
+
+    @classmethod
+    def from_config(cls, cfg: dict | None) -> "LLMSettings":
+        lc = (cfg or {}).get("llm") or {}
+        known = {k: lc[k] for k in cls.__dataclass_fields__ if k in lc and k != "api_key"}
+        return cls(api_key=os.environ.get(lc.get("api_key_env", "OPENAI_API_KEY")), **known)
+
+    @property
+    def needs_key(self) -> bool:
+        return self.base_url.rstrip("/") == DEFAULT_BASE_URL
+
+
+class RetryableError(Exception):
+    def __init__(self, msg: str, retry_after: Optional[float] = None):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens/s, up to ``burst`` saved up."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def chat_completion(s: LLMSettings, prompt: str, max_tokens: int) -> str:
+    """One blocking chat completions call. Raises RetryableError for transient failures."""
+    body = json.dumps({
+        "model": s.model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": s.temperature,
+        "max_tokens": max_tokens,
+    }).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if s.api_key:
+        headers["Authorization"] = f"Bearer {s.api_key}"
+    req = Request(s.base_url.rstrip("/") + "/chat/completions", data=body, headers=headers, method="POST")
+    try:
+        with urlopen(req, timeout=s.timeout_seconds) as r:
+            payload = json.loads(r.read().decode("utf-8"))
+    except HTTPError as e:
+        if e.code in RETRY_STATUS:
+            ra = e.headers.get("Retry-After") if e.headers else None
+            raise RetryableError(f"HTTP {e.code}", float(ra) if ra and ra.replace(".", "", 1).isdigit() else None)
+        raise
+    except (URLError, TimeoutError, ConnectionError) as e:
+        raise RetryableError(str(getattr(e, "reason", e)))
+    return (payload["choices"][0]["message"]["content"] or "").strip()
+
+
+@dataclass
+class EngineStats:
+    requests: int = 0
+    ok: int = 0
+    retries: int = 0
+    failed: int = 0
+    latencies: list = field(default_factory=list)
+
+    def summary(self) -> dict:
+        lat = sorted(self.latencies)
+        p = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))], 3) if lat else None
+        return {"requests": self.requests, "ok": self.ok, "retries": self.retries,
+                "failed": self.failed, "p50_s": p(0.5), "p95_s": p(0.95)}
+
+
+class AsyncLLMEngine:
+    def __init__(self, settings: LLMSettings):
+        self.s = settings
+        self.stats = EngineStats()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, settings.concurrency), thread_name_prefix="llm")
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.s.backoff_max_seconds)
+        cap = min(self.s.backoff_max_seconds, self.s.backoff_seconds * 2 ** attempt)
+        return random.uniform(cap / 2, cap)
+
+    async def complete(self, prompt: str, max_tokens: int, sem: asyncio.Semaphore,
+                       bucket: TokenBucket) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.s.max_retries + 1):
+            async with sem:
+                await bucket.acquire()
+                self.stats.requests += 1
+                t0 = time.monotonic()
+                try:
+                    text = await asyncio.wait_for(
+                        loop.run_in_executor(self._executor, chat_completion, self.s, prompt, max_tokens),
+                        timeout=self.s.timeout_seconds + 1)
+                    self.stats.latencies.append(time.monotonic() - t0)
+                    self.stats.ok += 1
+                    return text or None
+                except (RetryableError, asyncio.TimeoutError) as e:
+                    err, retry_after = e, getattr(e, "retry_after", None)
+                except Exception as e:
+                    logger.warning(f"LLM request failed, not retrying: {e}")
+                    break
+            if attempt < self.s.max_retries:
+                self.stats.retries += 1
+                delay = self._backoff(attempt, retry_after)
+                logger.debug(f"retry {attempt + 1}/{self.s.max_retries} in {delay:.2f}s ({err or 'timeout'})")
+                await asyncio.sleep(delay)
+        self.stats.failed += 1
+        return None
+
+    async def _complete_many(self, prompts: list[str], max_tokens: int) -> list[Optional[str]]:
+        sem = asyncio.Semaphore(max(1, self.s.concurrency))
+        bucket = TokenBucket(self.s.requests_per_second, self.s.burst)
+        return await asyncio.gather(*(self.complete(p, max_tokens, sem, bucket) for p in prompts))
+
+    def complete_many(self, prompts: list[str], max_tokens: int) -> list[Optional[str]]:
+        """Run all prompts concurrently; None where a prompt ultimately failed."""
+        if not prompts:
+            return []
+        return asyncio.run(self._complete_many(list(prompts), max_tokens))
+
+
+# ---------- Offline mock server ----------
+class _MockHandler(BaseHTTPRequestHandler):
+    latency = 0.2
+    error_rate = 0.0
+    hang_rate = 0.0
+    rps = 0.0
+    _lock = threading.Lock()
+    _window: list = []
+    _rng = random.Random(7)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": "not found"}})
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        cls = type(self)
+        with cls._lock:
+            now = time.monotonic()
+            cls._window[:] = [t for t in cls._window if now - t < 1.0]
+            limited = cls.rps and len(cls._window) >= cls.rps
+            if not limited:
+                cls._window.append(now)
+            roll = cls._rng.random()
+        if limited:
+            return self._send(429, {"error": {"message": "rate limited"}}, {"Retry-After": "1"})
+        if roll < cls.hang_rate:
+            time.sleep(60)
+        time.sleep(cls.latency)
+        if roll < cls.hang_rate + cls.error_rate:
+            return self._send(500, {"error": {"message": "mock failure"}})
+        prompt = (body.get("messages") or [{}])[-1].get("content", "")
+        return self._send(200, {"choices": [{"message": {"role": "assistant",
+                                                          "content": f"Beep boop, noted: {prompt[-40:]}"}}]})
+
+    def _send(self, code: int, payload: dict, headers: dict | None = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
+
+
+def serve_mock(port: int = 8766, latency: float = 0.2, error_rate: float = 0.0,
+               hang_rate: float = 0.0, rps: float = 0.0) -> ThreadingHTTPServer:
+    """Start the mock API (serve_forever() it, or run it in a thread). Base URL: http://127.0.0.1:<port>/v1"""
+    handler = type("MockHandler", (_MockHandler,), {
+        "latency": latency, "error_rate": error_rate, "hang_rate": hang_rate, "rps": rps, "_window": []})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    from common import load_config
+    ap = argparse.ArgumentParser(description="Async LLM engine and mock OpenAI-compatible server.")
+    ap.add_argument("cmd", choices=["serve", "bench"])
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--latency", type=float, default=0.3, help="Mock response time (s)")
+    ap.add_argument("--error-rate", type=float, default=0.05, help="Share of 500 responses")
+    ap.add_argument("--hang-rate", type=float, default=0.0, help="Share of requests that never answer in time")
+    ap.add_argument("--rps", type=float, default=0.0, help="Mock server rate limit (429 above it; 0 = none)")
+    ap.add_argument("--prompts", type=int, default=100)
+    ap.add_argument("--sequential", action="store_true", help="bench: one request at a time, for comparison")
+    args = ap.parse_args()
+
+    server = serve_mock(args.port, args.latency, args.error_rate, args.hang_rate, args.rps)
+    base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    if args.cmd == "serve":
+        print(f"Mock chat completions API at {base} (set llm.base_url to use it)")
+        server.serve_forever()
+        return
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    s = LLMSettings.from_config(load_config())
+    s = replace(s, base_url=base, api_key=None, **({"concurrency": 1} if args.sequential else {}))
+    prompts = [f"Respond to comment #{i}: you clanker" for i in range(args.prompts)]
+    try:
+        with AsyncLLMEngine(s) as engine:
+            t0 = time.monotonic()
+            out = engine.complete_many(prompts, max_tokens=60)
+            wall = time.monotonic() - t0
+    finally:
+        server.shutdown()
+    fallbacks = sum(1 for t in out if t is None)
+    print(f"{len(prompts)} prompts in {wall:.2f}s ({len(prompts) / wall:.1f}/s) | "
+          f"concurrency={s.concurrency} rps={s.requests_per_second} timeout={s.timeout_seconds}s")
+    print(f"fallbacks: {fallbacks} | {engine.stats.summary()}")
+
+
+if __name__ == "__main__":
+    main()
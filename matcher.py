@@ -0,0 +1,242 @@
+"""
+Precompiled multi-pattern matcher for comment detection.
+
+Built once from config (``keywords`` + ``regex_variations``) and reused for
+every comment:
+- Literal keywords go into an Aho-Corasick automaton (case-insensitive), so
+  all occurrences of all keywords are found in one walk over the text.
+- Regex variations are validated at load time and joined into a single
+  alternation with one named group per pattern.
+- A C-level prefilter (one compiled union of the literals) lets comments
+  that contain none of the keywords skip the automaton walk entirely.
+
+Usage:
+    m = KeywordMatcher.from_config(cfg)
+    m.first("lol clanker")      # -> (True, "keyword:clanker")
+    m.find_all("lol clanker")   # -> [Match(...), ...]
+    m.match_many(comments)      # -> list of find_all() results
+"""
+from __future__ import annotations
+
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from common import get_logger
+
+logger = get_logger("matcher")
+
+# Leading global inline flags, e.g. "(?i)clank". Python only accepts these at
+# the very start of a whole expression, so they are rewritten to scoped groups
+# "(?i:...)" before the patterns are joined into one alternation.
+_LEADING_FLAGS = re.compile(r"^\(\?([aiLmsux]+)\)")
+
+
+@dataclass(frozen=True)
+class Match:
+    pattern_id: str   # "keyword:<kw>" or "regex:<rx>", same labels as scrape.matches_keyword
+    kind: str         # "keyword" | "regex"
+    index: int        # position of the pattern in its config list
+    start: int
+    end: int
+    text: str
+
+
+class _AhoCorasick:
+    """Minimal Aho-Corasick automaton over lowercase literals."""
+
+    def __init__(self, words: list[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[int]] = [[]]
+        self._lens = [len(w) for w in words]
+        for idx, w in enumerate(words):
+            self._add(w, idx)
+        self._build()
+
+    def _add(self, word: str, idx: int) -> None:
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(idx)
+
+    def _build(self) -> None:
+        q = deque(self._goto[0].values())
+        while q:
+            node = q.popleft()
+            for ch, nxt in self._goto[node].items():
+                q.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str):
+        """Yield (word_index, start, end) for every (overlapping) occurrence."""
+        goto, fail, out, lens = self._goto, self._fail, self._out, self._lens
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for idx in out[node]:
+                yield idx, i + 1 - lens[idx], i + 1
+
+
+def _trie_regex(words: list[str]) -> str:
+    """Regex source for a union of literals with shared prefixes factored out.
+
+    "bolt eater|bolt-eater|bot" -> "bo(?:lt(?:\\ eater|\\-eater)|t)", which the
+    re engine scans far faster than a flat alternation of many literals.
+    """
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        end = "" in node
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if end:
+            # A shorter word ends here: the rest is optional for the prefilter.
+            body = (body if len(alts) > 1 or len(body) == 1 else f"(?:{body})") + "?"
+        return body
+
+    return emit(trie)
+
+
+def _scope_flags(rx: str) -> str:
+    """Turn a leading global flag group into a scoped one: (?i)x -> (?i:x)."""
+    m = _LEADING_FLAGS.match(rx)
+    if not m:
+        return f"(?:{rx})"
+    return f"(?{m.group(1)}:{rx[m.end():]})"
+
+
+class KeywordMatcher:
+    """Compiled matcher for a fixed set of keywords and regex variations.
+
+    Invalid regexes are reported once, at construction; with ``strict=True``
+    they raise ``ValueError`` instead of being skipped.
+    """
+
+    def __init__(self, keywords: Iterable[str] = (), regexes: Iterable[str] = (), strict: bool = False):
+        self.keywords: list[str] = []
+        for kw in keywords:
+            kw = str(kw)
+            if not kw.strip():
+                self._report(strict, f"empty keyword {kw!r}")
+                continue
+            self.keywords.append(kw)
+
+        self.regexes: list[str] = []
+        self._compiled: list[re.Pattern] = []
+        self._regex_index: list[int] = []
+        for i, rx in enumerate(regexes):
+            rx = str(rx)
+            try:
+                self._compiled.append(re.compile(rx))
+            except re.error as e:
+                self._report(strict, f"[regex error] {rx}: {e}")
+                continue
+            self.regexes.append(rx)
+            self._regex_index.append(i)
+
+        lowered = [kw.lower() for kw in self.keywords]
+        self._ac = _AhoCorasick(lowered) if lowered else None
+        self._prefilter = re.compile(_trie_regex(lowered)) if lowered else None
+        self._combined = self._combine()
+
+    @classmethod
+    def from_config(cls, cfg: dict, strict: bool = False) -> "KeywordMatcher":
+        return cls(cfg.get("keywords") or [], cfg.get("regex_variations") or [], strict=strict)
+
+    @staticmethod
+    def _report(strict: bool, msg: str) -> None:
+        if strict:
+            raise ValueError(msg)
+        logger.warning(msg)
+
+    def _combine(self) -> Optional[re.Pattern]:
+        if not self._compiled:
+            return None
+        parts = [f"(?P<r{i}>{_scope_flags(rx)})" for i, rx in enumerate(self.regexes)]
+        try:
+            return re.compile("|".join(parts))
+        except re.error as e:
+            # e.g. numbered backreferences or clashing group names: fall back to
+            # one search per pattern (still compiled once).
+            logger.debug(f"combined regex unavailable, using per-pattern search: {e}")
+            return None
+
+    # ---------- Matching ----------
+    def _keyword_matches(self, text: str) -> list[Match]:
+        if self._ac is None:
+            return []
+        low = text.lower()
+        if not self._prefilter.search(low):
+            return []
+        return [
+            Match(f"keyword:{self.keywords[i]}", "keyword", i, s, e, text[s:e])
+            for i, s, e in self._ac.iter_matches(low)
+        ]
+
+    def _regex_matches(self, text: str) -> list[Match]:
+        out = []
+        if self._combined is not None:
+            for m in self._combined.finditer(text):
+                g = m.lastgroup
+                j = int(g[1:])
+                s, e = m.span(g)
+                out.append(Match(f"regex:{self.regexes[j]}", "regex", self._regex_index[j], s, e, m.group(g)))
+            return out
+        for j, rx in enumerate(self._compiled):
+            for m in rx.finditer(text):
+                out.append(Match(f"regex:{self.regexes[j]}", "regex", self._regex_index[j], m.start(), m.end(), m.group(0)))
+        return out
+
+    def find_all(self, text: str) -> list[Match]:
+        """All keyword occurrences plus non-overlapping regex matches, by position.
+
+        Spans refer to ``text``; for the rare characters whose lowercase form has
+        a different length, keyword spans are approximate.
+        """
+        found = self._keyword_matches(text) + self._regex_matches(text)
+        found.sort(key=lambda m: (m.start, m.kind != "keyword", m.index))
+        return found
+
+    def match_many(self, texts: Iterable[str]) -> list[list[Match]]:
+        return [self.find_all(t) for t in texts]
+
+    def first(self, text: str) -> tuple[bool, Optional[str]]:
+        """Drop-in for scrape.matches_keyword: first keyword, then first regex, in config order."""
+        kws = self._keyword_matches(text)
+        if kws:
+            best = min(kws, key=lambda m: m.index)
+            return True, best.pattern_id
+        if self._combined is not None:
+            if not self._combined.search(text):
+                return False, None
+        # Something matched; resolve config order exactly (only runs on hits).
+        for j, rx in enumerate(self._compiled):
+            if rx.search(text):
+                return True, f"regex:{self.regexes[j]}"
+        return False, None
+
+    def __len__(self) -> int:
+        return len(self.keywords) + len(self.regexes)
@@ -0,0 +1,248 @@
+# moderation_index.py
+"""
+In-memory index of rendered queue items for the moderation server.
+
+Building the moderation page used to mean opening the meta file and the
+queue JSON of every rendered item on every request. The index keeps one
+small Entry per item (comment, reply, tone, matched pattern, date,
+renditions) and only rereads an item's files when its row in the queue DB
+changed:
+
+- Each lookup compares the queue DB version ((item count, newest
+  ``updated``), one indexed query) with the one the index was built from;
+  unchanged means no file is touched.
+- On a change, only items whose ``updated`` moved are reloaded; items that
+  left the listed statuses are dropped.
+- New queue JSON files (scraper, enqueue_comment.py) are imported with
+  QueueDB.sync() at most every ``rescan_seconds``.
+
+Listings are filtered and paginated in memory:
+
+    idx = ModerationIndex.open(cfg)
+    idx.refresh()                    # once per request
+    page = idx.query(Query.from_args({"status": "rendered", "tone": "stern", "page": "2"}))
+    page.items, page.total, page.pages, idx.version
+"""
+from __future__ import annotations
+
+import json
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Mapping, Optional
+
+from build_graph import BuildManifest
+from common import as_config, get_logger
+from queue_db import QueueDB
+
+logger = get_logger("moderation")
+
+LISTED = ("rendered", "approved", "published")
+PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+
+@dataclass
+class Entry:
+    id: str
+    status: str
+    updated: float
+    comment: str = ""
+    reply: str = ""
+    url: str = ""
+    pattern: str = ""
+    tone: str = ""
+    date: str = ""                # YYYY-MM-DD the comment was scraped/enqueued (UTC)
+    timestamp: str = ""
+    video: str = ""               # master MP4
+    renditions: dict[str, str] = field(default_factory=dict)  # name -> file
+
+    @classmethod
+    def load(cls, folder: Path, record: Path, status: str, updated: float) -> Optional["Entry"]:
+        """Entry from the item's artifact folder (meta, build manifest) and queue JSON; None while it has no video."""
+        item_id = folder.name
+        try:
+            meta = json.loads((folder / f"{item_id}.meta.json").read_text(encoding="utf-8"))
+            q = json.loads(record.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        reply_inputs = (BuildManifest(folder).stages.get("reply") or {}).get("inputs") or {}
+        ts = q.get("timestamp") or ""
+        renditions = {name: r["path"] for name, r in (meta.get("renditions") or {}).items() if r.get("path")}
+        return cls(
+            id=item_id, status=status, updated=updated,
+            comment=q.get("comment") or "", reply=meta.get("reply") or q.get("reply_text") or "",
+            url=q.get("url") or "", pattern=str(q.get("matched_pattern") or ""),
+            tone=reply_inputs.get("tone") or q.get("tone") or "",
+            date=ts[:10] if len(ts) >= 10 else datetime.fromtimestamp(updated, timezone.utc).date().isoformat(),
+            timestamp=ts, video=meta.get("video") or "", renditions=renditions,
+        )
+
+    @property
+    def stamp(self) -> str:
+        """Changes whenever the item's files may have (re-render, publish): versions its media URLs."""
+        return f"{int(self.updated * 1000):x}"
+
+    def rendition(self, name: str) -> Optional[str]:
+        """File of a rendition; videos rendered before renditions existed only have the master."""
+        if name in self.renditions:
+            return self.renditions[name]
+        return self.video if name in ("master", "preview") and self.video else None
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "status": self.status, "updated": self.updated, "comment": self.comment,
+                "reply": self.reply, "url": self.url, "pattern": self.pattern, "tone": self.tone,
+                "date": self.date, "timestamp": self.timestamp,
+                "renditions": sorted(n for n in set(self.renditions) | {"master", "preview"} if self.rendition(n))}
+
+
+@dataclass(frozen=True)
+class Query:
+    status: Optional[str] = "rendered"   # None = every listed status
+    tone: Optional[str] = None
+    pattern: Optional[str] = None
+    since: Optional[str] = None          # YYYY-MM-DD, inclusive
+    until: Optional[str] = None
+    page: int = 1
+    per_page: int = PER_PAGE
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> "Query":
+        """Query from request arguments; ValueError on anything malformed."""
+        status = args.get("status") or "rendered"
+        if status == "all":
+            status = None
+        elif status not in LISTED:
+            raise ValueError(f"status must be one of {', '.join(LISTED)} or all")
+        since, until = args.get("since") or None, args.get("until") or None
+        for name, d in (("since", since), ("until", until)):
+            if d:
+                try:
+                    date.fromisoformat(d)
+                except ValueError:
+                    raise ValueError(f"{name} must be a YYYY-MM-DD date") from None
+        try:
+            page = int(args.get("page") or 1)
+            per_page = int(args.get("per_page") or PER_PAGE)
+        except ValueError:
+            raise ValueError("page and per_page must be integers") from None
+        if page < 1 or not 1 <= per_page <= MAX_PER_PAGE:
+            raise ValueError(f"page must be >= 1 and per_page 1..{MAX_PER_PAGE}")
+        return cls(status, args.get("tone") or None, args.get("pattern") or None, since, until, page, per_page)
+
+    def matches(self, e: Entry) -> bool:
+        return ((self.status is None or e.status == self.status)
+                and (self.tone is None or e.tone == self.tone)
+                and (self.pattern is None or e.pattern == self.pattern)
+                and (self.since is None or e.date >= self.since)
+                and (self.until is None or e.date <= self.until))
+
+    def args(self, **changes) -> dict:
+        """Non-default arguments of this query (with ``changes``), for building links."""
+        q = {"status": self.status or "all", "tone": self.tone, "pattern": self.pattern, "since": self.since,
+             "until": self.until, "page": self.page, "per_page": self.per_page, **changes}
+        defaults = {"status": "rendered", "page": 1, "per_page": PER_PAGE}
+        return {k: v for k, v in q.items() if v is not None and defaults.get(k) != v}
+
+
+@dataclass
+class Page:
+    items: list[Entry]
+    total: int
+    page: int
+    per_page: int
+
+    @property
+    def pages(self) -> int:
+        return max(1, math.ceil(self.total / self.per_page))
+
+
+def item_files(qdir: Path, published: Optional[Path], item_id: str, status: str) -> tuple[Path, Path]:
+    """(artifact folder, queue JSON) of an item: published items live in published/<id>/."""
+    if status == "published" and published is not None and (published / item_id).is_dir():
+        folder = published / item_id
+        record = folder / f"{item_id}.json"
+        return folder, record if record.exists() else qdir / f"{item_id}.json"
+    return qdir / item_id, qdir / f"{item_id}.json"
+
+
+class ModerationIndex:
+    def __init__(self, cfg=None, rescan_seconds: float = 10.0):
+        self._cfg = cfg
+        self.rescan_seconds = rescan_seconds
+        self.version: Optional[tuple[int, float]] = None  # queue DB version the index reflects
+        self._entries: dict[str, Entry] = {}
+        self._order: list[Entry] = []
+        self._synced = 0.0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def cfg(self):
+        """The config passed in, else the live one (follows config.yaml edits)."""
+        return as_config(self._cfg)
+
+    @classmethod
+    def open(cls, cfg=None) -> "ModerationIndex":
+        mc = as_config(cfg).get("moderation") or {}
+        return cls(cfg, rescan_seconds=float(mc.get("rescan_seconds", 10)))
+
+    def _db(self) -> QueueDB:
+        """This thread's queue DB connection (opening one costs far more than the version query)."""
+        cfg = self.cfg
+        if getattr(self._local, "cfg", None) is not cfg:  # first use, or config.yaml was reloaded
+            if getattr(self._local, "qdb", None) is not None:
+                self._local.qdb.close()
+            self._local.qdb, self._local.cfg = QueueDB.open(cfg, sync=False), cfg
+        return self._local.qdb
+
+    def refresh(self, force_sync: bool = False, max_age: float = 0.0) -> tuple[int, float]:
+        """Bring the index up to date with the queue DB; returns its version.
+
+        ``max_age``: trust a check made less than that many seconds ago
+        (media requests, which come in bursts of range requests).
+        """
+        if max_age and self.version is not None and time.monotonic() - self._checked < max_age:
+            return self.version
+        with self._lock:
+            qdb = self._db()
+            now = self._checked = time.monotonic()
+            if force_sync or now - self._synced >= self.rescan_seconds:
+                qdb.sync()
+                self._synced = now
+            version = qdb.version()
+            if version == self.version:
+                return version
+            rows = qdb.rows(LISTED)
+            qdir, published = qdb.qdir, qdb.published
+            entries, reloaded = {}, 0
+            for item_id, status, updated in rows:
+                e = self._entries.get(item_id)
+                if e is None or e.updated != updated or e.status != status:
+                    e = Entry.load(*item_files(qdir, published, item_id, status), status, updated)
+                    reloaded += 1
+                if e is not None:
+                    entries[item_id] = e
+            self._entries, self._order = entries, list(entries.values())
+            self.version = version
+            if reloaded:
+                logger.info(f"index: {len(entries)} item(s), {reloaded} (re)loaded")
+            return version
+
+    def get(self, item_id: str) -> Optional[Entry]:
+        return self._entries.get(item_id)
+
+    def query(self, q: Query) -> Page:
+        hits = [e for e in self._order if q.matches(e)]
+        start = (q.page - 1) * q.per_page
+        return Page(hits[start:start + q.per_page], len(hits), q.page, q.per_page)
+
+    def facets(self) -> dict[str, list[str]]:
+        """Tones and matched patterns present in the index (filter choices)."""
+        return {"status": list(LISTED),
+                "tone": sorted({e.tone for e in self._order if e.tone}),
+                "pattern": sorted({e.pattern for e in self._order if e.pattern})}
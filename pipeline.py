@@ -0,0 +1,290 @@
+# pipeline.py
+"""
+Pipeline daemon: scrape -> generate -> synth -> render in one process.
+
+Instead of running scrape.py, generate_reply.py and render_video.py one
+after another (each re-importing everything and waiting for the previous
+one to finish the whole queue), each stage runs as a thread and hands item
+ids to the next through a bounded queue, so an item moves on as soon as
+its stage is done:
+
+    scrape --gen_q--> generate --synth_q--> synth (TTS + envelope) --render_q--> render
+
+- Targets are polled every ``poll_interval_seconds``; items already waiting
+  in the queue DB (enqueue_comment.py, earlier runs) are fed in too.
+- Backpressure: the queues are bounded (render_q is small), so when
+  rendering falls behind, synth, generate and finally the scraper wait
+  instead of piling up work.
+- Stages claim items through the queue DB, so a separate render_video.py
+  or generate_reply.py run can still work alongside.
+- Ctrl-C / SIGTERM: stages finish the item in hand and stop; leases on
+  items still waiting are handed back.
+
+  python pipeline.py               # run forever
+  python pipeline.py --once        # one poll, exit once everything has drained
+  python pipeline.py --no-scrape   # only work through what is already queued
+"""
+from __future__ import annotations
+
+import queue
+import signal
+import argparse
+import threading
+import time
+from collections import Counter
+
+from common import load_config, queue_dir, get_logger
+from queue_db import QueueDB, worker_id
+
+logger = get_logger("pipeline")
+
+
+class Pipeline:
+    def __init__(self, cfg: dict | None = None, scrape: bool = True, once: bool = False):
+        self._cfg = cfg
+        cfg = self.cfg
+        pc = cfg.get("pipeline") or {}
+        self.scrape_enabled = scrape
+        self.once = once
+        self.scrape_workers = int(pc.get("scrape_workers", 1))
+        self.render_threads = max(1, int(pc.get("render_threads", 1)))
+        self.max_words = int(pc.get("max_words", 30))
+        size = int(pc.get("queue_size", 16))
+        self.gen_q: queue.Queue = queue.Queue(maxsize=size)
+        self.synth_q: queue.Queue = queue.Queue(maxsize=size)
+        self.render_q: queue.Queue = queue.Queue(maxsize=int(pc.get("render_queue_size", 2)))
+        self.qdir = queue_dir(cfg)
+        self.owner = worker_id()
+        self.stop = threading.Event()
+        self.counts: Counter = Counter()
+        self._inflight: dict[str, float] = {}  # item id -> time it entered the pipeline
+        self._lock = threading.Lock()
+
+    @property
+    def cfg(self):
+        """The config passed in, else the live one (config.yaml edits apply from the next batch/poll)."""
+        return self._cfg or load_config()
+
+    @property
+    def poll_interval(self) -> float:
+        return float(self.cfg.get("poll_interval_seconds", 300))
+
+    # ---------- plumbing ----------
+    def _admit(self, item_id: str) -> bool:
+        with self._lock:
+            if item_id in self._inflight:
+                return False
+            self._inflight[item_id] = time.monotonic()
+            return True
+
+    def _done(self, item_id: str, outcome: str) -> None:
+        with self._lock:
+            t0 = self._inflight.pop(item_id, None)
+            self.counts[outcome] += 1
+        if outcome == "rendered" and t0 is not None:
+            logger.info(f"{item_id[:12]} rendered {time.monotonic() - t0:.1f}s after entering the pipeline")
+
+    def _put(self, q: queue.Queue, item_id: str) -> bool:
+        """Blocking put (this is the backpressure); gives up on shutdown."""
+        while not self.stop.is_set():
+            try:
+                q.put(item_id, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue, upstream: threading.Event, n: int = 1) -> list[str] | None:
+        """Up to n ids; [] if none yet, None once upstream is finished and q is drained."""
+        try:
+            ids = [q.get(timeout=0.5)]
+        except queue.Empty:
+            return None if (self.stop.is_set() or (upstream.is_set() and q.empty())) else []
+        while len(ids) < n:
+            try:
+                ids.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return ids
+
+    def _path(self, item_id: str):
+        return self.qdir / f"{item_id}.json"
+
+    # ---------- stages ----------
+    def _feed_backlog(self, qdb: QueueDB) -> None:
+        """Queue items that were already waiting (other tools, earlier runs)."""
+        qdb.sync()
+        for status, q in (("scraped", self.gen_q), ("generated", self.synth_q)):
+            for item_id in qdb.ids([status]):
+                if self._admit(item_id) and not self._put(q, item_id):
+                    return
+
+    def _scrape_loop(self, done: threading.Event) -> None:
+        qdb = QueueDB.open(self.cfg, sync=False)
+        try:
+            while not self.stop.is_set():
+                self._feed_backlog(qdb)
+                if self.scrape_enabled:
+                    import scrape
+
+                    def on_item(item_id):
+                        qdb.add(item_id, "scraped")
+                        if self._admit(item_id):
+                            self._put(self.gen_q, item_id)
+
+                    try:
+                        scrape.main_once(workers=self.scrape_workers, on_item=on_item)
+                    except Exception as e:
+                        logger.exception(f"scrape pass failed: {e}")
+                if self.once:
+                    break
+                logger.info(f"next poll in {self.poll_interval:.0f}s | {self.status()}")
+                self.stop.wait(self.poll_interval)
+        finally:
+            qdb.close()
+            done.set()
+
+    def _generate_loop(self, upstream: threading.Event, done: threading.Event) -> None:
+        import generate_reply as gr
+        qdb = QueueDB.open(self.cfg, sync=False)
+        try:
+            seen_cfg = None
+            while True:
+                cfg = self.cfg
+                if cfg is not seen_cfg:  # first batch, or config.yaml was reloaded
+                    settings = gr.llm_settings(cfg)
+                    batch_size = max(8, settings.concurrency * 4) if settings else 8
+                    seen_cfg = cfg
+                if (ids := self._get(self.gen_q, upstream, batch_size)) is None:
+                    break
+                claimed = []
+                for item_id in ids:
+                    if qdb.claim(item_id, self.owner, "scraped"):
+                        claimed.append(item_id)
+                    else:
+                        self._done(item_id, "skipped")  # leased elsewhere or already past this stage
+                if not claimed:
+                    continue
+                try:
+                    results = gr.process_queue_items([self._path(i) for i in claimed], gr.resolve_tone(cfg, None),
+                                                     cfg, self.max_words, overwrite=False)
+                except Exception as e:
+                    logger.exception(f"generate batch failed: {e}")
+                    for item_id in claimed:
+                        qdb.release(item_id, self.owner, error=str(e))
+                        self._done(item_id, "failed")
+                    continue
+                for p, ok in results.items():
+                    item_id = p.stem
+                    if isinstance(ok, Exception):
+                        qdb.release(item_id, self.owner, error=str(ok))
+                        self._done(item_id, "failed")
+                    elif not ok:
+                        qdb.release(item_id, self.owner, error="empty comment", retry=False)
+                        self._done(item_id, "failed")
+                    else:
+                        qdb.complete(item_id, self.owner, "generated")
+                        if not self._put(self.synth_q, item_id):
+                            self._done(item_id, "stopped")
+        finally:
+            qdb.close()
+            done.set()
+
+    def _synth_loop(self, upstream: threading.Event, done: threading.Event) -> None:
+        import render_video as rv
+        qdb = QueueDB.open(self.cfg, sync=False)
+        try:
+            while (ids := self._get(self.synth_q, upstream)) is not None:
+                for item_id in ids:
+                    # The lease is held from here until the render stage completes the item.
+                    if not qdb.claim(item_id, self.owner, "generated", lease_seconds=1800):
+                        self._done(item_id, "skipped")
+                        continue
+                    try:
+                        env = rv.build_video_for_queue_item(self._path(item_id), until="envelope")
+                    except Exception as e:
+                        env, err = None, str(e)
+                    else:
+                        err = "TTS failed"
+                    if env is None:
+                        qdb.release(item_id, self.owner, error=err)
+                        self._done(item_id, "failed")
+                    elif not self._put(self.render_q, item_id):
+                        qdb.unlease(item_id, self.owner)
+                        self._done(item_id, "stopped")
+        finally:
+            qdb.close()
+            done.set()
+
+    def _render_loop(self, upstream: threading.Event) -> None:
+        import render_video as rv
+        qdb = QueueDB.open(self.cfg, sync=False)
+        try:
+            while (ids := self._get(self.render_q, upstream)) is not None:
+                for item_id in ids:
+                    try:
+                        out = rv.build_video_for_queue_item(self._path(item_id))
+                        err = None if out else "render failed"
+                    except Exception as e:
+                        out, err = None, str(e)
+                    if out:
+                        qdb.complete(item_id, self.owner, "rendered")
+                        self._done(item_id, "rendered")
+                    else:
+                        qdb.release(item_id, self.owner, error=err)
+                        self._done(item_id, "failed")
+            # Shutdown: items synthesized but not rendered give their leases back.
+            while True:
+                try:
+                    item_id = self.render_q.get_nowait()
+                except queue.Empty:
+                    break
+                qdb.unlease(item_id, self.owner)
+                self._done(item_id, "stopped")
+        finally:
+            qdb.close()
+
+    # ---------- control ----------
+    def status(self) -> str:
+        c = self.counts
+        return (f"queued gen={self.gen_q.qsize()} synth={self.synth_q.qsize()} render={self.render_q.qsize()}"
+                f" | rendered={c['rendered']} failed={c['failed']} skipped={c['skipped']}")
+
+    def run(self) -> Counter:
+        scraped, generated, synthesized = threading.Event(), threading.Event(), threading.Event()
+        threads = [
+            threading.Thread(target=self._scrape_loop, args=(scraped,), name="scrape"),
+            threading.Thread(target=self._generate_loop, args=(scraped, generated), name="generate"),
+            threading.Thread(target=self._synth_loop, args=(generated, synthesized), name="synth"),
+        ] + [threading.Thread(target=self._render_loop, args=(synthesized,), name=f"render-{i}")
+             for i in range(self.render_threads)]
+
+        def request_stop(signum, frame):
+            logger.info("stopping after the items in hand (Ctrl-C again to force)")
+            self.stop.set()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, request_stop)
+            signal.signal(signal.SIGTERM, request_stop)
+        logger.info(f"pipeline started (scrape={'on' if self.scrape_enabled else 'off'}, "
+                    f"poll every {self.poll_interval:.0f}s, render threads={self.render_threads})")
+        for t in threads:
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout=0.5)
+        logger.info(f"pipeline stopped | {self.status()}")
+        return self.counts
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run scrape -> generate -> synth -> render as one streaming pipeline.")
+    ap.add_argument("--once", action="store_true", help="One poll, then exit when all stages have drained")
+    ap.add_argument("--no-scrape", action="store_true", help="Skip scraping; process items already queued")
+    args = ap.parse_args()
+    Pipeline(scrape=not args.no_scrape, once=args.once).run()
+
+
+if __name__ == "__main__":
+    main()
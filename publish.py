@@ -0,0 +1,219 @@
+# publish.py
+"""
+Approval: move an item's final artifacts into published/ without copying.
+
+    output/queue/<id>/   frames, reply.wav, envelope, HTML, build.json,
+                         <id>.mp4 + renditions, <id>.meta.json
+    output/published/<id>/
+                         <id>.mp4 + renditions (preview, poster, ...),
+                         <id>.meta.json (paths rewritten), build.json, <id>.json
+
+- Only final artifacts are published, and as hardlinks (a copy only when
+  published/ is on another filesystem), so approving costs a few metadata
+  operations instead of tens of MB of I/O, and there is one copy of each
+  video on disk.
+- The published folder is assembled under a temporary name and renamed
+  into place, so readers never see half of it.
+- Approval is a queue DB state change: rendered -> approved (compare-and-
+  set, so concurrent clicks can't both win), then the item is leased while
+  its files are linked and completed as published. Approving an item that
+  is already published, or being published by another request, is a
+  no-op; an approval that died halfway is finished by the next one.
+- Once an item is published, its queue folder (frames, WAV, envelope...)
+  is deleted by a background Janitor. ``moderation.keep_intermediates``
+  turns that off.
+
+  python publish.py <id> [<id> ...]   # approve from the command line
+  python publish.py --gc              # delete leftover folders of published items
+"""
+from __future__ import annotations
+
+import errno
+import json
+import os
+import queue
+import shutil
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+from uuid import uuid4
+
+from common import as_config, get_logger
+from queue_db import QueueDB, worker_id
+
+logger = get_logger("publish")
+
+MANIFEST = "build.json"
+PUBLISH_LEASE_SECONDS = 120
+
+
+def _link(src: Path, dst: Path) -> None:
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        shutil.copy2(src, dst)  # published/ on another filesystem (or no hardlinks there)
+
+
+def is_published(folder: Path) -> bool:
+    """True when ``folder`` holds a meta whose files all live inside it (safe to drop the queue copy)."""
+    try:
+        meta = json.loads((folder / f"{folder.name}.meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    paths = [meta.get("video")] + [r.get("path") for r in (meta.get("renditions") or {}).values()]
+    folder = folder.resolve()
+    return all(p and Path(p).resolve().parent == folder and Path(p).exists() for p in paths)
+
+
+def link_artifacts(item_id: str, qdir: Path, published: Path) -> Path:
+    """Hardlink the final artifacts of a rendered item into published/<id>; returns that folder."""
+    src = qdir / item_id
+    meta = json.loads((src / f"{item_id}.meta.json").read_text(encoding="utf-8"))
+    dst = published / item_id
+    tmp = published / f".{item_id}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        video = Path(meta["video"])
+        _link(video, tmp / video.name)
+        renditions = {}
+        for name, r in (meta.get("renditions") or {}).items():
+            p = Path(r["path"])
+            if p != video:
+                _link(p, tmp / p.name)
+            renditions[name] = {**r, "path": str(dst / p.name)}
+        for extra in (src / MANIFEST, qdir / f"{item_id}.json"):
+            if extra.exists():
+                _link(extra, tmp / extra.name)
+        out = {k: v for k, v in meta.items() if k != "wav"}  # the WAV is an intermediate
+        out.update(video=str(dst / video.name), renditions=renditions,
+                   published_at=datetime.now(timezone.utc).isoformat())
+        (tmp / f"{item_id}.meta.json").write_text(json.dumps(out, indent=2), encoding="utf-8")
+        if dst.exists():  # an earlier publish that died before completing: swap it out
+            old = published / f".{item_id}.{os.getpid()}.{threading.get_ident()}.old"
+            os.replace(dst, old)
+            os.replace(tmp, dst)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp, dst)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return dst
+
+
+def approve(qdb: QueueDB, item_id: str, published: Path) -> str:
+    """Approve and publish one item. Returns its outcome:
+
+    "published"   done now
+    "unchanged"   was already published
+    "in progress" another request is publishing it
+    "not found" / "<status>"  not in a state that can be approved
+    """
+    # A lease owner of its own: worker_id() is shared by every thread of the server,
+    # and claim() lets an owner re-take its own lease.
+    owner = f"{worker_id()}:{uuid4().hex}"
+    qdb.transition(item_id, "rendered", "approved")
+    if not qdb.claim(item_id, owner, "approved", lease_seconds=PUBLISH_LEASE_SECONDS):
+        status = qdb.status(item_id)
+        if status == "published":
+            return "unchanged"
+        return "in progress" if status == "approved" else (status or "not found")
+    try:
+        link_artifacts(item_id, qdb.qdir, published)
+    except Exception as e:
+        logger.error(f"publishing {item_id} failed: {e}")
+        qdb.unlease(item_id, owner)  # stays approved; approving again retries
+        raise
+    qdb.complete(item_id, owner, "published")
+    logger.info(f"published {item_id}")
+    return "published"
+
+
+def approve_many(qdb: QueueDB, ids: Iterable[str], published: Path, janitor: "Janitor | None" = None) -> dict:
+    """approve() for each id (one connection); per-id outcome, or the error for ids that failed."""
+    results = {}
+    for item_id in dict.fromkeys(ids):
+        try:
+            results[item_id] = approve(qdb, item_id, published)
+        except Exception as e:
+            results[item_id] = f"error: {e}"
+        if janitor and results[item_id] in ("published", "unchanged"):
+            janitor.submit(item_id)
+    return results
+
+
+def collect(qdir: Path, published: Path, item_id: str) -> bool:
+    """Delete the queue folder of a published item; False when it isn't safely published."""
+    folder = qdir / item_id
+    if not folder.exists():
+        return False
+    if not is_published(published / item_id):
+        return False
+    shutil.rmtree(folder, ignore_errors=True)
+    return True
+
+
+class Janitor:
+    """Deletes intermediates of published items in a background thread."""
+
+    def __init__(self, cfg=None):
+        self._cfg = cfg
+        self._q: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return not (as_config(self._cfg).get("moderation") or {}).get("keep_intermediates", False)
+
+    def submit(self, item_id: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="janitor", daemon=True)
+                self._thread.start()
+        self._q.put(item_id)
+
+    def sweep(self) -> None:
+        """Queue every published item whose queue folder is still around (crashes, older approvals)."""
+        cfg = as_config(self._cfg)
+        with QueueDB.open(cfg, sync=False) as qdb:
+            for item_id in qdb.ids(["published"]):
+                if (cfg.queue_dir / item_id).exists():
+                    self.submit(item_id)
+
+    def _run(self) -> None:
+        while True:
+            item_id = self._q.get()
+            cfg = as_config(self._cfg)
+            try:
+                if collect(cfg.queue_dir, cfg.published_dir, item_id):
+                    logger.info(f"removed intermediates of {item_id}")
+            except Exception as e:
+                logger.warning(f"cleaning up {item_id} failed: {e}")
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Approve and publish rendered items; clean up after published ones.")
+    ap.add_argument("ids", nargs="*", help="Item ids to approve")
+    ap.add_argument("--gc", action="store_true", help="Delete queue folders of already published items")
+    args = ap.parse_args()
+    cfg = as_config()
+    keep = (cfg.get("moderation") or {}).get("keep_intermediates", False)
+    with QueueDB.open(cfg) as qdb:
+        results = approve_many(qdb, args.ids, cfg.published_dir)
+        for item_id, outcome in results.items():
+            print(f"{item_id}: {outcome}")
+        if args.gc:
+            todo = qdb.ids(["published"])
+        else:
+            todo = [] if keep else [i for i, o in results.items() if o in ("published", "unchanged")]
+        n = sum(collect(cfg.queue_dir, cfg.published_dir, i) for i in todo)
+        if n:
+            print(f"removed intermediates of {n} item(s)")
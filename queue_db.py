@@ -0,0 +1,229 @@
+# queue_db.py
+"""
+Indexed queue state for the pipeline stages.
+
+The queue item payloads stay where they always were (output/queue/<id>.json,
+plus the <id>/ artifact folder until the item is published, see publish.py);
+this SQLite index records where each item is in the pipeline and who is
+working on it:
+
+    scraped -> generated -> rendered -> approved -> published
+                                      (failed: gave up after max attempts)
+
+Workers lease items of a given status for a limited time, so several
+generate/render processes can run side by side; completing a lease moves the
+item to its next status atomically. Queue JSON files that the index does not
+know yet (scraper output, enqueue_comment.py, older queues) are imported by
+sync(), with their status inferred from what is on disk.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+from common import as_config, output_dir, queue_dir, published_dir, get_logger
+
+logger = get_logger("queue_db")
+
+STATES = ("scraped", "generated", "rendered", "approved", "published", "failed")
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def infer_status(qdir: Path, item_id: str, data: dict, published: Optional[Path] = None) -> str:
+    """Status of an item that predates the index, from its files."""
+    if published is not None and (published / item_id / f"{item_id}.meta.json").exists():
+        return "published"  # its queue folder may be gone already
+    folder = qdir / item_id
+    if (folder / f"{item_id}.mp4").exists() and (folder / f"{item_id}.meta.json").exists():
+        return "rendered"
+    if (data.get("reply_text") or "").strip():
+        return "generated"
+    return "scraped"
+
+
+class QueueDB:
+    def __init__(self, path: Path, qdir: Path, max_attempts: int = 3, published: Optional[Path] = None):
+        self.path = Path(path)
+        self.qdir = Path(qdir)
+        self.published = Path(published) if published else None
+        self.max_attempts = max_attempts
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit; multi-statement changes use explicit BEGIN IMMEDIATE.
+        self.db = sqlite3.connect(str(self.path), isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " updated REAL NOT NULL,"
+            " lease_owner TEXT,"
+            " lease_until REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_status ON items(status, lease_until)")
+
+    @classmethod
+    def open(cls, cfg: dict | None = None, sync: bool = True) -> "QueueDB":
+        cfg = as_config(cfg or None)
+        qc = cfg.get("queue_db") or {}
+        q = cls(output_dir(cfg) / qc.get("path", "queue.sqlite"), queue_dir(cfg),
+                max_attempts=qc.get("max_attempts", 3), published=published_dir(cfg))
+        if sync:
+            q.sync()
+        return q
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- Import ----------
+    def sync(self) -> int:
+        """Index queue JSON files not known yet. Only new files are parsed."""
+        if not self.qdir.exists():
+            return 0
+        known = {r[0] for r in self.db.execute("SELECT id FROM items")}
+        rows = []
+        for p in self.qdir.glob("*.json"):
+            if p.stem in known or p.name.endswith(".meta.json"):
+                continue
+            try:
+                data = json.loads(p.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                logger.warning(f"skipping unreadable queue file {p.name}: {e}")
+                continue
+            rows.append((p.stem, infer_status(self.qdir, p.stem, data, self.published), time.time()))
+        if rows:
+            self.db.executemany("INSERT OR IGNORE INTO items (id, status, updated) VALUES (?, ?, ?)", rows)
+            logger.info(f"indexed {len(rows)} new queue item(s)")
+        return len(rows)
+
+    def add(self, item_id: str, status: str = "scraped") -> None:
+        self.db.execute("INSERT OR IGNORE INTO items (id, status, updated) VALUES (?, ?, ?)",
+                        (item_id, status, time.time()))
+
+    # ---------- Queries ----------
+    def status(self, item_id: str) -> Optional[str]:
+        row = self.db.execute("SELECT status FROM items WHERE id = ?", (item_id,)).fetchone()
+        return row[0] if row else None
+
+    def ids(self, statuses: Iterable[str]) -> list[str]:
+        statuses = list(statuses)
+        marks = ",".join("?" * len(statuses))
+        return [r[0] for r in self.db.execute(
+            f"SELECT id FROM items WHERE status IN ({marks}) ORDER BY updated", statuses)]
+
+    def rows(self, statuses: Iterable[str]) -> list[tuple[str, str, float]]:
+        """(id, status, updated) of the items in ``statuses``, oldest change first."""
+        statuses = list(statuses)
+        marks = ",".join("?" * len(statuses))
+        return self.db.execute(
+            f"SELECT id, status, updated FROM items WHERE status IN ({marks}) ORDER BY updated", statuses).fetchall()
+
+    def counts(self) -> dict[str, int]:
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM items GROUP BY status"))
+
+    def version(self) -> tuple[int, float]:
+        """(item count, newest change): differs after any add, transition or removal."""
+        n, newest = self.db.execute("SELECT COUNT(*), MAX(updated) FROM items").fetchone()
+        return n, newest or 0.0
+
+    # ---------- Leasing / transitions ----------
+    def lease(self, statuses: str | Iterable[str], owner: str, limit: int = 1,
+              lease_seconds: float = 600.0, updated_before: Optional[float] = None) -> list[str]:
+        """Claim up to ``limit`` unleased (or lease-expired) items in ``statuses``.
+
+        ``updated_before`` (usually the run's start time) keeps a run from
+        picking up items it already completed or released itself.
+        """
+        statuses = [statuses] if isinstance(statuses, str) else list(statuses)
+        marks = ",".join("?" * len(statuses))
+        now = time.time()
+        before = now if updated_before is None else updated_before
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [r[0] for r in self.db.execute(
+                f"SELECT id FROM items WHERE status IN ({marks}) AND updated <= ?"
+                " AND (lease_until IS NULL OR lease_until < ?) ORDER BY updated LIMIT ?",
+                (*statuses, before, now, limit))]
+            self.db.executemany("UPDATE items SET lease_owner = ?, lease_until = ? WHERE id = ?",
+                                [(owner, now + lease_seconds, i) for i in ids])
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return ids
+
+    def claim(self, item_id: str, owner: str, statuses: str | Iterable[str],
+              lease_seconds: float = 600.0) -> bool:
+        """Lease one specific item if it is in ``statuses`` and not leased by someone else."""
+        statuses = [statuses] if isinstance(statuses, str) else list(statuses)
+        marks = ",".join("?" * len(statuses))
+        now = time.time()
+        cur = self.db.execute(
+            f"UPDATE items SET lease_owner = ?, lease_until = ? WHERE id = ? AND status IN ({marks})"
+            " AND (lease_until IS NULL OR lease_until < ? OR lease_owner = ?)",
+            (owner, now + lease_seconds, item_id, *statuses, now, owner))
+        return cur.rowcount == 1
+
+    def unlease(self, item_id: str, owner: str) -> None:
+        """Hand a lease back untouched (shutdown): no attempt is counted."""
+        self.db.execute("UPDATE items SET lease_owner = NULL, lease_until = NULL WHERE id = ? AND lease_owner = ?",
+                        (item_id, owner))
+
+    def complete(self, item_id: str, owner: str, new_status: str) -> bool:
+        """Finish a lease and move the item on. False if the lease was lost."""
+        assert new_status in STATES, new_status
+        cur = self.db.execute(
+            "UPDATE items SET status = ?, updated = ?, lease_owner = NULL, lease_until = NULL,"
+            " attempts = 0, error = NULL WHERE id = ? AND lease_owner = ?",
+            (new_status, time.time(), item_id, owner))
+        return cur.rowcount == 1
+
+    def release(self, item_id: str, owner: str, error: Optional[str] = None, retry: bool = True) -> None:
+        """Give a lease back after a failure; the item fails for good after max_attempts."""
+        self.db.execute(
+            "UPDATE items SET lease_owner = NULL, lease_until = NULL, attempts = attempts + 1, error = ?,"
+            " status = CASE WHEN ? OR attempts + 1 >= ? THEN 'failed' ELSE status END, updated = ?"
+            " WHERE id = ? AND lease_owner = ?",
+            (error, not retry, self.max_attempts, time.time(), item_id, owner))
+
+    def transition(self, item_id: str, from_statuses: str | Iterable[str], to_status: str) -> bool:
+        """Compare-and-set status change for unleased items (e.g. moderation clicks)."""
+        assert to_status in STATES, to_status
+        from_statuses = [from_statuses] if isinstance(from_statuses, str) else list(from_statuses)
+        marks = ",".join("?" * len(from_statuses))
+        cur = self.db.execute(
+            f"UPDATE items SET status = ?, updated = ? WHERE id = ? AND status IN ({marks})"
+            " AND (lease_until IS NULL OR lease_until < ?)",
+            (to_status, time.time(), item_id, *from_statuses, time.time()))
+        return cur.rowcount == 1
+
+    def set_status(self, item_id: str, status: str) -> None:
+        assert status in STATES, status
+        self.db.execute(
+            "INSERT INTO items (id, status, updated) VALUES (?, ?, ?)"
+            " ON CONFLICT(id) DO UPDATE SET status = excluded.status, updated = excluded.updated,"
+            " lease_owner = NULL, lease_until = NULL",
+            (item_id, status, time.time()))
+
+
+if __name__ == "__main__":
+    from common import load_config
+    with QueueDB.open(load_config()) as q:
+        for status, n in sorted(q.counts().items()):
+            print(f"{status:>10}: {n}")
@@ -0,0 +1,153 @@
+# render_farm.py
+"""
+Parallel rendering: `python render_video.py --workers N`.
+
+The parent process leases queue items from the queue DB and hands them to a
+pool of N worker processes. Each worker imports render_video on its own, so
+it owns its Chrome session (driver pool) and TTS engine for the life of the
+process, and renders one item at a time with build_video_for_queue_item.
+
+Encodes are the CPU-heavy part. A semaphore shared by all workers lets at
+most ``max_encodes`` ffmpeg runs happen at once, and each runs with
+``-threads cores // max_encodes``. The rest of the workers keep capturing
+frames or synthesizing speech meanwhile. (When streaming, capture and encode
+happen in one step, so the slot covers the whole step.)
+
+Failures stay per item: an exception is reported and the item's lease
+released for a retry. A worker process that dies takes down the pool, so
+its in-flight items are released and a fresh pool is started.
+
+Config (config.yaml, render section): workers, max_encodes, encode_threads.
+"""
+from __future__ import annotations
+
+import os
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Optional
+
+from common import load_config, queue_dir, get_logger
+from queue_db import QueueDB, worker_id
+
+logger = get_logger("farm")
+
+
+# ---------- Worker side ----------
+def _init_worker(encode_slots, encode_threads):
+    import render_video
+    from multiprocessing.util import Finalize
+    render_video.configure_worker(encode_slots, encode_threads)
+    # Pool workers skip atexit handlers; close this worker's browsers on shutdown.
+    Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker():
+    import common
+    if common._POOL is not None:
+        common._POOL.close()
+
+
+def _render_one(item_id: str) -> dict:
+    import render_video
+    t0 = time.monotonic()
+    result = {"id": item_id, "pid": os.getpid(), "ok": False, "error": None}
+    try:
+        out = render_video.build_video_for_queue_item(queue_dir() / f"{item_id}.json")
+        result["ok"] = bool(out)
+        if not out:
+            result["error"] = "render failed"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.monotonic() - t0, 2)
+    return result
+
+
+# ---------- Scheduler ----------
+def farm_settings(workers: int, max_encodes: Optional[int] = None, encode_threads: Optional[int] = None):
+    """(max_encodes, threads per encode) that keep encodes from oversubscribing the cores."""
+    rc = load_config().get("render") or {}
+    cores = os.cpu_count() or 1
+    max_encodes = max_encodes or int(rc.get("max_encodes", 0) or 0) or max(1, cores // 2)
+    max_encodes = max(1, min(max_encodes, workers))
+    threads = encode_threads or int(rc.get("encode_threads", 0) or 0) or max(1, cores // max_encodes)
+    return max_encodes, threads
+
+
+def run_farm(workers: int, statuses: Iterable[str] = ("generated",), max_encodes: Optional[int] = None,
+             encode_threads: Optional[int] = None, lease_seconds: float = 1800) -> dict:
+    """Render every leasable item in ``statuses`` with ``workers`` processes. Returns a summary."""
+    statuses = tuple(statuses)
+    max_encodes, threads = farm_settings(workers, max_encodes, encode_threads)
+    ctx = mp.get_context("spawn")  # clean workers: no browser/ffmpeg state inherited from the parent
+    slots = ctx.BoundedSemaphore(max_encodes)
+
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                   initializer=_init_worker, initargs=(slots, threads))
+
+    qdb = QueueDB.open()
+    me, started = worker_id(), time.time()
+    total = sum(n for s, n in qdb.counts().items() if s in statuses)
+    logger.info(f"{total} item(s) to render | workers={workers} max_encodes={max_encodes} threads/encode={threads}")
+
+    results: list[dict] = []
+    inflight: dict = {}
+    pool = new_pool()
+    t0 = time.monotonic()
+    try:
+        while True:
+            if len(inflight) < workers:
+                for item_id in qdb.lease(statuses, me, limit=workers - len(inflight),
+                                         lease_seconds=lease_seconds, updated_before=started):
+                    inflight[pool.submit(_render_one, item_id)] = item_id
+            if not inflight:
+                break
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            broken = False
+            for fut in done:
+                item_id = inflight.pop(fut)
+                try:
+                    r = fut.result()
+                except BrokenProcessPool:
+                    broken = True
+                    r = {"id": item_id, "ok": False, "error": "worker process died", "seconds": None, "pid": None}
+                results.append(r)
+                if r["ok"]:
+                    qdb.complete(item_id, me, "rendered")
+                else:
+                    qdb.release(item_id, me, error=r["error"])
+                status = "ok" if r["ok"] else f"FAILED ({r['error']})"
+                secs = f"{r['seconds']:.1f}s" if r.get("seconds") is not None else "-"
+                logger.info(f"[{len(results)}/{total}] {item_id[:12]} {status} in {secs} (pid {r.get('pid')})")
+            if broken:
+                # Every in-flight future of a broken pool fails; give those items back and start over.
+                for fut, item_id in inflight.items():
+                    qdb.release(item_id, me, error="worker pool restarted")
+                inflight.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        for item_id in inflight.values():
+            qdb.release(item_id, me, error="render farm stopped")
+        qdb.close()
+
+    return _summarize(results, time.monotonic() - t0)
+
+
+def _summarize(results: list[dict], wall: float) -> dict:
+    ok = [r for r in results if r["ok"]]
+    failed = [r for r in results if not r["ok"]]
+    busy = sum(r["seconds"] or 0 for r in results)
+    summary = {"rendered": len(ok), "failed": len(failed), "wall_seconds": round(wall, 1),
+               "item_seconds": round(busy, 1), "results": results}
+    if results:
+        slowest = max(results, key=lambda r: r["seconds"] or 0)
+        logger.info(f"Done: {len(ok)} rendered, {len(failed)} failed in {wall:.1f}s wall "
+                    f"({busy:.1f}s of item time, {busy / max(wall, 1e-9):.1f}x parallel; "
+                    f"slowest {slowest['id'][:12]} {slowest['seconds'] or 0:.1f}s)")
+    for r in failed:
+        logger.warning(f"failed {r['id']}: {r['error']}")
+    return summary
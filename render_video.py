@@ -1,25 +1,67 @@
 # render_video.py
-import json, os, time, subprocess
+import json, os, time, base64, subprocess
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
 from pathlib import Path
 
-from jinja2 import Environment, FileSystemLoader
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-from synth_audio import synth_to_wav
-from audio_envelope import audio_to_envelope
-from common import get_chrome_driver, ffmpeg_bin, queue_dir, get_logger
+# jinja2/selenium (browser engine) and numpy/soundfile (audio_envelope) are
+# imported where they are used, so e.g. the native engine never loads selenium.
+from synth_audio import synth_to_wav, cached_envelope, tts_settings
+from build_graph import BuildManifest, fingerprint, file_hash
+from video_encode import FrameStreamEncoder, renditions_from_config, rendition_args
+from common import get_chrome_driver, driver_pool, ffmpeg_bin, queue_dir, get_logger, as_config
 
 TEMPLATE_DIR = "templates"
-QUEUE_DIR = queue_dir()
 HEADLESS = os.getenv("HEADLESS", "false").lower() in ("1","true","yes")
 FFMPEG_BIN = ffmpeg_bin()
 FPS = 12
-FRAME_COUNT = 72  # ~6s @ 12fps; bump for longer clips
+FRAME_COUNT = 72  # ~6s @ 12fps; default when there is no audio to size the clip from
+VIDEO_ARGS = ["-c:v", "libx264", "-pix_fmt", "yuv420p"]
+_ENCODE_SLOTS = None  # set by render_farm workers to cap concurrent encodes across processes
+_ENCODE_THREADS = None  # render_farm worker override of render.encode_threads
 
 logger = get_logger("render")
 
+
+@dataclass(frozen=True)
+class RenderSettings:
+    """The ``render`` section of config.yaml, resolved once per config load (see render_settings)."""
+    raw: dict
+    capture: str          # virtual | realtime
+    engine: str           # browser | native (avatar_raster.py)
+    stream: bool          # pipe frames into ffmpeg instead of writing PNGs (needs capture=virtual or engine=native)
+    mouth_states: int     # render each of N quantized mouth states once per reply and reuse it (0 = off)
+    renditions: list      # master + preview/poster/vertical... (one ffmpeg pass)
+    encode_threads: int   # ffmpeg -threads (0 = ffmpeg decides)
+    max_seconds: float    # cap on clip length (0 = whole reply)
+
+    @classmethod
+    def from_config(cls, cfg) -> "RenderSettings":
+        rc = dict(cfg.get("render") or {})
+        capture, engine = rc.get("capture", "virtual"), rc.get("engine", "browser")
+        return cls(raw=rc, capture=capture, engine=engine,
+                   stream=bool(rc.get("stream", True)) and (engine == "native" or capture == "virtual"),
+                   mouth_states=int(rc.get("mouth_states", 0) or 0),
+                   renditions=renditions_from_config(rc.get("renditions")),
+                   encode_threads=int(rc.get("encode_threads", 0) or 0),
+                   max_seconds=float(rc.get("max_seconds", 0) or 0))
+
+    def get(self, key, default=None):
+        return self.raw.get(key, default)
+
+
+_settings = None  # (Config, RenderSettings derived from it)
+
+
+def render_settings(cfg=None) -> RenderSettings:
+    """Render settings of ``cfg`` (default: the live config); rebuilt only when config.yaml is reloaded."""
+    global _settings
+    cfg = as_config(cfg)
+    cached = _settings
+    if cached is None or cached[0] is not cfg:
+        cached = _settings = (cfg, RenderSettings.from_config(cfg))
+    return cached[1]
+
 def log(*a):
     logger.info(" ".join(str(x) for x in a))
 
@@ -27,27 +69,266 @@ def get_driver():
     # Delegate to common for consistent setup
     return get_chrome_driver(headless=HEADLESS, window_size="900,600")
 
-def render_html_for_reply(q, amps):
+def configure_worker(encode_slots=None, encode_threads=None):
+    """Render-farm worker setup: shared encode semaphore and per-encode thread count."""
+    global _ENCODE_SLOTS, _ENCODE_THREADS
+    _ENCODE_SLOTS = encode_slots
+    if encode_threads is not None:
+        _ENCODE_THREADS = int(encode_threads)
+
+def _video_args():
+    # -threads only changes how the encode is scheduled, so it stays out of VIDEO_ARGS (and the build fingerprints)
+    threads = _ENCODE_THREADS if _ENCODE_THREADS is not None else render_settings().encode_threads
+    return VIDEO_ARGS + (["-threads", str(threads)] if threads else [])
+
+@contextmanager
+def encode_slot():
+    if _ENCODE_SLOTS is None:
+        yield
+        return
+    t0 = time.monotonic()
+    with _ENCODE_SLOTS:
+        waited = time.monotonic() - t0
+        if waited > 1:
+            log(f"Waited {waited:.1f}s for an encode slot")
+        yield
+
+def render_html_for_reply(q, amps, out_folder=None):
+    from jinja2 import Environment, FileSystemLoader
     env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
     tmpl = env.get_template("robot_template.html")
-    # inject a script tag that sets window._injectedAmps
+    # inject a script tag that sets window._injectedAmps (in <head>, so the
+    # template's own script sees it when it builds window._amps)
     inj = f"<script>var _injectedAmps = {json.dumps(amps)};</script>"
     html = tmpl.render(comment=q["comment"], reply=q["reply_text"], tone="satirical")
-    html = html.replace("</body>", inj + "\n</body>")
+    html = html.replace("</head>", inj + "\n</head>")
 
-    out_folder = QUEUE_DIR / q["id"]
+    out_folder = Path(out_folder) if out_folder else queue_dir() / q["id"]
     out_folder.mkdir(parents=True, exist_ok=True)
     html_path = out_folder / "index.html"
     html_path.write_text(html, encoding="utf-8")
     return html_path, out_folder
 
 def wait_ready(driver):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
     WebDriverWait(driver, 15).until(lambda d: d.execute_script("return document.readyState") == "complete")
     WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, ".robot-svg")))
 
-def capture_frames(html_path: Path, out_folder: Path, frame_count=FRAME_COUNT, fps=FPS) -> int:
-    driver = get_driver()
+# Page time is frozen: no interval/animation-frame callbacks ever run, so the
+# only thing that moves the mouth is our explicit per-frame call.
+_FREEZE_TIMERS_JS = """
+window.setInterval = function () { return 0; };
+window.requestAnimationFrame = function () { return 0; };
+"""
+_NO_TRANSITIONS_JS = """
+const s = document.createElement('style');
+s.textContent = '*, *::before, *::after { transition: none !important; animation: none !important; }';
+document.head.appendChild(s);
+"""
+# Same mapping as the template's advanceFrame(): scale(1, 0.6 + a*0.8)
+_SET_AMP_JS = """
+const m = document.getElementById('mouth-inner');
+if (m) m.setAttribute('transform', 'scale(1, ' + (0.6 + arguments[0] * 0.8) + ')');
+"""
+
+def _clear_frames(out_folder: Path):
+    for pattern in ("frame_*.*", "mouth_*.*", "frames.ffconcat"):
+        for old in out_folder.glob(pattern):
+            old.unlink()
+
+def _shot_params():
+    rs = render_settings()
+    width = int(rs.get("width", 900))
+    height = int(rs.get("height", 600))
+    fmt = rs.get("frame_format", "png")
+    shot = {"format": fmt, "fromSurface": True,
+            "clip": {"x": 0, "y": 0, "width": width, "height": height, "scale": 1}}
+    if fmt == "jpeg":
+        shot["quality"] = int(rs.get("jpeg_quality", 90))
+    return width, height, shot
+
+class MouthSprites:
+    """Quantizes amplitudes into ``states`` mouth states and renders each one once.
+
+    ``render(amp)`` produces a frame (bytes, image...) for an amplitude; calls
+    for an already-rendered state return the cached frame by reference.
+    """
+
+    def __init__(self, render, states: int):
+        self.render = render
+        self.states = max(2, int(states))
+        self.cache = {}
+        self.hits = self.misses = 0
+        self.render_seconds = 0.0
+
+    def level(self, amp: float) -> int:
+        return round(min(max(float(amp), 0.0), 1.0) * (self.states - 1))
+
+    def __call__(self, amp: float):
+        k = self.level(amp)
+        frame = self.cache.get(k)
+        if frame is not None:
+            self.hits += 1
+            return frame
+        t0 = time.perf_counter()
+        frame = self.cache[k] = self.render(k / (self.states - 1))
+        self.render_seconds += time.perf_counter() - t0
+        self.misses += 1
+        return frame
+
+    def report(self) -> dict:
+        total = self.hits + self.misses
+        per_render = self.render_seconds / self.misses if self.misses else 0.0
+        return {"frames": total, "rendered": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "seconds_saved": round(self.hits * per_render, 3)}
+
+def _frame_source(shoot):
+    """Wrap a per-amplitude renderer with the sprite cache when render.mouth_states is set."""
+    states = render_settings().mouth_states
+    return MouthSprites(shoot, states) if states else shoot
+
+def _log_sprites(render):
+    if isinstance(render, MouthSprites):
+        r = render.report()
+        log(f"Mouth sprites: {r['rendered']} rendered for {r['frames']} frames "
+            f"(hit rate {r['hit_rate']:.0%}, ~{r['seconds_saved']}s render time saved)")
+
+@contextmanager
+def virtual_page(html_path: Path):
+    """Open ``html_path`` with page time frozen; yields (shoot, amps).
+
+    shoot(amp) sets the mouth and returns the Page.captureScreenshot bytes at
+    render.width x render.height in render.frame_format (png|jpeg): no sleeps,
+    and the same input gives the same bytes. amps is the page's amplitude list.
+    """
+    width, height, shot = _shot_params()
+    with driver_pool().lease("render") as driver:
+        script = driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": _FREEZE_TIMERS_JS})
+        driver.execute_cdp_cmd("Emulation.setDeviceMetricsOverride",
+                               {"width": width, "height": height, "deviceScaleFactor": 1, "mobile": False})
+        try:
+            url = html_path.resolve().as_uri()
+            log("Opening", url, f"(HEADLESS={HEADLESS}, capture=virtual)")
+            driver.get(url)
+            wait_ready(driver)
+            driver.execute_script(_NO_TRANSITIONS_JS)
+            amps = driver.execute_script("return window._amps || [];") or [0.2]
+
+            def shoot(amp):
+                driver.execute_script(_SET_AMP_JS, float(amp))
+                return base64.b64decode(driver.execute_cdp_cmd("Page.captureScreenshot", shot)["data"])
+
+            yield shoot, amps
+        finally:
+            # The browser goes back to the pool: undo per-page overrides.
+            try:
+                driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": script["identifier"]})
+                driver.execute_cdp_cmd("Emulation.clearDeviceMetricsOverride", {})
+            except Exception:
+                pass
+
+def iter_frames_virtual(html_path: Path, frame_count=FRAME_COUNT):
+    """Yield encoded frames (png/jpeg bytes); frame i shows amps[i % len(amps)]."""
+    with virtual_page(html_path) as (shoot, amps):
+        render = _frame_source(shoot)
+        for i in range(frame_count):
+            yield render(amps[i % len(amps)])
+        _log_sprites(render)
+
+def write_frames(out_folder: Path, shoot, amps, frame_count: int, ext: str, fps=FPS) -> int:
+    """Write the clip's frames for combine().
+
+    Without sprites: frame_%03d.<ext>. With render.mouth_states: one
+    mouth_NN.<ext> per distinct state plus frames.ffconcat referencing them.
+    """
+    _clear_frames(out_folder)
+    render = _frame_source(shoot)
+    if not isinstance(render, MouthSprites):
+        for i in range(frame_count):
+            (out_folder / f"frame_{i:03d}.{ext}").write_bytes(render(amps[i % len(amps)]))
+        log(f"Wrote {frame_count} frames to {out_folder}")
+        return frame_count
+
+    runs = []  # [sprite file, frames]
+    for i in range(frame_count):
+        a = amps[i % len(amps)]
+        name = f"mouth_{render.level(a):02d}.{ext}"
+        data = render(a)
+        if not (out_folder / name).exists():
+            (out_folder / name).write_bytes(data)
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    lines = ["ffconcat version 1.0"]
+    for name, n in runs:
+        lines += [f"file '{name}'", f"duration {n / fps:.6f}"]
+    lines.append(f"file '{runs[-1][0]}'")  # concat demuxer ignores the last duration otherwise
+    (out_folder / "frames.ffconcat").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    _log_sprites(render)
+    return frame_count
+
+def capture_frames_virtual(html_path: Path, out_folder: Path, frame_count=FRAME_COUNT) -> int:
+    """Deterministic capture to files (see write_frames)."""
+    ext = "jpg" if render_settings().get("frame_format", "png") == "jpeg" else "png"
+    with virtual_page(html_path) as (shoot, amps):
+        return write_frames(out_folder, shoot, amps, frame_count, ext)
+
+def render_frames_native_files(q, amps, out_folder: Path, frame_count=FRAME_COUNT) -> int:
+    from io import BytesIO
+    from avatar_raster import MouthCompositor, static_layer
+    comp = MouthCompositor(static_layer(q["comment"], q["reply_text"]))
+
+    def shoot(amp):
+        buf = BytesIO()
+        comp.frame(amp).save(buf, format="PNG", compress_level=1)
+        return buf.getvalue()
+
+    return write_frames(out_folder, shoot, list(amps) or [0.2], frame_count, "png")
+
+def stream_video(q, amps, wav_path: Path, mp4_out: Path, frame_count=FRAME_COUNT, fps=FPS) -> int:
+    """Render frames straight into ffmpeg (with the audio) without frame files.
+
+    Returns the number of frames encoded; on failure ffmpeg is stopped and no
+    MP4 is left behind.
+    """
+    rs = render_settings()
+    buf = int(rs.get("stream_buffer_frames", 24))
+    if rs.engine == "native":
+        from avatar_raster import MouthCompositor, static_layer, W, H
+        enc = FrameStreamEncoder(mp4_out, wav_path, fps, "rawvideo", size=(W, H), buffer_frames=buf,
+                                 video_args=_video_args(), renditions=rs.renditions, frame_count=frame_count)
+        comp = MouthCompositor(static_layer(q["comment"], q["reply_text"]))
+        render = _frame_source(lambda a: comp.frame(a).tobytes())
+        amps = list(amps) or [0.2]
+        frames = (render(amps[i % len(amps)]) for i in range(frame_count))
+    else:
+        html_path, _ = render_html_for_reply(q, amps)
+        codec = "mjpeg" if rs.get("frame_format", "png") == "jpeg" else "png"
+        enc = FrameStreamEncoder(mp4_out, wav_path, fps, "image2pipe", image_codec=codec, buffer_frames=buf,
+                                 video_args=_video_args(), renditions=rs.renditions, frame_count=frame_count)
+        render = None
+        frames = iter_frames_virtual(html_path, frame_count)
     try:
+        with enc:
+            for frame in frames:
+                enc.write(frame)
+    finally:
+        frames.close()  # release the pooled browser even if encoding failed midway
+    if render is not None:
+        _log_sprites(render)
+    log(f"Streamed {enc.frames} frames into {mp4_out}")
+    return enc.frames
+
+def capture_frames(html_path: Path, out_folder: Path, frame_count=FRAME_COUNT, fps=FPS) -> int:
+    if render_settings().capture == "virtual":
+        return capture_frames_virtual(html_path, out_folder, frame_count)
+    # Warm browser from the shared pool; it stays alive for the next item.
+    _clear_frames(out_folder)
+    with driver_pool().lease("render") as driver:
         url = html_path.resolve().as_uri()
         log("Opening", url, f"(HEADLESS={HEADLESS})")
         driver.get(url)
@@ -74,55 +355,220 @@ def capture_frames(html_path: Path, out_folder: Path, frame_count=FRAME_COUNT, f
         n = len(list(out_folder.glob("frame_*.png")))
         log(f"Wrote {n} frames to {out_folder}")
         return n
-    finally:
-        try: driver.quit()
-        except: pass
-
-def combine(out_folder: Path, audio_path: Path, out_video_path: Path, fps=FPS):
-    pattern = str(out_folder / "frame_%03d.png")
-    cmd = [FFMPEG_BIN, "-y", "-framerate", str(fps), "-i", pattern,
-           "-i", str(audio_path), "-c:v", "libx264", "-pix_fmt", "yuv420p",
-           "-c:a", "aac", "-shortest", str(out_video_path)]
+
+def combine(out_folder: Path, audio_path: Path, out_video_path: Path, fps=FPS, frame_count=FRAME_COUNT):
+    """Encode the frame files (or sprite sequence) and the audio into every rendition in one ffmpeg run."""
+    concat = out_folder / "frames.ffconcat"
+    if concat.exists():
+        # Sprite sequence: frames reference the per-state images (see write_frames)
+        inputs = ["-f", "concat", "-safe", "0", "-i", str(concat)]
+        rate = ["-r", str(fps)]
+    else:
+        ext = "jpg" if (out_folder / "frame_000.jpg").exists() else "png"
+        inputs = ["-framerate", str(fps), "-i", str(out_folder / f"frame_%03d.{ext}")]
+        rate = []
+    renditions = render_settings().renditions
+    outputs = {r.name: r.path_for(out_video_path) for r in renditions}
+    cmd = [FFMPEG_BIN, "-y", *inputs, "-i", str(audio_path),
+           *rendition_args(renditions, outputs, _video_args(), fps, frame_count, audio_input=1, rate_args=rate)]
     log("Running ffmpeg:", " ".join(cmd))
     subprocess.check_call(cmd)
 
-def build_video_for_queue_item(qpath: Path):
+def _envelope_params(frame_count, rs):
+    return {"n_frames": frame_count, "fps": FPS, "floor": 0.2, "ceil": 1.0,
+            "attack_ms": float(rs.get("attack_ms", 0) or 0),
+            "release_ms": float(rs.get("release_ms", 0) or 0)}
+
+def render_stage_inputs(q, out_folder: Path, rs: "RenderSettings | None" = None) -> dict:
+    """Inputs of the wav -> envelope -> frames -> mp4 stages (see build_graph.py).
+
+    Each stage includes the fingerprint of the one before it. The frame count
+    comes from the WAV on disk, so recompute after rebuilding the audio.
+    """
+    rs = rs or render_settings()
+    rate, voice = tts_settings()
+    wav_path = out_folder / "reply.wav"
+    wav = {"text": q["reply_text"], "voice": voice, "rate": rate}
+    frame_count = None
+    if wav_path.exists():
+        from audio_envelope import frame_count_for
+        frame_count = frame_count_for(wav_path, FPS, max_frames=int(rs.max_seconds * FPS) or None)
+    envelope = {"wav": fingerprint(wav), **_envelope_params(frame_count, rs)}
+    source = (Path(TEMPLATE_DIR) / "robot_template.html") if rs.engine == "browser" else Path(__file__).with_name("avatar_raster.py")
+    frames = {"envelope": fingerprint(envelope), "comment": q["comment"], "reply": q["reply_text"],
+              "engine": rs.engine, "source": file_hash(source), "mouth_states": rs.mouth_states, "fps": FPS}
+    if rs.engine == "browser":
+        frames.update(capture=rs.capture, format=rs.get("frame_format", "png"),
+                      jpeg_quality=rs.get("jpeg_quality", 90),
+                      size=[rs.get("width", 900), rs.get("height", 600)])
+    mp4 = {"frames": fingerprint(frames), "wav": fingerprint(wav), "video": VIDEO_ARGS, "audio": "aac", "fps": FPS,
+           "renditions": [asdict(r) for r in rs.renditions]}
+    return {"wav": wav, "envelope": envelope, "frames": frames, "mp4": mp4}
+
+def _frame_artifacts(out_folder: Path):
+    if (out_folder / "frames.ffconcat").exists():
+        return [out_folder / "frames.ffconcat"]
+    ext = "jpg" if (out_folder / "frame_000.jpg").exists() else "png"
+    return [out_folder / f"frame_000.{ext}"]
+
+def build_video_for_queue_item(qpath: Path, dry_run=False, until="mp4"):
+    """Rebuild whichever of wav/envelope/frames/mp4 is out of date for this item.
+
+    Returns the MP4 path (None on failure). With dry_run, nothing is built and
+    the {stage: reason} plan is returned instead. until="envelope" stops after
+    the audio stages and returns the envelope path (pipeline.py's synth stage).
+    """
     q = json.loads(qpath.read_text(encoding="utf-8"))
     if "reply_text" not in q or not q["reply_text"].strip():
         log("Queue item missing reply_text; run generate_reply.py first:", qpath)
         return None
 
-    out_folder = QUEUE_DIR / q["id"]
+    out_folder = qpath.parent / q["id"]
     wav_path = out_folder / "reply.wav"
-    synth_to_wav(q["reply_text"], wav_path)
-    if not wav_path.exists() or wav_path.stat().st_size == 0:
-        log("ERROR: TTS failed; no WAV at", wav_path)
-        return None
+    env_path = out_folder / "envelope.json"
+    mp4_out = out_folder / f"{q['id']}.mp4"
+    meta_path = out_folder / f"{q['id']}.meta.json"
+    manifest = BuildManifest(out_folder)
+    rs = render_settings()  # one view of the config for the whole item
+    plan = {}
 
-    # Compute mouth amplitudes from audio
-    amps = audio_to_envelope(wav_path, n_frames=FRAME_COUNT, fps=FPS, floor=0.2, ceil=1.0)
+    def stale(stage, artifacts):
+        # In a dry run nothing upstream is rebuilt, so report the cascade instead.
+        if dry_run and plan:
+            plan[stage] = f"upstream {list(plan)[-1]} rebuilt"
+            return plan[stage]
+        reason = manifest.stale(stage, render_stage_inputs(q, out_folder, rs)[stage], artifacts)
+        if reason:
+            plan[stage] = reason
+            log(f"{q['id']}: {stage} out of date ({reason})")
+        return reason
 
-    html_path, out_folder = render_html_for_reply(q, amps)
-    frames = capture_frames(html_path, out_folder)
-    if frames == 0:
-        log("ERROR: No frames captured.")
-        return None
+    if stale("wav", wav_path) and not dry_run:
+        synth_to_wav(q["reply_text"], wav_path)
+        if not wav_path.exists() or wav_path.stat().st_size == 0:
+            log("ERROR: TTS failed; no WAV at", wav_path)
+            return None
+        manifest.record("wav", render_stage_inputs(q, out_folder, rs)["wav"])
 
-    mp4_out = out_folder / f"{q['id']}.mp4"
-    combine(out_folder, wav_path, mp4_out)
-    (out_folder / f"{q['id']}.meta.json").write_text(
-        json.dumps({"video": str(mp4_out), "wav": str(wav_path), "reply": q["reply_text"]}, indent=2),
+    # Compute mouth amplitudes from audio; one frame per 1/FPS of the reply
+    if stale("envelope", env_path) and not dry_run:
+        env = render_stage_inputs(q, out_folder, rs)["envelope"]
+        params = {k: v for k, v in env.items() if k != "wav"}
+        from audio_envelope import audio_to_envelope
+        # Repeated replies reuse the envelope stored next to their cached WAV
+        amps = cached_envelope(q["reply_text"], params, lambda: audio_to_envelope(wav_path, **params))
+        env_path.write_text(json.dumps(amps), encoding="utf-8")
+        manifest.record("envelope", env)
+    if until == "envelope" and not dry_run:
+        return env_path
+
+    # Streamed frames exist only inside the MP4, so frames and mp4 go together there.
+    frames_reason = stale("frames", mp4_out if rs.stream else _frame_artifacts(out_folder))
+    mp4_reason = stale("mp4", [r.path_for(mp4_out) for r in rs.renditions] + [meta_path])
+    if dry_run:
+        if rs.stream and mp4_reason and not frames_reason:
+            plan["frames"] = "streamed into the mp4"
+        return plan
+    if not (frames_reason or mp4_reason):
+        log(f"{q['id']}: up to date")
+        return mp4_out
+
+    inputs = render_stage_inputs(q, out_folder, rs)
+    amps = json.loads(env_path.read_text(encoding="utf-8"))
+    frame_count = inputs["envelope"]["n_frames"] or FRAME_COUNT
+    if rs.stream:
+        _clear_frames(out_folder)  # frames from earlier file-based renders
+        try:
+            # Capture and encode overlap here, so the slot covers the whole stream.
+            with encode_slot():
+                frames = stream_video(q, amps, wav_path, mp4_out, frame_count)
+        except Exception as e:
+            log("ERROR: streaming encode failed:", e)
+            return None
+        manifest.record("frames", inputs["frames"])
+    else:
+        if frames_reason:
+            if rs.engine == "native":
+                frames = render_frames_native_files(q, amps, out_folder, frame_count)
+            else:
+                html_path, out_folder = render_html_for_reply(q, amps)
+                frames = capture_frames(html_path, out_folder, frame_count)
+            if frames == 0:
+                log("ERROR: No frames captured.")
+                return None
+            manifest.record("frames", inputs["frames"])
+        with encode_slot():
+            combine(out_folder, wav_path, mp4_out, frame_count=frame_count)
+
+    renditions = {r.name: {"path": str(r.path_for(mp4_out)), "bytes": r.path_for(mp4_out).stat().st_size,
+                           **{k: v for k, v in asdict(r).items() if v is not None and k != "name"}}
+                  for r in rs.renditions}
+    meta_path.write_text(
+        json.dumps({"video": str(mp4_out), "wav": str(wav_path), "reply": q["reply_text"],
+                    "renditions": renditions}, indent=2),
         encoding="utf-8"
     )
+    manifest.record("mp4", inputs["mp4"])
     log("Video created:", mp4_out)
     return mp4_out
 
+def dry_run_report(qdb, statuses):
+    """Print what a render run would rebuild per item, and why."""
+    qdir = queue_dir()
+    for item_id in qdb.ids(statuses):
+        plan = build_video_for_queue_item(qdir / f"{item_id}.json", dry_run=True)
+        if plan is None:
+            continue
+        if not plan:
+            print(f"{item_id}: up to date")
+        for stage, reason in (plan or {}).items():
+            print(f"{item_id}: {stage:<8} {reason}")
+
 if __name__ == "__main__":
-    import glob
+    import argparse
+    from queue_db import QueueDB, worker_id
+    ap = argparse.ArgumentParser(description="Render reply videos for queue items.")
+    ap.add_argument("--rebuild", action="store_true",
+                    help="Also revisit rendered items and rebuild whatever changed")
+    ap.add_argument("--dry-run", action="store_true", help="Only report what would be rebuilt and why")
+    ap.add_argument("--workers", type=int, default=int(render_settings().get("workers", 1) or 1),
+                    help="Render items in N worker processes (default: render.workers or 1)")
+    ap.add_argument("--max-encodes", type=int, default=None,
+                    help="Concurrent ffmpeg encodes across workers (default: render.max_encodes or cores/2)")
+    args = ap.parse_args()
+
     log(f"HEADLESS={HEADLESS}, FFMPEG_BIN={FFMPEG_BIN}")
-    qfiles = glob.glob(str(QUEUE_DIR / "*.json"))
-    if not qfiles:
-        log("No queue items found in", QUEUE_DIR)
-    for p in qfiles:
+    QUEUE_DIR = queue_dir()
+    qdb = QueueDB.open()
+    statuses = ("generated", "rendered") if args.rebuild or args.dry_run else ("generated",)
+    if args.dry_run:
+        dry_run_report(qdb, statuses)
+        qdb.close()
+        raise SystemExit(0)
+    if args.workers > 1:
+        from render_farm import run_farm
+        qdb.close()
+        summary = run_farm(args.workers, statuses, max_encodes=args.max_encodes)
+        raise SystemExit(1 if summary["failed"] and not summary["rendered"] else 0)
+    me, started = worker_id(), time.time()
+    if not any(qdb.counts().get(s) for s in statuses):
+        log("No queue items waiting for render in", QUEUE_DIR)
+    while True:
+        # Only items with a reply and no finished render; other render workers skip leased ones.
+        batch = qdb.lease(statuses, me, limit=1, lease_seconds=1800, updated_before=started)
+        if not batch:
+            break
+        item_id = batch[0]
+        p = QUEUE_DIR / f"{item_id}.json"
         log("Rendering", p)
-        build_video_for_queue_item(Path(p))
+        try:
+            out = build_video_for_queue_item(p)
+        except Exception as e:
+            log("ERROR rendering", p, e)
+            qdb.release(item_id, me, error=str(e))
+            continue
+        if out:
+            qdb.complete(item_id, me, "rendered")
+        else:
+            qdb.release(item_id, me, error="render failed")
+    qdb.close()
@@ -0,0 +1,168 @@
+# reply_cache.py
+"""
+Persistent cache of LLM replies, so spam waves don't cost one API call each.
+
+Key: (normalized comment, tone id, model, temperature). Normalizing folds
+case, drops emoji/symbols and invisible characters, squeezes repeated
+punctuation and collapses whitespace, so "CLANKER 🤖🤖!!!" and " clanker! "
+share an entry.
+
+Reuse policies (reply_cache.policy):
+- "always": reuse the newest cached reply for the key.
+- "sample": keep up to ``variants`` replies per key; misses until that many
+  exist, then a random one of them is reused.
+
+Entries expire after ttl_days, and the least recently used ones are evicted
+past max_entries. Hit/miss counters are kept in the same SQLite file:
+
+  python reply_cache.py        # entries and lifetime hit rate
+"""
+from __future__ import annotations
+
+import hashlib
+import random
+import re
+import sqlite3
+import time
+import unicodedata
+from pathlib import Path
+from typing import Optional
+
+from common import output_dir, get_logger
+
+logger = get_logger("reply_cache")
+
+_REPEATED_PUNCT = re.compile(r"([^\w\s])\1+")
+_SPACE_BEFORE_PUNCT = re.compile(r"\s+([^\w\s])")
+
+
+def normalize_comment(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    # S* = symbols (emoji included), C* = control/format (ZWJ, variation selectors...)
+    text = "".join(ch for ch in text if unicodedata.category(ch)[0] not in "SC" or ch.isspace())
+    text = _SPACE_BEFORE_PUNCT.sub(r"\1", _REPEATED_PUNCT.sub(r"\1", text))
+    return " ".join(text.split())
+
+
+class ReplyCache:
+    def __init__(self, path: Path, ttl_seconds: Optional[float] = None, max_entries: int = 20000,
+                 policy: str = "always", variants: int = 3):
+        if policy not in ("always", "sample"):
+            raise ValueError(f"unknown reply_cache policy: {policy}")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = float(ttl_seconds) if ttl_seconds else None
+        self.max_entries = int(max_entries)
+        self.policy = policy
+        self.variants = max(1, int(variants)) if policy == "sample" else 1
+        self.hits = self.misses = 0
+        self.db = sqlite3.connect(str(self.path), isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS replies ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " uses INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS replies_key ON replies(key, created)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS replies_last_used ON replies(last_used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @classmethod
+    def open(cls, cfg: dict | None = None) -> Optional["ReplyCache"]:
+        """The cache configured under ``reply_cache``; None when disabled."""
+        cfg = cfg or {}
+        rc = cfg.get("reply_cache") or {}
+        if not rc.get("enabled", True):
+            return None
+        ttl_days = rc.get("ttl_days") or 0
+        return cls(output_dir(cfg) / rc.get("path", "reply_cache.sqlite"),
+                   ttl_seconds=ttl_days * 86400 if ttl_days else None,
+                   max_entries=rc.get("max_entries", 20000),
+                   policy=rc.get("policy", "always"), variants=rc.get("variants", 3))
+
+    @staticmethod
+    def key(comment: str, tone_id: str, model: str, temperature: float) -> str:
+        raw = "\x1f".join([normalize_comment(comment), tone_id or "", model or "", f"{float(temperature):g}"])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ----- lookups -----
+    def _fresh(self, key: str) -> list[tuple[int, str]]:
+        cutoff = time.time() - self.ttl if self.ttl else 0
+        return self.db.execute("SELECT id, text FROM replies WHERE key = ? AND created >= ? ORDER BY created DESC",
+                               (key, cutoff)).fetchall()
+
+    def get(self, key: str) -> Optional[str]:
+        """A cached reply per the policy, or None (a miss: generate one and put() it)."""
+        rows = self._fresh(key)
+        if len(rows) < self.variants:
+            self.misses += 1
+            return None
+        rid, text = rows[0] if self.policy == "always" else random.choice(rows)
+        self.db.execute("UPDATE replies SET last_used = ?, uses = uses + 1 WHERE id = ?", (time.time(), rid))
+        self.hits += 1
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        now = time.time()
+        self.db.execute("INSERT INTO replies (key, text, created, last_used) VALUES (?, ?, ?, ?)",
+                        (key, text, now, now))
+        # Only the newest ``variants`` replies per key are ever served
+        self.db.execute("DELETE FROM replies WHERE key = ? AND id NOT IN"
+                        " (SELECT id FROM replies WHERE key = ? ORDER BY created DESC LIMIT ?)",
+                        (key, key, self.variants))
+
+    # ----- maintenance -----
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones past max_entries."""
+        removed = 0
+        if self.ttl:
+            removed += self.db.execute("DELETE FROM replies WHERE created < ?", (time.time() - self.ttl,)).rowcount
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            removed += self.db.execute("DELETE FROM replies WHERE id IN"
+                                       " (SELECT id FROM replies ORDER BY last_used LIMIT ?)", (excess,)).rowcount
+        return removed
+
+    def stats(self) -> dict:
+        total = dict(self.db.execute("SELECT name, value FROM counters"))
+        hits, misses = total.get("hits", 0) + self.hits, total.get("misses", 0) + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self),
+                "lifetime_hits": hits, "lifetime_misses": misses,
+                "lifetime_hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0}
+
+    def close(self) -> None:
+        try:
+            self.db.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                [("hits", self.hits), ("misses", self.misses)])
+            self.hits = self.misses = 0
+            self.evict()
+        finally:
+            self.db.close()
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM replies").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    from common import load_config
+    cache = ReplyCache.open(load_config())
+    if cache is None:
+        print("reply_cache is disabled")
+    else:
+        with cache:
+            for k, v in cache.stats().items():
+                if k.startswith("lifetime") or k == "entries":
+                    print(f"{k:>20}: {v}")
@@ -1,8 +1,6 @@
 #!/usr/bin/env bash
 set -e
-echo "Run scraper -> generate replies -> render -> server"
-python scrape.py
-python generate_reply.py
-python render_video.py
+echo "Run scraper -> generate replies -> render (one pass) -> server"
+python pipeline.py --once
 echo "Start moderation UI at http://localhost:5004"
 python server.py
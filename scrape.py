@@ -1,8 +1,9 @@
 # scrape.py
 import os
-import re
 import json
 import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime, timezone
 
@@ -11,44 +12,35 @@ from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-from common import load_config, ensure_dirs, queue_dir, sha256, get_chrome_driver
+from common import (
+    load_config, as_config, ensure_dirs, queue_dir, sha256, driver_pool,
+)
+import comment_api
+from seen_store import open_seen_store
 
 STATE_FILE = str((Path(__file__).parent / "output/seen_comments.json").resolve())
 
 
 # ---------- Config / FS helpers ----------
 def _load_cfg():
-    return load_config() or {}
-
-
-def load_seen():
-    p = Path(STATE_FILE)
-    if not p.exists():
-        return set()
-    with p.open("r", encoding="utf-8") as f:
-        return set(json.load(f))
-
-
-def save_seen(seen):
-    Path(STATE_FILE).parent.mkdir(parents=True, exist_ok=True)
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(list(seen), f, indent=2)
+    # Cached and re-checked for edits, so each pass of a long-running scraper sees new targets/keywords.
+    return load_config()
 
 
 def hash_text(s: str) -> str:
     return sha256(s)
 
 
-# ---------- WebDriver ----------
-def get_driver():
-    driver = get_chrome_driver(headless=False, window_size="1280,2000")
-    try:
-        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
-            "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined});"
-        })
-    except Exception:
-        pass
-    return driver
+def item_key(c: dict) -> str:
+    """Queue item id / seen hash of a scraped comment.
+
+    The comment id when the source provides one (network ingestion always
+    does), so two comments with the same text stay two items; otherwise the
+    text hash, and identical texts collapse into one item.
+    """
+    cid = c.get("comment_id")
+    return sha256(f"cid:{cid}") if cid else hash_text(c["text"])
+
 
 # ---------- Scraping ----------
 def _accept_cookies_if_present(driver):
@@ -88,14 +80,186 @@ def _click_show_more_if_present(driver, attempts=3):
             break
 
 
-def find_comments_on_page(driver, url):
+# Comment containers, as CSS, for the in-page count probe (mirrors the XPaths below).
+COMMENT_ITEM_CSS = "div[data-e2e*='comment-item'], div[class*='comment-item'], div[class*='CommentItem']"
+
+# Records when the DOM last gained nodes; installed once per document.
+_OBSERVER_JS = """
+if (!window.__acObs && document.body) {
+  window.__acLast = performance.now();
+  window.__acObs = new MutationObserver(function (muts) {
+    for (const m of muts) {
+      if (m.addedNodes.length) { window.__acLast = performance.now(); break; }
+    }
+  });
+  window.__acObs.observe(document.body, {childList: true, subtree: true});
+}
+"""
+
+# -> [comment item count, ms since the last DOM insertion]
+_PROBE_JS = """
+return [document.querySelectorAll(arguments[0]).length,
+        performance.now() - (window.__acLast || 0)];
+"""
+
+_SCROLL_AND_MORE_JS = """
+window.scrollBy(0, arguments[0]);
+const b = Array.from(document.querySelectorAll('button'))
+  .find(e => /More comments|Show more/.test(e.textContent || ''));
+if (b) { b.click(); return true; }
+return false;
+"""
+
+LOADING_DEFAULTS = {
+    "mode": "adaptive",     # adaptive | fixed (old fixed sleeps)
+    "max_seconds": 30.0,    # total budget per page
+    "max_rounds": 40,       # scroll rounds per page
+    "stable_rounds": 3,     # stop after this many rounds without new comments
+    "round_timeout": 2.5,   # max wait for new comments after one scroll
+    "quiet_ms": 800,        # ...or until the DOM has been quiet this long
+    "poll": 0.15,
+    "scroll_px": 800,
+    "extraction": "script",  # script (one round-trip, structured) | xpath (per-element reads)
+}
+
+
+def _probe(driver):
+    try:
+        count, quiet = driver.execute_script(_PROBE_JS, COMMENT_ITEM_CSS)
+        return int(count), float(quiet)
+    except (WebDriverException, TypeError, ValueError):
+        return 0, float("inf")
+
+
+def _load_comments_adaptive(driver, opts):
+    """Scroll while new comment items keep arriving; stop once stable or out of budget.
+
+    Returns stats: rounds, items (comment containers in the DOM), stop reason.
+    """
+    t0 = time.monotonic()
+    driver.execute_script(_OBSERVER_JS)
+    count, _ = _probe(driver)
+    rounds = stable = 0
+    reason = "max_rounds"
+    while rounds < opts["max_rounds"]:
+        if time.monotonic() - t0 >= opts["max_seconds"]:
+            reason = "budget"
+            break
+        try:
+            driver.execute_script(_SCROLL_AND_MORE_JS, opts["scroll_px"])
+        except WebDriverException:
+            pass
+        rounds += 1
+
+        round_start = time.monotonic()
+
+        def grew_or_quiet(d, before=count, start=round_start):
+            # Quiet only counts once it covers the time since this scroll,
+            # so a slow network fetch is not mistaken for the end of the list.
+            n, quiet = _probe(d)
+            waited_ms = (time.monotonic() - start) * 1000
+            return n > before or quiet >= max(opts["quiet_ms"], waited_ms)
+
+        try:
+            WebDriverWait(driver, opts["round_timeout"], poll_frequency=opts["poll"]).until(grew_or_quiet)
+        except TimeoutException:
+            pass
+        n, _ = _probe(driver)
+        if n > count:
+            count, stable = n, 0
+        else:
+            stable += 1
+            if stable >= opts["stable_rounds"]:
+                reason = "stable"
+                break
+    return {"rounds": rounds, "items": count, "stop_reason": reason}
+
+
+def find_comments_on_page(driver, url, stats=None, loading=None):
+    """Load ``url`` and return its comments as [{"text", "scraped_at"}].
+
+    ``loading`` overrides LOADING_DEFAULTS (config ``comment_loading``). If a
+    ``stats`` dict is given it is filled with load latency and comment yield.
+    """
+    opts = {**LOADING_DEFAULTS, **(loading or {})}
+    t0 = time.monotonic()
     driver.get(url)
-    time.sleep(3)  # initial settle
 
-    _accept_cookies_if_present(driver)
-    _scroll_to_load_comments(driver, rounds=6)
-    _click_show_more_if_present(driver, attempts=3)
+    if opts["mode"] == "fixed":
+        time.sleep(3)  # initial settle
+        _accept_cookies_if_present(driver)
+        _scroll_to_load_comments(driver, rounds=6)
+        _click_show_more_if_present(driver, attempts=3)
+        load = {"rounds": 6, "items": _probe(driver)[0], "stop_reason": "fixed"}
+        selector_wait = 10
+    else:
+        try:
+            WebDriverWait(driver, 15, poll_frequency=opts["poll"]).until(
+                lambda d: d.execute_script("return document.readyState") == "complete")
+        except TimeoutException:
+            pass
+        _accept_cookies_if_present(driver)
+        load = _load_comments_adaptive(driver, opts)
+        # Loading already waited for the list; only give selectors a short grace.
+        selector_wait = 2 if load["items"] else 5
+    load_seconds = time.monotonic() - t0
+
+    records, method = [], "script"
+    if opts["extraction"] == "script":
+        records = _extract_comments_script(driver)
+    if not records:
+        records, method = _extract_comments_xpath(driver, selector_wait), "xpath"
+
+    comments = _filter_comments(records, datetime.now(timezone.utc).isoformat())
+
+    if stats is not None:
+        stats.update(load)
+        stats["load_seconds"] = round(load_seconds, 2)
+        stats["total_seconds"] = round(time.monotonic() - t0, 2)
+        stats["comments"] = len(comments)
+        stats["extraction"] = method
+    return comments
+
+
+# One in-page pass over the outermost comment containers -> list of plain dicts.
+_EXTRACT_JS = """
+const sel = arguments[0];
+const timeRx = /^(\\d+[smhdw]( ago)?|.* ago|\\d{1,2}-\\d{1,2}|\\d{4}-\\d{1,2}-\\d{1,2})$/i;
+const txt = el => (el && el.innerText || '').trim();
+const out = [];
+for (const root of document.querySelectorAll(sel)) {
+  if (root.parentElement && root.parentElement.closest(sel)) continue;  // nested match
+  const body = root.querySelector("[data-e2e^='comment-level'], p[data-e2e*='comment'], p")
+            || root.querySelector('span');
+  const link = root.querySelector("a[href*='/@']");
+  const handle = link ? ((link.getAttribute('href') || '').match(/@([^/?#]+)/) || [])[1] : null;
+  const likes = root.querySelector("[data-e2e*='like-count']");
+  let when = root.querySelector("[data-e2e*='comment-time']");
+  if (!when) when = Array.from(root.querySelectorAll('span')).find(s => timeRx.test(txt(s)));
+  out.push({
+    text: txt(body),
+    author: handle || null,
+    comment_id: root.getAttribute('data-id') || root.getAttribute('data-comment-id') || root.id || null,
+    likes: likes ? txt(likes) : null,
+    time: when ? txt(when) : null,
+  });
+}
+return out;
+"""
+
+
+def _extract_comments_script(driver):
+    """Structured comment records from a single execute_script round-trip."""
+    try:
+        records = driver.execute_script(_EXTRACT_JS, COMMENT_ITEM_CSS) or []
+    except WebDriverException as e:
+        print(f"[scrape] script extraction failed, falling back to XPath: {e}")
+        return []
+    return [r for r in records if isinstance(r, dict) and r.get("text")]
+
 
+def _extract_comments_xpath(driver, selector_wait):
+    """Legacy extraction: overlapping XPath selectors, one el.text call per element."""
     # Multiple fallback selectors because TikTok DOM changes often
     selectors = [
         "//div[contains(@data-e2e,'comment-item')]//*[self::p or self::span]",
@@ -106,7 +270,7 @@ def find_comments_on_page(driver, url):
     elements = []
     for sel in selectors:
         try:
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, sel)))
+            WebDriverWait(driver, selector_wait).until(EC.presence_of_element_located((By.XPATH, sel)))
             els = driver.find_elements(By.XPATH, sel)
             elements.extend(els)
         except TimeoutException:
@@ -117,88 +281,165 @@ def find_comments_on_page(driver, url):
         ps = driver.find_elements(By.TAG_NAME, "p")
         elements = [p for p in ps if len(p.text.strip()) > 2][:200]
 
-    now_iso = datetime.now(timezone.utc).isoformat()
+    return [{"text": el.text} for el in elements]
+
+
+# Obvious UI noise (you can add more strings here)
+JUNK = (
+    "Log in", "Sign up", "Download", "Open app", "Follow", "Share",
+    "Copy link", "Add comment", "Reply", "Like"
+)
+
+
+def _filter_comments(records, scraped_at):
+    """Drop UI noise and duplicate texts; keep any extra fields the extractor found."""
     seen_texts = set()
     comments = []
-
-    for el in elements:
-        txt = el.text.strip()
+    for r in records:
+        txt = (r.get("text") or "").strip()
         if not txt or len(txt) < 3:
             continue
-        # Filter obvious UI noise (you can add more strings here)
-        junk = (
-            "Log in", "Sign up", "Download", "Open app", "Follow", "Share",
-            "Copy link", "Add comment", "Reply", "Like"
-        )
-        if any(j in txt for j in junk):
+        if any(j in txt for j in JUNK):
             continue
         if txt in seen_texts:
             continue
         seen_texts.add(txt)
-        comments.append({"text": txt, "scraped_at": now_iso})
-
+        c = {k: v for k, v in r.items() if v is not None}
+        c.update(text=txt, scraped_at=scraped_at)
+        comments.append(c)
     return comments
 
 
+def scrape_page(driver, url, stats=None, loading=None, mode="dom"):
+    """Comments for one target: DOM scraping, or the comment API responses (mode="network")."""
+    if mode == "network":
+        return comment_api.fetch_comments_via_network(driver, url, stats=stats)
+    return find_comments_on_page(driver, url, stats=stats, loading=loading)
+
+
 # ---------- Matching ----------
+def get_matcher(cfg):
+    """Compiled KeywordMatcher for this config (built once per config load)."""
+    return as_config(cfg).matcher
+
+
 def matches_keyword(cfg, comment_text):
-    text = comment_text.lower()
-    for kw in cfg.get("keywords", []):
-        if kw.lower() in text:
-            return True, f"keyword:{kw}"
-    for rx in cfg.get("regex_variations", []):
-        try:
-            if re.search(rx, comment_text):
-                return True, f"regex:{rx}"
-        except re.error as e:
-            print(f"[regex error] {rx}: {e}")
-    return False, None
+    return get_matcher(cfg).first(comment_text)
 
 
 # ---------- Main ----------
-def main_once():
+def _ingest(cfg, url, comments, seen, matcher, on_item=None):
+    """Match new comments, write queue items, mark them seen. Returns match count.
+
+    ``on_item(item_id)`` is called for each queue item written (pipeline.py hands
+    them straight to the next stage).
+    """
+    matched_count = 0
+    for c in comments:
+        h = item_key(c)
+        if h in seen:
+            continue
+        matched, pattern = matcher.first(c["text"])
+        if matched:
+            matched_count += 1
+            print("Matched:", c["text"], "| via", pattern)
+            out = {
+                "id": h,
+                "url": url,
+                "comment": c["text"],
+                "matched_pattern": str(pattern),
+                "timestamp": c["scraped_at"],
+            }
+            for k in ("comment_id", "author", "likes", "time"):
+                if c.get(k) not in (None, ""):
+                    out[k] = c[k]
+            qpath = queue_dir(cfg) / f"{h}.json"
+            with open(qpath, "w", encoding="utf-8") as f:
+                json.dump(out, f, indent=2, ensure_ascii=False)
+            if on_item is not None:
+                on_item(h)
+        seen.add(h)
+    return matched_count
+
+
+def _scrape_target(pool, profile, url, loading, mode):
+    """Worker body: lease a browser, load one target. Returns (comments, seconds, stats)."""
+    with pool.lease(profile) as driver:
+        t0 = time.monotonic()
+        stats = {}
+        comments = scrape_page(driver, url, stats=stats, loading=loading, mode=mode)
+        return comments, time.monotonic() - t0, stats
+
+
+def _print_timings(timings):
+    if not timings:
+        return
+    print("\nPer-target timings:")
+    for url, secs, n_comments, n_matched, err, stats in timings:
+        status = f"error: {err}" if err else f"{n_comments} comments, {n_matched} matched"
+        load = ""
+        if stats:
+            load = (f" | load {stats['load_seconds']:.1f}s, {stats['rounds']} rounds,"
+                    f" {stats['items']} items, stop={stats['stop_reason']}")
+        print(f"  {secs:7.1f}s  {url}  ({status}){load}")
+
+
+def main_once(workers=1, mode=None, on_item=None):
     cfg = _load_cfg()
     ensure_dirs(cfg)
-    seen = load_seen()
-    driver = get_driver()
-
-    try:
-        for t in cfg.get("targets", []):
-            url = t["url"]
-            print("Scraping", url)
-            try:
-                comments = find_comments_on_page(driver, url)
-            except WebDriverException as e:
-                print(f"[driver error] {e}")
-                continue
-
-            for c in comments:
-                h = hash_text(c["text"])
-                if h in seen:
-                    continue
-                matched, pattern = matches_keyword(cfg, c["text"])
-                if matched:
-                    print("Matched:", c["text"], "| via", pattern)
-                    out = {
-                        "id": h,
-                        "url": url,
-                        "comment": c["text"],
-                        "matched_pattern": str(pattern),
-                        "timestamp": c["scraped_at"],
-                    }
-                    qpath = queue_dir(cfg) / f"{h}.json"
-                    with open(qpath, "w", encoding="utf-8") as f:
-                        json.dump(out, f, indent=2, ensure_ascii=False)
-                seen.add(h)
-
-        save_seen(seen)
-
-    finally:
-        try:
-            driver.quit()
-        except Exception:
-            pass
+    # Hashes are committed as they are added, so a crash mid-run keeps progress.
+    with open_seen_store(cfg, legacy_json=STATE_FILE) as seen:
+        matcher = get_matcher(cfg)
+        pool = driver_pool(cfg)
+        urls = cfg.targets
+        loading = cfg.get("comment_loading") or {}
+        mode = mode or cfg.get("ingestion", "dom")
+        profile = "scrape_network" if mode == "network" else "scrape"  # only network mode needs the performance log
+        timings = []
+
+        if workers <= 1:
+            with pool.lease(profile) as driver:
+                for url in urls:
+                    print("Scraping", url)
+                    t0 = time.monotonic()
+                    stats = {}
+                    try:
+                        comments = scrape_page(driver, url, stats=stats, loading=loading, mode=mode)
+                    except (WebDriverException, comment_api.CommentAPIError) as e:
+                        print(f"[driver error] {e}")
+                        timings.append((url, time.monotonic() - t0, 0, 0, e.__class__.__name__, None))
+                        continue
+                    n = _ingest(cfg, url, comments, seen, matcher, on_item)
+                    timings.append((url, time.monotonic() - t0, len(comments), n, None, stats))
+        else:
+            # Browsers scrape in parallel; matching, queue writes and the seen set
+            # stay on this thread so results merge without locking.
+            pool.ensure_capacity(workers)
+            if os.getenv("CHROME_USER_DATA_DIR"):
+                print("[scrape] --workers > 1: parallel browsers cannot share CHROME_USER_DATA_DIR; using fresh profiles")
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scrape") as ex:
+                futures = {}
+                for url in urls:
+                    print("Scraping", url)
+                    futures[ex.submit(_scrape_target, pool, f"{profile}_worker", url, loading, mode)] = url
+                for fut in as_completed(futures):
+                    url = futures[fut]
+                    try:
+                        comments, secs, stats = fut.result()
+                    except Exception as e:
+                        print(f"[driver error] {url}: {e}")
+                        timings.append((url, 0.0, 0, 0, e.__class__.__name__, None))
+                        continue
+                    n = _ingest(cfg, url, comments, seen, matcher, on_item)
+                    timings.append((url, secs, len(comments), n, None, stats))
+
+    _print_timings(timings)
 
 
 if __name__ == "__main__":
-    main_once()
+    ap = argparse.ArgumentParser(description="Scrape configured TikTok targets for robo-slur comments.")
+    ap.add_argument("--workers", type=int, default=1, help="Parallel browser sessions (default: 1)")
+    ap.add_argument("--mode", choices=["dom", "network"],
+                    help="dom: scrape the page | network: read the comment API responses (default: config ingestion)")
+    args = ap.parse_args()
+    main_once(workers=args.workers, mode=args.mode)
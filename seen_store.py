@@ -0,0 +1,266 @@
+# seen_store.py
+"""
+Seen-comment stores for scrape.py.
+
+Backends:
+- "sqlite" (default): indexed on-disk table; each add() is committed on its
+  own, so a crash mid-run loses nothing. Optional TTL expiry and an optional
+  Bloom filter in front for fast "definitely not seen" answers.
+- "json": the original output/seen_comments.json set (load all, save all).
+
+The first time the SQLite store is opened next to an existing
+seen_comments.json, the JSON hashes are imported and the file is renamed to
+seen_comments.json.migrated.
+
+Config (config.yaml):
+    seen_store:
+      backend: sqlite
+      path: seen_comments.sqlite   # relative to output_dir
+      ttl_days: 0                  # 0/absent = never expire
+      bloom: true
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterable, Optional
+
+from common import output_dir, get_logger
+
+logger = get_logger("seen_store")
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys (no deletes)."""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.01):
+        capacity = max(1000, int(capacity))
+        self.m = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, key: str):
+        # Keys are usually sha256 hex already; anything else is hashed first.
+        if len(key) < 32:
+            key = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        h1 = int(key[:16], 16)
+        h2 = int(key[16:32], 16) | 1
+        for i in range(self.k):
+            yield (h1 + i * h2) % self.m
+
+    def add(self, key: str) -> None:
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class SeenStore(ABC):
+    """Interface shared by the backends (a set-like of comment hashes)."""
+
+    @abstractmethod
+    def __contains__(self, h: str) -> bool:
+        ...
+
+    @abstractmethod
+    def add(self, h: str) -> None:
+        ...
+
+    def add_many(self, hashes: Iterable[str]) -> None:
+        for h in hashes:
+            self.add(h)
+
+    def expire(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonSeenStore(SeenStore):
+    """The original whole-file JSON set; saved on close()."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._seen: set[str] = set()
+        if self.path.exists():
+            self._seen = set(json.loads(self.path.read_text(encoding="utf-8")))
+
+    def __contains__(self, h: str) -> bool:
+        return h in self._seen
+
+    def add(self, h: str) -> None:
+        self._seen.add(h)
+
+    def close(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(list(self._seen), indent=2), encoding="utf-8")
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+class SqliteSeenStore(SeenStore):
+    """SQLite-backed store: O(1) indexed lookups and incremental, durable inserts."""
+
+    def __init__(self, path: Path, ttl_seconds: Optional[float] = None, bloom: bool = True):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = float(ttl_seconds) if ttl_seconds else None
+        self.db = sqlite3.connect(str(self.path), isolation_level=None)  # autocommit
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " hash TEXT NOT NULL UNIQUE,"
+            " first_seen REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS seen_first_seen ON seen(first_seen)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS bloom ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1),"
+            " m INTEGER, k INTEGER, capacity INTEGER, count INTEGER, upto INTEGER, bits BLOB)"
+        )
+        self._upto = 0  # every row with id <= this is in the Bloom filter
+        self.bloom = self._load_bloom() if bloom else None
+
+    # ----- Bloom persistence -----
+    def _load_bloom(self) -> BloomFilter:
+        """Bloom bits are saved on close() together with the last row id they cover;
+        rows added after that (e.g. by a run that crashed) are replayed on open."""
+        n = len(self)
+        row = self.db.execute("SELECT m, k, capacity, count, upto, bits FROM bloom WHERE id = 1").fetchone()
+        bf = None
+        if row and row[2] >= n:
+            bf = BloomFilter.__new__(BloomFilter)
+            bf.m, bf.k, bf.capacity, bf.count, self._upto = row[0], row[1], row[2], row[3], row[4]
+            bf.bits = bytearray(row[5])
+        if bf is None:
+            bf = BloomFilter(capacity=max(1_000_000, n * 2))
+        self._replay(bf)
+        return bf
+
+    def _replay(self, bf: BloomFilter) -> None:
+        """Add rows past the watermark to ``bf`` and advance it to the last row actually read."""
+        for row_id, h in self.db.execute("SELECT id, hash FROM seen WHERE id > ? ORDER BY id", (self._upto,)):
+            if h not in bf:
+                bf.add(h)
+            self._upto = row_id
+
+    def _save_bloom(self) -> None:
+        if self.bloom is None:
+            return
+        # Other processes may have inserted rows while this one ran; they are only
+        # covered once read, so the snapshot never claims rows its bits don't hold.
+        self._replay(self.bloom)
+        b = self.bloom
+        self.db.execute(
+            "INSERT OR REPLACE INTO bloom (id, m, k, capacity, count, upto, bits) VALUES (1, ?, ?, ?, ?, ?, ?)",
+            (b.m, b.k, b.capacity, b.count, self._upto, bytes(b.bits)),
+        )
+
+    # ----- SeenStore -----
+    def __contains__(self, h: str) -> bool:
+        if self.bloom is not None and h not in self.bloom:
+            return False
+        row = self.db.execute("SELECT first_seen FROM seen WHERE hash = ?", (h,)).fetchone()
+        if row is None:
+            return False
+        return self.ttl is None or row[0] >= time.time() - self.ttl
+
+    def add(self, h: str) -> None:
+        # Re-seeing an expired hash refreshes it.
+        self.db.execute(
+            "INSERT INTO seen (hash, first_seen) VALUES (?, ?) "
+            "ON CONFLICT(hash) DO UPDATE SET first_seen = excluded.first_seen "
+            "WHERE ? IS NOT NULL AND seen.first_seen < ?",
+            (h, time.time(), self.ttl, time.time() - (self.ttl or 0)),
+        )
+        if self.bloom is not None:
+            self.bloom.add(h)
+
+    def add_many(self, hashes: Iterable[str], first_seen: Optional[float] = None) -> None:
+        ts = time.time() if first_seen is None else first_seen
+        hashes = list(hashes)
+        self.db.execute("BEGIN")
+        try:
+            self.db.executemany("INSERT OR IGNORE INTO seen (hash, first_seen) VALUES (?, ?)",
+                                ((h, ts) for h in hashes))
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        if self.bloom is not None:
+            for h in hashes:
+                self.bloom.add(h)
+
+    def expire(self) -> int:
+        """Delete entries older than the TTL. Returns rows removed."""
+        if self.ttl is None:
+            return 0
+        cur = self.db.execute("DELETE FROM seen WHERE first_seen < ?", (time.time() - self.ttl,))
+        return cur.rowcount
+
+    def close(self) -> None:
+        try:
+            self._save_bloom()
+        finally:
+            self.db.close()
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+
+def migrate_json(json_path: Path, store: SqliteSeenStore) -> int:
+    """Import a legacy seen_comments.json into ``store``; renames the JSON afterwards."""
+    json_path = Path(json_path)
+    if not json_path.exists():
+        return 0
+    hashes = json.loads(json_path.read_text(encoding="utf-8")) or []
+    # Unknown age: treat as seen now, so the TTL clock starts at migration.
+    store.add_many(hashes)
+    json_path.replace(json_path.with_name(json_path.name + ".migrated"))
+    logger.info(f"migrated {len(hashes)} seen hashes from {json_path}")
+    return len(hashes)
+
+
+def open_seen_store(cfg: dict, legacy_json: Optional[Path] = None) -> SeenStore:
+    """Open the store configured under ``seen_store`` (see module docstring)."""
+    sc = cfg.get("seen_store") or {}
+    backend = sc.get("backend", "sqlite")
+    legacy_json = Path(legacy_json) if legacy_json else output_dir(cfg) / "seen_comments.json"
+    if backend == "json":
+        return JsonSeenStore(legacy_json)
+    if backend != "sqlite":
+        raise ValueError(f"unknown seen_store backend: {backend}")
+    ttl_days = sc.get("ttl_days") or 0
+    store = SqliteSeenStore(
+        output_dir(cfg) / sc.get("path", "seen_comments.sqlite"),
+        ttl_seconds=ttl_days * 86400 if ttl_days else None,
+        bloom=sc.get("bloom", True),
+    )
+    migrate_json(legacy_json, store)
+    removed = store.expire()
+    if removed:
+        logger.info(f"expired {removed} seen hashes older than {ttl_days} day(s)")
+    return store
@@ -1,62 +1,319 @@
-from flask import Flask, render_template_string, send_file, redirect, url_for
-import glob, json, os, shutil, pathlib
-from common import queue_dir, published_dir, get_logger
+from flask import Flask, Response, render_template, redirect, url_for, request, jsonify
+import os, re, hashlib, threading
+from pathlib import Path
+from datetime import datetime, timezone
+from common import get_config, get_logger
+from queue_db import QueueDB
+from moderation_index import ModerationIndex, Query
+from publish import Janitor, approve_many
 
 app = Flask(__name__)
-QUEUE_DIR = str(queue_dir())
-PUBLISHED = str(published_dir())
 log = get_logger("server").info
+_index = _janitor = None
+_lazy_lock = threading.Lock()
 
-INDEX_TMPL = """<!doctype html><html><body>
+INDEX_TMPL = """<!doctype html><html><head><meta charset="utf-8"><title>Moderation Queue</title>
+<style>
+  li { margin-bottom: 1.5em; }
+  button.play { padding: 0; border: 0; background: #111; color: #eee; width: 240px; min-height: 135px; cursor: pointer; }
+  button.play img { display: block; width: 240px; }
+</style></head><body>
 <h2>Moderation Queue</h2>
+<form method="get" action="/">
+  <select name="status">
+    {% for s in facets.status + ["all"] %}<option {{ "selected" if s == (q.status or "all") }}>{{s}}</option>{% endfor %}
+  </select>
+  <select name="tone"><option value="">any tone</option>
+    {% for t in facets.tone %}<option {{ "selected" if t == q.tone }}>{{t}}</option>{% endfor %}
+  </select>
+  <select name="pattern"><option value="">any pattern</option>
+    {% for p in facets.pattern %}<option {{ "selected" if p == q.pattern }}>{{p}}</option>{% endfor %}
+  </select>
+  from <input type="date" name="since" value="{{q.since or ''}}">
+  to <input type="date" name="until" value="{{q.until or ''}}">
+  <button type="submit">Filter</button>
+</form>
+<p>{{page.total}} item(s){% if page.pages > 1 %}, page {{page.page}} of {{page.pages}}{% endif %}</p>
+<form id="bulk" method="post" action="/approve">
+  <input type="hidden" name="next" value="{{ request.full_path }}">
+  {% if q.status == "rendered" and page.items %}<button type="submit">Approve selected</button>{% endif %}
+</form>
 <ul>
-{% for item in items %}
+{% for item in page.items %}
   <li>
-    <b>{{item.id}}</b> - {{item.comment}} <br/>
-    <video width=480 controls src="/video/{{item.id}}"></video><br/>
+    {% if item.status == "rendered" %}<input type="checkbox" name="id" value="{{item.id}}" form="bulk">{% endif %}
+    <b>{{item.id}}</b> [{{item.status}}{% if item.tone %}, {{item.tone}}{% endif %}{% if item.pattern %}, {{item.pattern}}{% endif %}, {{item.date}}]<br/>
+    {{item.comment}}<br/><i>{{item.reply}}</i><br/>
+    {# Nothing is fetched until the poster scrolls into view; the video only on click. #}
+    <button class="play" data-src="/video/{{item.id}}?rendition=preview&v={{item.stamp}}" title="Play">
+      {% if item.rendition("poster") %}<img loading="lazy" src="/video/{{item.id}}?rendition=poster&v={{item.stamp}}" alt="play">{% else %}&#9654; play{% endif %}
+    </button><br/>
+    {% if item.status == "rendered" %}
     <form method="post" action="/approve/{{item.id}}">
+      <input type="hidden" name="next" value="{{ request.full_path }}">
       <button type="submit">Approve & Publish</button>
     </form>
+    {% endif %}
   </li>
 {% endfor %}
 </ul>
+<p>
+  {% if page.page > 1 %}<a href="{{ url_for('index', **q.args(page=page.page - 1)) }}">&laquo; prev</a>{% endif %}
+  {% if page.page < page.pages %}<a href="{{ url_for('index', **q.args(page=page.page + 1)) }}">next &raquo;</a>{% endif %}
+</p>
+<script>
+document.addEventListener("click", ev => {
+  const b = ev.target.closest("button.play");
+  if (!b) return;
+  const v = document.createElement("video");
+  Object.assign(v, {src: b.dataset.src, controls: true, autoplay: true, width: 480});
+  b.replaceWith(v);
+});
+</script>
 </body></html>
 """
+INDEX_PAGE = app.jinja_env.from_string(INDEX_TMPL)  # compiled once, not per request
 
-def load_items():
-    items=[]
-    for path in glob.glob(f"{QUEUE_DIR}/*.meta.json"):
-        with open(path, encoding='utf-8') as f:
-            m = json.load(f)
-        id = pathlib.Path(path).stem
-        with open(f"{QUEUE_DIR}/{id}.json", encoding='utf-8') as f:
-            q = json.load(f)
-        items.append({"id": id, "meta": m, "comment": q['comment'], "video": m['video']})
-    return items
+def moderation_index():
+    """The in-memory index of listed items, built on first use (importing server reads no config)."""
+    global _index
+    with _lazy_lock:
+        if _index is None:
+            _index = ModerationIndex.open()
+        return _index
+
+def janitor():
+    """Deletes frames/WAV/... of published items in the background; created on first use."""
+    global _janitor
+    with _lazy_lock:
+        if _janitor is None:
+            _janitor = Janitor()
+        return _janitor
+
+def dirs():
+    """(queue dir, published dir) from the cached config (follows config.yaml edits)."""
+    cfg = get_config()
+    return str(cfg.queue_dir), str(cfg.published_dir)
+
+def queue_db():
+    # One connection per call: Flask may serve requests from several threads. No sync()
+    # here: importing new queue files is the moderation index's periodic rescan.
+    return QueueDB.open(sync=False)
+
+def conditional(version, key, build):
+    """Response from ``build()`` with ETag/Last-Modified for the index version, or a bodiless 304.
+
+    ``key`` is whatever else the body depends on (path, query): a client
+    revalidating an unchanged listing costs one queue DB query, no rendering.
+    """
+    etag = hashlib.sha1(repr((version, key)).encode()).hexdigest()[:20]
+    last_modified = datetime.fromtimestamp(int(version[1]), timezone.utc)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = request.if_modified_since is not None and last_modified <= request.if_modified_since
+    resp = Response(status=304) if fresh else build()
+    resp.set_etag(etag)
+    resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = "no-cache"  # always revalidate: approvals change the listing
+    return resp
+
+def bad_request(e):
+    return jsonify({"error": str(e)}), 400
+
+def item_json(e):
+    d = e.to_dict()
+    d["media"] = {name: url_for("video", id=e.id, rendition=name, v=e.stamp) for name in d["renditions"]}
+    return d
 
 @app.route("/")
 def index():
-    items = load_items()
-    return render_template_string(INDEX_TMPL, items=items)
+    try:
+        q = Query.from_args(request.args)
+    except ValueError as e:
+        return str(e), 400
+    idx = moderation_index()
+    version = idx.refresh()
+    return conditional(version, (request.path, q), lambda: Response(render_template(
+        INDEX_PAGE, page=idx.query(q), q=q, facets=idx.facets())))
+
+@app.route("/api/items")
+def api_items():
+    try:
+        q = Query.from_args(request.args)
+    except ValueError as e:
+        return bad_request(e)
+    idx = moderation_index()
+    version = idx.refresh()
+
+    def build():
+        page = idx.query(q)
+        return jsonify({"items": [item_json(e) for e in page.items], "total": page.total, "page": page.page,
+                        "pages": page.pages, "per_page": page.per_page, "facets": idx.facets()})
+    return conditional(version, (request.path, q), build)
+
+@app.route("/api/items/<id>")
+def api_item(id):
+    idx = moderation_index()
+    version = idx.refresh()
+    e = idx.get(id)
+    if e is None:
+        return jsonify({"error": "not found"}), 404
+    return conditional(version, (request.path, id), lambda: jsonify(item_json(e)))
+
+MEDIA_TYPES = {".mp4": "video/mp4", ".jpg": "image/jpeg"}
+MEDIA_BLOCK = 256 * 1024
+MEDIA_CHECK_SECONDS = 2.0  # media requests trust an index check this recent (players send bursts of ranges)
+IMMUTABLE = "private, max-age=31536000, immutable"
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+def parse_range(header, size):
+    """(start, end) of a single "bytes=" range, end inclusive; None = send the whole file.
+
+    Raises ValueError when the range can't be satisfied. Multi-range
+    requests get the whole file, which HTTP allows.
+    """
+    m = RANGE.match((header or "").replace(" ", ""))
+    if not m or not (m[1] or m[2]):
+        return None
+    if not m[1]:  # suffix: the last N bytes
+        n = int(m[2])
+        if n == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - n), size - 1
+    start, end = int(m[1]), int(m[2]) if m[2] else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+def file_body(f, length):
+    """The server's file wrapper when it has one (sendfile under gunicorn; waitress streams it
+    from its own thread), else a bounded read loop. The file is already at the range start."""
+    wrapper = request.environ.get("wsgi.file_wrapper")
+    if wrapper is not None:
+        return wrapper(f, MEDIA_BLOCK)
+
+    def chunks():
+        with f:
+            left = length
+            while left > 0 and (block := f.read(min(MEDIA_BLOCK, left))):
+                left -= len(block)
+                yield block
+    return chunks()
+
+def send_media(path, immutable):
+    """A media file with Range/206, ETag/Last-Modified and cache headers.
+
+    ``immutable``: the URL carries the item's current stamp, so the browser
+    may keep the file for good (a re-render changes the stamp, hence the URL).
+    """
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return "not found", 404
+    st = os.fstat(f.fileno())
+    etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    if request.if_none_match.contains(etag):
+        f.close()
+        resp = Response(status=304)
+        rng = None
+    else:
+        if_range = request.headers.get("If-Range")
+        try:
+            rng = parse_range(request.headers.get("Range"), st.st_size) \
+                if not if_range or if_range.strip('"') == etag else None
+        except ValueError:
+            f.close()
+            resp = Response(status=416)
+            resp.headers["Content-Range"] = f"bytes */{st.st_size}"
+            return resp
+        start, end = rng or (0, st.st_size - 1)
+        f.seek(start)
+        resp = Response(file_body(f, end - start + 1), status=206 if rng else 200, direct_passthrough=True,
+                        mimetype=MEDIA_TYPES.get(os.path.splitext(path)[1], "application/octet-stream"))
+        resp.content_length = end - start + 1
+        if rng:
+            resp.headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    resp.headers["Accept-Ranges"] = "bytes"
+    resp.set_etag(etag)
+    resp.last_modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+    resp.headers["Cache-Control"] = IMMUTABLE if immutable else "no-cache"
+    return resp
 
 @app.route("/video/<id>")
 def video(id):
-    meta = f"{QUEUE_DIR}/{id}.meta.json"
-    if not os.path.exists(meta):
+    idx = moderation_index()
+    idx.refresh(max_age=MEDIA_CHECK_SECONDS)
+    e = idx.get(id)
+    if e is None:  # maybe newer than the last check
+        idx.refresh()
+        e = idx.get(id)
+    path = e and e.rendition(request.args.get("rendition", "master"))
+    if not path:
         return "not found", 404
-    with open(meta, encoding='utf-8') as f:
-        m = json.load(f)
-    return send_file(m['video'])
+    return send_media(path, immutable=request.args.get("v") == e.stamp)
+
+def redirect_back():
+    back = request.form.get("next") or ""
+    return redirect(back if back.startswith("/") and not back.startswith("//") else url_for('index'))
+
+def approve_ids(ids):
+    """Publish each id (see publish.py); {id: outcome}. Safe to repeat and to run concurrently."""
+    _, published = dirs()
+    with queue_db() as qdb:
+        results = approve_many(qdb, ids, Path(published), janitor=janitor())
+    for id, outcome in results.items():
+        if outcome != "published":
+            log(f"approve {id}: {outcome}")
+    return results
 
 @app.route("/approve/<id>", methods=["POST"])
 def approve(id):
-    src = f"{QUEUE_DIR}/{id}"
-    dst = f"{PUBLISHED}/{id}"
-    os.makedirs(PUBLISHED, exist_ok=True)
-    if os.path.exists(dst):
-        shutil.rmtree(dst)
-    shutil.copytree(src, dst)
-    return redirect(url_for('index'))
+    approve_ids([id])
+    return redirect_back()
+
+@app.route("/approve", methods=["POST"])
+def approve_bulk():
+    approve_ids(request.form.getlist("id"))
+    return redirect_back()
+
+@app.route("/api/approve", methods=["POST"])
+def api_approve():
+    """Body {"ids": [...]} (or form fields id=...); answers {"results": {id: outcome}}."""
+    body = request.get_json(silent=True) or {}
+    ids = body.get("ids") if isinstance(body, dict) else None
+    ids = ids if ids is not None else request.form.getlist("id")
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        return bad_request("ids must be a list of item ids")
+    return jsonify({"results": approve_ids(ids)})
+
+def serve(host="127.0.0.1", port=5004, threads=8):
+    """Production mode: waitress when installed, else werkzeug's threaded server without debug/reloader.
+
+    For several processes, run it under gunicorn instead (``gunicorn -w 4 -b :5004 server:app``);
+    video ranges then go out with sendfile.
+    """
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        log(f"waitress not installed; using the threaded werkzeug server on {host}:{port}")
+        app.run(host=host, port=port, threaded=True, debug=False, use_reloader=False)
+    else:
+        log(f"serving on {host}:{port} with waitress ({threads} threads)")
+        waitress_serve(app, host=host, port=port, threads=threads)
 
 if __name__ == "__main__":
-    app.run(port=5004, debug=True)
+    import argparse
+    sc = (get_config().get("moderation") or {}).get("server") or {}
+    ap = argparse.ArgumentParser(description="Moderation UI.")
+    ap.add_argument("--prod", action="store_true", help="Production server (waitress / threaded), no debugger")
+    ap.add_argument("--host", default=sc.get("host", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(sc.get("port", 5004)))
+    ap.add_argument("--threads", type=int, default=int(sc.get("threads", 8)), help="Worker threads (--prod)")
+    args = ap.parse_args()
+    janitor().sweep()
+    moderation_index().refresh(force_sync=True)  # import queue files once up front; later ones come with the rescan
+    if args.prod:
+        serve(args.host, args.port, args.threads)
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
@@ -1,33 +1,252 @@
 # synth_audio.py
-import pyttsx3, os
+"""
+Reply TTS with a persistent engine and an on-disk WAV cache.
+
+- TTSWorker keeps one pyttsx3 engine per process (init and voice lookup
+  happen once) and can synthesize a batch of texts in a single runAndWait.
+- TTSCache stores WAVs content-addressed by (text, voice, rate), plus the
+  mouth envelopes computed from them, under output/tts_cache/. Entries are
+  evicted least-recently-used once the cache grows past tts.cache_max_mb.
+
+synth_to_wav() is cache-first: a reply that was spoken before (the fallback
+bank repeats a lot) is linked into place without touching the engine.
+
+  python synth_audio.py             # sample WAV
+  python synth_audio.py --warm      # pre-synthesize the generate_reply fallback bank
+"""
+import os, json, shutil, hashlib, threading
 from pathlib import Path
 
-def synth_to_wav(text, out_path, rate=180, voice_name=None):
+from common import load_config, output_dir, get_logger
+
+logger = get_logger("tts")
+
+DEFAULT_RATE = 180
+
+
+class TTSWorker:
+    """One pyttsx3 engine for the life of the process."""
+
+    def __init__(self, rate=DEFAULT_RATE, voice_name=None):
+        self.rate = rate
+        self.voice_name = voice_name
+        self._engine = None
+        self._lock = threading.Lock()
+
+    def _get_engine(self):
+        if self._engine is None:
+            import pyttsx3  # only when something actually has to be spoken; cache hits never load it
+            engine = pyttsx3.init()
+            engine.setProperty('rate', self.rate)
+            if self.voice_name:
+                for v in engine.getProperty('voices'):
+                    if self.voice_name.lower() in v.name.lower():
+                        engine.setProperty('voice', v.id)
+                        break
+            self._engine = engine
+        return self._engine
+
+    def synth_batch(self, jobs):
+        """jobs: [(text, out_path)]. Queues every file and runs the event loop once."""
+        jobs = [(text, Path(p)) for text, p in jobs]
+        with self._lock:
+            engine = self._get_engine()
+            try:
+                for text, p in jobs:
+                    p.parent.mkdir(parents=True, exist_ok=True)
+                    engine.save_to_file(text, str(p) + ".tmp.wav")
+                engine.runAndWait()
+            except Exception:
+                # Don't let one bad batch leave a half-run engine behind for the next one.
+                self._engine = None
+                raise
+        done = []
+        for _, p in jobs:
+            tmp = str(p) + ".tmp.wav"
+            if os.path.exists(tmp) and os.path.getsize(tmp) > 0:
+                os.replace(tmp, str(p))
+                done.append(p)
+        return done
+
+
+class TTSCache:
+    """Content-addressed WAVs (<key>.wav) and envelopes (<key>.<params>.env.json), LRU by mtime."""
+
+    def __init__(self, root, max_bytes=500 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(text, voice_name, rate):
+        raw = json.dumps([text, voice_name or "", int(rate)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def wav_path(self, key):
+        return self.root / f"{key}.wav"
+
+    def _touch(self, p):
+        try:
+            os.utime(p)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get_wav(self, key):
+        p = self.wav_path(key)
+        return p if p.exists() and p.stat().st_size > 0 and self._touch(p) else None
+
+    def envelope(self, key, params, compute):
+        """Cached compute() result for this WAV and envelope params (fps, frames, floor...)."""
+        tag = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        p = self.root / f"{key}.{tag}.env.json"
+        if p.exists() and self._touch(p):
+            try:
+                return json.loads(p.read_text(encoding="utf-8"))
+            except ValueError:
+                pass
+        amps = compute()
+        tmp = p.with_name(p.name + ".tmp")
+        tmp.write_text(json.dumps(amps), encoding="utf-8")
+        os.replace(tmp, p)
+        self.evict()
+        return amps
+
+    def evict(self):
+        """Drop least-recently-used entries (a WAV and its envelopes) until under max_bytes."""
+        groups = {}
+        for p in self.root.iterdir():
+            if p.name.endswith(".tmp") or p.name.endswith(".tmp.wav"):
+                continue
+            try:
+                st = p.stat()
+            except FileNotFoundError:  # another render worker evicted it meanwhile
+                continue
+            size, used, files = groups.get(p.name.split(".", 1)[0], (0, 0.0, []))
+            groups[p.name.split(".", 1)[0]] = (size + st.st_size, max(used, st.st_mtime), files + [p])
+        total = sum(g[0] for g in groups.values())
+        removed = 0
+        for key, (size, _, files) in sorted(groups.items(), key=lambda kv: kv[1][1]):
+            if total <= self.max_bytes:
+                break
+            for p in files:
+                try:
+                    p.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"evicted {removed} cached voice clip(s)")
+        return removed
+
+
+_worker = None
+_cache = None
+
+
+def tts_settings(cfg=None):
+    tc = (cfg or load_config()).get("tts") or {}
+    return int(tc.get("rate", DEFAULT_RATE)), tc.get("voice") or None
+
+
+def tts_worker(rate=DEFAULT_RATE, voice_name=None):
+    global _worker
+    if _worker is None or (_worker.rate, _worker.voice_name) != (rate, voice_name):
+        _worker = TTSWorker(rate, voice_name)
+    return _worker
+
+
+def tts_cache(cfg=None):
+    """Process-wide cache from config (tts.cache / cache_dir / cache_max_mb); None when disabled."""
+    global _cache
+    if _cache is None:
+        cfg = cfg or load_config()
+        tc = cfg.get("tts") or {}
+        if not tc.get("cache", True):
+            return None
+        _cache = TTSCache(output_dir(cfg) / tc.get("cache_dir", "tts_cache"),
+                          max_bytes=int(float(tc.get("cache_max_mb", 500)) * 1024 * 1024))
+    return _cache
+
+
+def _place(src, out_path):
+    """Put the cached WAV at out_path: hardlink when possible, else copy."""
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp.wav")
+    try:
+        if tmp.exists():
+            tmp.unlink()
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, out_path)
+
+
+def synth_to_wav(text, out_path, rate=None, voice_name=None):
     """
     Generate a WAV file via pyttsx3 only (no pydub/ffmpeg dependency).
+    Served from the TTS cache when the same (text, voice, rate) was spoken before.
     """
     out_path = Path(out_path)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if rate is None:
+        rate, cfg_voice = tts_settings()
+        voice_name = voice_name or cfg_voice
+    cache = tts_cache()
+    if cache is None:
+        tts_worker(rate, voice_name).synth_batch([(text, out_path)])
+        return out_path
 
-    engine = pyttsx3.init()
-    engine.setProperty('rate', rate)
-    if voice_name:
-        voices = engine.getProperty('voices')
-        for v in voices:
-            if voice_name.lower() in v.name.lower():
-                engine.setProperty('voice', v.id)
-                break
+    key = cache.key(text, voice_name, rate)
+    cached = cache.get_wav(key)
+    if cached is None:
+        done = tts_worker(rate, voice_name).synth_batch([(text, cache.wav_path(key))])
+        if not done:
+            return out_path  # caller checks for the missing WAV
+        cache.evict()
+        cached = cache.wav_path(key)
+    else:
+        logger.info(f"TTS cache hit {key[:12]}")
+    _place(cached, out_path)
+    return out_path
 
-    tmp = str(out_path) + ".tmp.wav"
-    engine.save_to_file(text, tmp)
-    engine.runAndWait()
 
-    # Move temp wav to final path
-    if os.path.exists(tmp):
-        os.replace(tmp, str(out_path))
-    return out_path
+def cached_envelope(text, params, compute, rate=None, voice_name=None):
+    """compute() (the mouth envelope of text's WAV) memoized next to the cached WAV."""
+    if rate is None:
+        rate, cfg_voice = tts_settings()
+        voice_name = voice_name or cfg_voice
+    cache = tts_cache()
+    if cache is None or cache.get_wav(cache.key(text, voice_name, rate)) is None:
+        return compute()
+    return cache.envelope(cache.key(text, voice_name, rate), params, compute)
+
+
+def warm(texts, rate=None, voice_name=None):
+    """Synthesize every uncached text in one engine batch. Returns how many were new."""
+    if rate is None:
+        rate, cfg_voice = tts_settings()
+        voice_name = voice_name or cfg_voice
+    cache = tts_cache()
+    if cache is None:
+        return 0
+    todo = {}
+    for t in texts:
+        k = cache.key(t, voice_name, rate)
+        if cache.get_wav(k) is None:
+            todo[k] = t
+    done = tts_worker(rate, voice_name).synth_batch([(t, cache.wav_path(k)) for k, t in todo.items()]) if todo else []
+    cache.evict()
+    return len(done)
+
 
 if __name__ == "__main__":
-    p = Path("output/sample.wav")
-    synth_to_wav("Hello from the robot.", p)
-    print("Saved", p)
+    import sys
+    if "--warm" in sys.argv:
+        from generate_reply import FALLBACKS
+        texts = [t for bank in FALLBACKS.values() for t in bank]
+        print(f"Synthesized {warm(texts)} new of {len(texts)} fallback replies")
+    else:
+        p = Path("output/sample.wav")
+        synth_to_wav("Hello from the robot.", p)
+        print("Saved", p)
@@ -0,0 +1,5 @@
+# The modules are flat scripts in the repo root; make them importable from tests/.
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
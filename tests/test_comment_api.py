@@ -0,0 +1,86 @@
+"""Network ingestion against the bundled stand-in server (no browser, no network)."""
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+import comment_api
+from comment_api import COMMENT_LIST_PATH, CommentAPIError
+
+
+@pytest.fixture
+def base_url():
+    server = comment_api.serve_fixtures(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def first_page(base_url, cursor=0):
+    return f"{base_url}{COMMENT_LIST_PATH}?aweme_id=1&cursor={cursor}&count=20"
+
+
+class FakeDriver:
+    """Just enough of a Chrome driver for fetch_comments_via_network: the page
+    requests the first comment page when loaded, and in-page fetches go over HTTP."""
+
+    def __init__(self, api_url):
+        self.api_url = api_url
+        self._log = []
+
+    def get(self, url):
+        self._log.append({"message": json.dumps({"message": {
+            "method": "Network.responseReceived",
+            "params": {"requestId": "1", "response": {"url": self.api_url}}}})})
+
+    def get_log(self, kind):
+        assert kind == "performance"
+        out, self._log = self._log, []
+        return out
+
+    def execute_script(self, script, *args):
+        return None
+
+    def execute_cdp_cmd(self, cmd, params):
+        return {"body": self._http(self.api_url)}
+
+    def execute_async_script(self, script, url):
+        return self._http(url)
+
+    @staticmethod
+    def _http(url):
+        try:
+            with urlopen(url, timeout=5) as r:
+                return r.read().decode("utf-8")
+        except HTTPError as e:
+            return e.read().decode("utf-8")
+
+
+def test_follows_cursor_over_http(base_url):
+    pages = list(comment_api.iter_comment_pages(comment_api.http_fetch_json, first_page(base_url)))
+    assert [len(p) for p in pages] == [3, 2]
+    ids = [r["comment_id"] for p in pages for r in p]
+    assert ids == [f"753300000000000000{i}" for i in range(1, 6)]
+    assert all(r["text"] and r["author"] and r["time"] for p in pages for r in p)
+
+
+def test_error_status_raises(base_url):
+    with pytest.raises(CommentAPIError) as e:
+        comment_api.parse_comment_page({"status_code": 10201, "status_msg": "rate limited"})
+    assert e.value.status_code == 10201
+    # The stand-in server answers an unknown cursor with {"status_code": 404}.
+    with pytest.raises(CommentAPIError):
+        list(comment_api.iter_comment_pages(comment_api.http_fetch_json, first_page(base_url, cursor=7)))
+
+
+def test_fetch_comments_via_network(base_url):
+    stats = {}
+    comments = comment_api.fetch_comments_via_network(FakeDriver(first_page(base_url)), f"{base_url}/video/1",
+                                                      stats=stats, wait_seconds=2)
+    assert len(comments) == 5  # two of them share a text but have distinct comment ids
+    assert len({c["comment_id"] for c in comments}) == 5
+    assert all(c["scraped_at"] for c in comments)
+    assert stats["rounds"] == 2 and stats["stop_reason"] == "network"
@@ -0,0 +1,259 @@
+# video_encode.py
+"""
+Streaming ffmpeg encoder: frames go to a long-lived ffmpeg over stdin while
+they are being produced, and the audio is muxed in the same invocation. No
+frame files touch the disk.
+
+    with FrameStreamEncoder(mp4, wav, fps=12, input_format="image2pipe") as enc:
+        for png_bytes in frames:
+            enc.write(png_bytes)
+
+Input formats:
+- "image2pipe": encoded images (PNG/JPEG bytes, e.g. Page.captureScreenshot)
+- "rawvideo":   raw rgb24 bytes of ``size`` (e.g. Pillow's Image.tobytes())
+
+Frames pass through a bounded in-memory buffer drained by a writer thread,
+so capture and encoding overlap but a slow encoder applies backpressure
+instead of growing memory. The MP4 is written to a temporary name and only
+moved into place on success; on any failure ffmpeg is killed and the
+partial file removed.
+
+Renditions: one ffmpeg run can write several outputs (master MP4, a small
+preview, a JPEG poster, a vertical 1080x1920 cut...). The decoded frames are
+split in a filtergraph and each branch is scaled and encoded with its own
+preset/CRF, so frames and audio are decoded once however many outputs there
+are. The master is the given out_path; the others sit next to it as
+<stem>.<name>.mp4 / .jpg.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import subprocess
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from common import ffmpeg_bin, get_logger
+
+logger = get_logger("encode")
+
+_DONE = object()
+
+MASTER = "master"
+
+
+@dataclass(frozen=True)
+class Rendition:
+    """One output of an encode: an MP4 at some size/quality, or a JPEG still."""
+    name: str
+    kind: str = "video"            # video | image
+    width: Optional[int] = None    # neither: source size; one: scale keeping aspect; both: fit and pad
+    height: Optional[int] = None
+    preset: Optional[str] = None   # x264 preset (ultrafast .. veryslow)
+    crf: Optional[int] = None
+    maxrate: Optional[str] = None  # e.g. "600k": bitrate cap on top of the CRF
+    audio_bitrate: Optional[str] = None
+    at_seconds: float = 1.0        # image: which frame
+    quality: int = 3               # image: JPEG -q:v, 2 (best) .. 31
+    pad_color: str = "black"
+
+    @classmethod
+    def from_config(cls, name: str, rc: dict | None) -> "Rendition":
+        known = {k: v for k, v in (rc or {}).items() if k in cls.__dataclass_fields__ and k != "name"}
+        r = cls(name=name, **known)
+        if r.kind not in ("video", "image"):
+            raise ValueError(f"rendition {name}: unknown kind {r.kind!r} (video | image)")
+        if name == MASTER and r.kind != "video":
+            raise ValueError("the master rendition must be a video")
+        return r
+
+    def path_for(self, master: Path) -> Path:
+        if self.name == MASTER:
+            return Path(master)
+        ext = ".jpg" if self.kind == "image" else ".mp4"
+        return Path(master).with_name(f"{Path(master).stem}.{self.name}{ext}")
+
+    def filter(self, fps: int, last_frame: int) -> str:
+        f = []
+        if self.kind == "image":
+            f.append(f"select=eq(n\\,{max(0, min(round(self.at_seconds * fps), last_frame))})")
+        w, h = self.width, self.height
+        if w and h:
+            f.append(f"scale={w}:{h}:force_original_aspect_ratio=decrease")
+            f.append(f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2:color={self.pad_color}")
+        elif w or h:
+            f.append(f"scale={w or -2}:{h or -2}")
+        return ",".join(f) or "null"
+
+    def output_args(self, video_args: list[str]) -> list[str]:
+        if self.kind == "image":
+            return ["-frames:v", "1", "-c:v", "mjpeg", "-q:v", str(self.quality), "-update", "1", "-f", "image2"]
+        args = list(video_args)
+        if self.preset:
+            args += ["-preset", str(self.preset)]
+        if self.crf is not None:
+            args += ["-crf", str(self.crf)]
+        if self.maxrate:
+            args += ["-maxrate", str(self.maxrate), "-bufsize", str(self.maxrate)]
+        return args
+
+
+def renditions_from_config(rc: dict | None) -> list[Rendition]:
+    """Rendition profiles from ``render.renditions`` ({name: settings}); the master always comes first."""
+    out = [Rendition.from_config(name, opts) for name, opts in (rc or {}).items()]
+    if not any(r.name == MASTER for r in out):
+        out.append(Rendition(MASTER))
+    return sorted(out, key=lambda r: r.name != MASTER)
+
+
+def rendition_args(renditions: list[Rendition], outputs: dict[str, Path], video_args: list[str], fps: int,
+                   frame_count: int, audio_input: Optional[int] = None,
+                   rate_args: Optional[list[str]] = None) -> list[str]:
+    """ffmpeg arguments encoding input 0's video into every rendition in one pass.
+
+    ``outputs`` maps rendition name -> file to write; ``audio_input`` is the
+    index of the audio input muxed into the video renditions.
+    """
+    n = len(renditions)
+    graph = [f"[0:v]split={n}" + "".join(f"[s{i}]" for i in range(n))]
+    graph += [f"[s{i}]{r.filter(fps, frame_count - 1)}[r{i}]" for i, r in enumerate(renditions)]
+    args = ["-filter_complex", ";".join(graph)]
+    for i, r in enumerate(renditions):
+        args += ["-map", f"[r{i}]", *r.output_args(video_args)]
+        if r.kind == "video":
+            args += rate_args or []
+            if audio_input is not None:
+                args += ["-map", f"{audio_input}:a", "-c:a", "aac"]
+                args += ["-b:a", str(r.audio_bitrate)] if r.audio_bitrate else []
+                args += ["-shortest"]
+            args += ["-movflags", "+faststart", "-f", "mp4"]
+        args.append(str(outputs[r.name]))
+    return args
+
+
+class FrameStreamEncoder:
+    def __init__(
+        self,
+        out_path: Path,
+        audio_path: Optional[Path],
+        fps: int,
+        input_format: str = "image2pipe",
+        size: Optional[tuple[int, int]] = None,
+        image_codec: str = "png",
+        buffer_frames: int = 24,
+        video_args: Optional[list[str]] = None,
+        renditions: Optional[list[Rendition]] = None,
+        frame_count: int = 0,
+    ):
+        if input_format == "rawvideo" and not size:
+            raise ValueError("rawvideo input needs size=(width, height)")
+        self.out_path = Path(out_path)
+        self.renditions = renditions or [Rendition(MASTER)]
+        self.outputs = {r.name: r.path_for(self.out_path) for r in self.renditions}
+        self.frame_count = frame_count
+        self.audio_path = Path(audio_path) if audio_path else None
+        self.fps = fps
+        self.input_format = input_format
+        self.size = size
+        self.image_codec = image_codec
+        self.video_args = video_args or ["-c:v", "libx264", "-pix_fmt", "yuv420p"]
+        self._buf: queue.Queue = queue.Queue(maxsize=max(1, buffer_frames))
+        self._proc: Optional[subprocess.Popen] = None
+        self._writer: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self.frames = 0
+
+    def command(self) -> list[str]:
+        if self.input_format == "rawvideo":
+            w, h = self.size
+            inp = ["-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{w}x{h}", "-framerate", str(self.fps)]
+        else:
+            inp = ["-f", "image2pipe", "-c:v", self.image_codec, "-framerate", str(self.fps)]
+        cmd = [ffmpeg_bin(), "-y", "-loglevel", "error", *inp, "-i", "-"]
+        if self.audio_path:
+            cmd += ["-i", str(self.audio_path)]
+        tmp = {name: _part(p) for name, p in self.outputs.items()}
+        return cmd + rendition_args(self.renditions, tmp, self.video_args, self.fps,
+                                    self.frame_count or 1, audio_input=1 if self.audio_path else None)
+
+    # ----- lifecycle -----
+    def __enter__(self) -> "FrameStreamEncoder":
+        self.out_path.parent.mkdir(parents=True, exist_ok=True)
+        cmd = self.command()
+        logger.info("Streaming to ffmpeg: " + " ".join(cmd))
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._writer = threading.Thread(target=self._drain, name="ffmpeg-writer", daemon=True)
+        self._writer.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+        else:
+            self.abort()
+        return False
+
+    def _drain(self) -> None:
+        stdin = self._proc.stdin
+        while True:
+            item = self._buf.get()
+            if item is _DONE:
+                break
+            if self._error is not None:
+                continue  # keep draining so producers never block forever
+            try:
+                stdin.write(item)
+            except (BrokenPipeError, OSError) as e:
+                self._error = e
+        try:
+            stdin.close()
+        except OSError:
+            pass
+
+    def write(self, frame: bytes) -> None:
+        """Queue one frame; blocks while the buffer is full."""
+        if self._error is not None:
+            rc = self._proc.wait()
+            if rc == 0:
+                return  # ffmpeg is done (-shortest hit the end of the audio); drop the rest
+            raise RuntimeError(f"ffmpeg stopped accepting frames (exit {rc}): {self._error}")
+        self._buf.put(frame)
+        self.frames += 1
+
+    def finish(self) -> Path:
+        self._buf.put(_DONE)
+        self._writer.join()
+        err = self._proc.stderr.read().decode("utf-8", "replace")
+        rc = self._proc.wait()
+        if rc != 0:
+            self._cleanup()
+            raise subprocess.CalledProcessError(rc, self.command(), stderr=err)
+        for p in self.outputs.values():
+            os.replace(_part(p), p)
+        return self.out_path
+
+    def abort(self) -> None:
+        """Stop ffmpeg and remove the partial output (capture failed midway)."""
+        if self._proc and self._proc.poll() is None:
+            self._proc.kill()
+        if self._writer:
+            self._buf.put(_DONE)
+            self._writer.join(timeout=5)
+        if self._proc:
+            self._proc.wait()
+            if self._proc.stderr:
+                self._proc.stderr.close()
+        self._cleanup()
+
+    def _cleanup(self) -> None:
+        for p in self.outputs.values():
+            try:
+                _part(p).unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _part(p: Path) -> Path:
+    return p.with_name(p.name + ".part")